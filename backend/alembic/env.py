@@ -13,6 +13,8 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
 # Thêm thư mục cha vào path để import module app
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Thư mục alembic/ để các migration import helper dùng chung (index_utils)
+sys.path.insert(0, os.path.dirname(__file__))
 
 # Đối tượng cấu hình Alembic
 config = context.config
@@ -0,0 +1,19 @@
+"""Helper dùng chung cho các migration tạo index bằng CREATE INDEX CONCURRENTLY"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def drop_invalid_index(name: str) -> None:
+    """Xóa index INVALID còn sót lại từ một lần CREATE INDEX CONCURRENTLY thất bại"""
+    if op.get_context().as_sql:
+        return
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    invalid = bind.execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).scalar()
+    if invalid:
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,526 @@
+"""base_schema
+
+Schema gốc (users, roles, subjects, tasks, schedules, notifications...) trước các bảng
+cộng đồng của be27eb945d93. Trước đây các bảng này do create_all tạo nên chuỗi migration
+không dựng được DB trống. DB cũ đã có bảng nhưng chưa có alembic_version thì stamp
+be27eb945d93 thay vì chạy revision này (scripts/migrate.py tự làm việc đó).
+Index ix_task_groups_id và bảng channel_join_requests (khóa ngoại tới subject_channels)
+do be27eb945d93 tạo nên không có ở đây.
+
+Revision ID: a0b1c2d3e4f5
+Revises: 
+Create Date: 2026-04-09 21:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'a0b1c2d3e4f5'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ### Lệnh được tạo tự động bởi Alembic ###
+    op.create_table('achievements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('achievement_name', sa.String(length=100), nullable=False),
+    sa.Column('achievement_description', sa.Text(), nullable=True),
+    sa.Column('badge_icon', sa.String(length=255), nullable=True),
+    sa.Column('badge_color', sa.String(length=7), nullable=True),
+    sa.Column('achievement_type', sa.String(length=50), nullable=True),
+    sa.Column('achievement_category', sa.String(length=20), nullable=True),
+    sa.Column('requirement_value', sa.Integer(), nullable=True),
+    sa.Column('requirement_description', sa.Text(), nullable=True),
+    sa.Column('points', sa.Integer(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('achievement_name')
+    )
+    op.create_index(op.f('ix_achievements_id'), 'achievements', ['id'], unique=False)
+    op.create_table('roles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('role_name', sa.String(length=50), nullable=False),
+    sa.Column('role_description', sa.Text(), nullable=True),
+    sa.Column('role_level', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('role_name')
+    )
+    op.create_index(op.f('ix_roles_id'), 'roles', ['id'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('email', sa.String(length=100), nullable=False),
+    sa.Column('password_hash', sa.String(length=255), nullable=False),
+    sa.Column('full_name', sa.String(length=100), nullable=True),
+    sa.Column('phone', sa.String(length=20), nullable=True),
+    sa.Column('avatar_url', sa.String(length=255), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('is_verified', sa.Boolean(), nullable=True),
+    sa.Column('otp_code', sa.String(length=6), nullable=True),
+    sa.Column('last_login', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+    op.create_table('activity_logs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('action_type', sa.String(length=50), nullable=True),
+    sa.Column('entity_type', sa.String(length=50), nullable=True),
+    sa.Column('entity_id', sa.Integer(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('ip_address', sa.String(length=45), nullable=True),
+    sa.Column('user_agent', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_activity_logs_id'), 'activity_logs', ['id'], unique=False)
+    op.create_table('ai_interactions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('interaction_type', sa.String(length=50), nullable=True),
+    sa.Column('user_query', sa.Text(), nullable=True),
+    sa.Column('ai_response', sa.Text(), nullable=True),
+    sa.Column('context_data', sa.Text(), nullable=True),
+    sa.Column('satisfaction_rating', sa.Integer(), nullable=True),
+    sa.Column('was_helpful', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ai_interactions_id'), 'ai_interactions', ['id'], unique=False)
+    op.create_table('chat_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('file_name', sa.String(length=255), nullable=True),
+    sa.Column('thread_id', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_chat_history_id'), 'chat_history', ['id'], unique=False)
+    op.create_table('feedback',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('feedback_type', sa.String(length=20), nullable=True),
+    sa.Column('subject', sa.String(length=200), nullable=True),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=True),
+    sa.Column('screenshot_url', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('admin_response', sa.Text(), nullable=True),
+    sa.Column('resolved_by', sa.Integer(), nullable=True),
+    sa.Column('resolved_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['resolved_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_feedback_id'), 'feedback', ['id'], unique=False)
+    op.create_table('notifications',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('sender_id', sa.Integer(), nullable=True),
+    sa.Column('notification_type', sa.String(length=50), nullable=True),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.Column('link_url', sa.String(length=255), nullable=True),
+    sa.Column('priority', sa.String(length=20), nullable=True),
+    sa.Column('is_read', sa.Boolean(), nullable=True),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notifications_id'), 'notifications', ['id'], unique=False)
+    op.create_table('study_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('report_date', sa.Date(), nullable=False),
+    sa.Column('report_type', sa.String(length=20), nullable=True),
+    sa.Column('total_study_time', sa.Integer(), nullable=True),
+    sa.Column('total_tasks_completed', sa.Integer(), nullable=True),
+    sa.Column('total_tasks_pending', sa.Integer(), nullable=True),
+    sa.Column('productivity_score', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('focus_score', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('consistency_score', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('improvement_percentage', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('ai_insights', sa.Text(), nullable=True),
+    sa.Column('ai_recommendations', sa.Text(), nullable=True),
+    sa.Column('student_notes', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_study_reports_id'), 'study_reports', ['id'], unique=False)
+    op.create_table('subjects',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_name', sa.String(length=100), nullable=False),
+    sa.Column('subject_code', sa.String(length=20), nullable=True),
+    sa.Column('color_code', sa.String(length=7), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('target_hours_per_week', sa.Integer(), nullable=True),
+    sa.Column('priority', sa.String(length=20), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_subjects_id'), 'subjects', ['id'], unique=False)
+    op.create_table('system_settings',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('setting_key', sa.String(length=100), nullable=False),
+    sa.Column('setting_value', sa.Text(), nullable=True),
+    sa.Column('setting_type', sa.String(length=50), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('is_public', sa.Boolean(), nullable=True),
+    sa.Column('updated_by', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['updated_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('setting_key')
+    )
+    op.create_index(op.f('ix_system_settings_id'), 'system_settings', ['id'], unique=False)
+    op.create_table('task_groups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('color', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('user_achievements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('achievement_id', sa.Integer(), nullable=True),
+    sa.Column('achieved_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('progress_data', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['achievement_id'], ['achievements.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_achievements_id'), 'user_achievements', ['id'], unique=False)
+    op.create_table('user_preferences',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('theme', sa.String(length=20), nullable=True),
+    sa.Column('language', sa.String(length=10), nullable=True),
+    sa.Column('timezone', sa.String(length=50), nullable=True),
+    sa.Column('notification_enabled', sa.Boolean(), nullable=True),
+    sa.Column('email_notification', sa.Boolean(), nullable=True),
+    sa.Column('push_notification', sa.Boolean(), nullable=True),
+    sa.Column('study_reminder_time', sa.Time(), nullable=True),
+    sa.Column('pomodoro_work_duration', sa.Integer(), nullable=True),
+    sa.Column('pomodoro_break_duration', sa.Integer(), nullable=True),
+    sa.Column('ai_assistance_level', sa.String(length=20), nullable=True),
+    sa.Column('show_ai_suggestions', sa.Boolean(), nullable=True),
+    sa.Column('auto_schedule_optimization', sa.Boolean(), nullable=True),
+    sa.Column('privacy_mode', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id')
+    )
+    op.create_index(op.f('ix_user_preferences_id'), 'user_preferences', ['id'], unique=False)
+    op.create_table('user_profiles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('school_name', sa.String(length=100), nullable=True),
+    sa.Column('grade_level', sa.String(length=20), nullable=True),
+    sa.Column('student_code', sa.String(length=50), nullable=True),
+    sa.Column('date_of_birth', sa.Date(), nullable=True),
+    sa.Column('gender', sa.String(length=20), nullable=True),
+    sa.Column('address', sa.Text(), nullable=True),
+    sa.Column('study_goal', sa.Text(), nullable=True),
+    sa.Column('daily_study_target', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id')
+    )
+    op.create_index(op.f('ix_user_profiles_id'), 'user_profiles', ['id'], unique=False)
+    op.create_table('user_roles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('role_id', sa.Integer(), nullable=True),
+    sa.Column('assigned_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('assigned_by', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['assigned_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_roles_id'), 'user_roles', ['id'], unique=False)
+    op.create_table('goals',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('goal_title', sa.String(length=200), nullable=False),
+    sa.Column('goal_description', sa.Text(), nullable=True),
+    sa.Column('goal_type', sa.String(length=20), nullable=True),
+    sa.Column('metric_type', sa.String(length=20), nullable=True),
+    sa.Column('target_value', sa.Integer(), nullable=True),
+    sa.Column('current_value', sa.Integer(), nullable=True),
+    sa.Column('unit', sa.String(length=20), nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('end_date', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('achievement_date', sa.DateTime(), nullable=True),
+    sa.Column('is_ai_suggested', sa.Boolean(), nullable=True),
+    sa.Column('ai_rationale', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_goals_id'), 'goals', ['id'], unique=False)
+    op.create_table('notes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('note_type', sa.String(length=20), nullable=True),
+    sa.Column('tags', sa.String(length=255), nullable=True),
+    sa.Column('is_favorite', sa.Boolean(), nullable=True),
+    sa.Column('attachments', sa.Text(), nullable=True),
+    sa.Column('ai_enhanced', sa.Boolean(), nullable=True),
+    sa.Column('ai_summary', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notes_id'), 'notes', ['id'], unique=False)
+    op.create_table('schedules',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.Column('custom_subject', sa.String(length=100), nullable=True),
+    sa.Column('is_recurring', sa.Boolean(), nullable=True),
+    sa.Column('recurrence_pattern', sa.String(length=50), nullable=True),
+    sa.Column('recurrence_days', sa.String(length=50), nullable=True),
+    sa.Column('recurrence_end_date', sa.Date(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_schedules_id'), 'schedules', ['id'], unique=False)
+    op.create_table('subject_statistics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('period_start_date', sa.Date(), nullable=False),
+    sa.Column('period_end_date', sa.Date(), nullable=False),
+    sa.Column('period_type', sa.String(length=20), nullable=True),
+    sa.Column('total_study_time', sa.Integer(), nullable=True),
+    sa.Column('sessions_count', sa.Integer(), nullable=True),
+    sa.Column('average_focus_level', sa.Numeric(precision=3, scale=2), nullable=True),
+    sa.Column('average_mood', sa.String(length=20), nullable=True),
+    sa.Column('tasks_completed', sa.Integer(), nullable=True),
+    sa.Column('tasks_pending', sa.Integer(), nullable=True),
+    sa.Column('average_score', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('target_achieved', sa.Boolean(), nullable=True),
+    sa.Column('strength_areas', sa.Text(), nullable=True),
+    sa.Column('weakness_areas', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_subject_statistics_id'), 'subject_statistics', ['id'], unique=False)
+    op.create_table('tasks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('task_type', sa.String(length=20), nullable=True),
+    sa.Column('priority', sa.String(length=20), nullable=True),
+    sa.Column('difficulty', sa.String(length=20), nullable=True),
+    sa.Column('due_date', sa.DateTime(), nullable=True),
+    sa.Column('estimated_duration', sa.Integer(), nullable=True),
+    sa.Column('actual_duration', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('completion_date', sa.DateTime(), nullable=True),
+    sa.Column('completion_percentage', sa.Integer(), nullable=True),
+    sa.Column('score', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('max_score', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('parent_task_id', sa.Integer(), nullable=True),
+    sa.Column('ai_suggested', sa.Boolean(), nullable=True),
+    sa.Column('ai_recommendation', sa.Text(), nullable=True),
+    sa.Column('attachments', sa.Text(), nullable=True),
+    sa.Column('is_reviewable', sa.Boolean(), nullable=True),
+    sa.Column('sm2_interval', sa.Integer(), nullable=True),
+    sa.Column('sm2_repetitions', sa.Integer(), nullable=True),
+    sa.Column('sm2_easiness_factor', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('next_review_date', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['group_id'], ['task_groups.id'], ),
+    sa.ForeignKeyConstraint(['parent_task_id'], ['tasks.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tasks_id'), 'tasks', ['id'], unique=False)
+    op.create_table('goal_progress_logs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('goal_id', sa.Integer(), nullable=True),
+    sa.Column('log_date', sa.Date(), nullable=False),
+    sa.Column('progress_value', sa.Integer(), nullable=False),
+    sa.Column('percentage_complete', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['goal_id'], ['goals.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_goal_progress_logs_id'), 'goal_progress_logs', ['id'], unique=False)
+    op.create_table('pomodoro_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('session_date', sa.DateTime(), nullable=False),
+    sa.Column('work_duration', sa.Integer(), nullable=True),
+    sa.Column('break_duration', sa.Integer(), nullable=True),
+    sa.Column('completed_pomodoros', sa.Integer(), nullable=True),
+    sa.Column('total_focus_time', sa.Integer(), nullable=True),
+    sa.Column('interruptions', sa.Integer(), nullable=True),
+    sa.Column('interruption_reasons', sa.Text(), nullable=True),
+    sa.Column('effectiveness_rating', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_pomodoro_sessions_id'), 'pomodoro_sessions', ['id'], unique=False)
+    op.create_table('study_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('subject_id', sa.Integer(), nullable=True),
+    sa.Column('schedule_id', sa.Integer(), nullable=True),
+    sa.Column('session_date', sa.Date(), nullable=False),
+    sa.Column('start_time', sa.Time(), nullable=False),
+    sa.Column('end_time', sa.Time(), nullable=True),
+    sa.Column('duration_minutes', sa.Integer(), nullable=True),
+    sa.Column('study_note', sa.Text(), nullable=True),
+    sa.Column('focus_level', sa.String(length=20), nullable=True),
+    sa.Column('mood', sa.String(length=20), nullable=True),
+    sa.Column('environment', sa.String(length=100), nullable=True),
+    sa.Column('is_completed', sa.Boolean(), nullable=True),
+    sa.Column('ai_analysis', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['schedule_id'], ['schedules.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_study_sessions_id'), 'study_sessions', ['id'], unique=False)
+    op.create_table('task_chat_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('chat_type', sa.String(length=20), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_task_chat_history_id'), 'task_chat_history', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    # ### Lệnh được tạo tự động bởi Alembic ###
+    op.drop_index(op.f('ix_task_chat_history_id'), table_name='task_chat_history')
+    op.drop_table('task_chat_history')
+    op.drop_index(op.f('ix_study_sessions_id'), table_name='study_sessions')
+    op.drop_table('study_sessions')
+    op.drop_index(op.f('ix_pomodoro_sessions_id'), table_name='pomodoro_sessions')
+    op.drop_table('pomodoro_sessions')
+    op.drop_index(op.f('ix_goal_progress_logs_id'), table_name='goal_progress_logs')
+    op.drop_table('goal_progress_logs')
+    op.drop_index(op.f('ix_tasks_id'), table_name='tasks')
+    op.drop_table('tasks')
+    op.drop_index(op.f('ix_subject_statistics_id'), table_name='subject_statistics')
+    op.drop_table('subject_statistics')
+    op.drop_index(op.f('ix_schedules_id'), table_name='schedules')
+    op.drop_table('schedules')
+    op.drop_index(op.f('ix_notes_id'), table_name='notes')
+    op.drop_table('notes')
+    op.drop_index(op.f('ix_goals_id'), table_name='goals')
+    op.drop_table('goals')
+    op.drop_index(op.f('ix_user_roles_id'), table_name='user_roles')
+    op.drop_table('user_roles')
+    op.drop_index(op.f('ix_user_profiles_id'), table_name='user_profiles')
+    op.drop_table('user_profiles')
+    op.drop_index(op.f('ix_user_preferences_id'), table_name='user_preferences')
+    op.drop_table('user_preferences')
+    op.drop_index(op.f('ix_user_achievements_id'), table_name='user_achievements')
+    op.drop_table('user_achievements')
+    op.drop_table('task_groups')
+    op.drop_index(op.f('ix_system_settings_id'), table_name='system_settings')
+    op.drop_table('system_settings')
+    op.drop_index(op.f('ix_subjects_id'), table_name='subjects')
+    op.drop_table('subjects')
+    op.drop_index(op.f('ix_study_reports_id'), table_name='study_reports')
+    op.drop_table('study_reports')
+    op.drop_index(op.f('ix_notifications_id'), table_name='notifications')
+    op.drop_table('notifications')
+    op.drop_index(op.f('ix_feedback_id'), table_name='feedback')
+    op.drop_table('feedback')
+    op.drop_index(op.f('ix_chat_history_id'), table_name='chat_history')
+    op.drop_table('chat_history')
+    op.drop_index(op.f('ix_ai_interactions_id'), table_name='ai_interactions')
+    op.drop_table('ai_interactions')
+    op.drop_index(op.f('ix_activity_logs_id'), table_name='activity_logs')
+    op.drop_table('activity_logs')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_roles_id'), table_name='roles')
+    op.drop_table('roles')
+    op.drop_index(op.f('ix_achievements_id'), table_name='achievements')
+    op.drop_table('achievements')
@@ -0,0 +1,30 @@
+"""user_role_version
+
+users.role_version: token chỉ tin claim roles khi claim "rv" khớp cột này. Trước đây version
+chỉ nằm trong Redis (auth:rv:*), Redis mất key thì version về 0 và token cũ lại được tin.
+Version do code tăng (bump_role_version), xem c8d9e0f1a2b3.
+
+Revision ID: a6b7c8d9e0f1
+Revises: f5c6d7e8a9b0
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'a6b7c8d9e0f1'
+down_revision: Union[str, None] = 'f5c6d7e8a9b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('role_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'role_version')
@@ -0,0 +1,55 @@
+"""channel_privacy_and_join_requests
+
+subject_channels.creator_id / is_private và bảng channel_join_requests có trong model
+nhưng chưa từng có migration: DB dựng bằng `alembic upgrade` tới be27eb945d93 thiếu chúng.
+DB cũ do create_all tạo (rồi stamp be27eb945d93) đã có sẵn nên chỉ tạo phần còn thiếu.
+
+Revision ID: b7c8d9e0f1a2
+Revises: a6b7c8d9e0f1
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'b7c8d9e0f1a2'
+down_revision: Union[str, None] = 'a6b7c8d9e0f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Trùng tên PostgreSQL tự đặt cho FK do create_all tạo
+FK_NAME = "subject_channels_creator_id_fkey"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {c["name"] for c in inspector.get_columns('subject_channels')}
+    if 'creator_id' not in columns:
+        op.add_column('subject_channels', sa.Column('creator_id', sa.Integer(), nullable=True))
+        op.create_foreign_key(FK_NAME, 'subject_channels', 'users', ['creator_id'], ['id'])
+    if 'is_private' not in columns:
+        op.add_column('subject_channels', sa.Column('is_private', sa.Boolean(), nullable=True))
+    if not inspector.has_table('channel_join_requests'):
+        op.create_table('channel_join_requests',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('channel_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['channel_id'], ['subject_channels.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_channel_join_requests_id'), 'channel_join_requests', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_channel_join_requests_id'), table_name='channel_join_requests')
+    op.drop_table('channel_join_requests')
+    op.drop_column('subject_channels', 'is_private')
+    op.drop_constraint(FK_NAME, 'subject_channels', type_='foreignkey')
+    op.drop_column('subject_channels', 'creator_id')
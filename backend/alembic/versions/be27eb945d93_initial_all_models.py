@@ -1,7 +1,7 @@
 """initial_all_models
 
 Revision ID: be27eb945d93
-Revises: 
+Revises: a0b1c2d3e4f5
 Create Date: 2026-04-09 21:37:07.422072
 
 """
@@ -13,7 +13,7 @@ import sqlalchemy as sa
 
 # Định danh revision, dùng bởi Alembic.
 revision: str = 'be27eb945d93'
-down_revision: Union[str, None] = None
+down_revision: Union[str, None] = 'a0b1c2d3e4f5'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
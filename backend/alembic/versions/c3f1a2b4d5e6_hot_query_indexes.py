@@ -0,0 +1,53 @@
+"""hot_query_indexes
+
+Index ghép cho các truy vấn nóng theo user / hội thoại / kênh.
+
+Tạo bằng CREATE INDEX CONCURRENTLY (ngoài transaction) để không khóa ghi bảng
+trong lúc build trên DB đang chạy. Nếu lần chạy trước bị ngắt giữa chừng,
+Postgres để lại index INVALID: migration này xóa index đó rồi tạo lại.
+
+Revision ID: c3f1a2b4d5e6
+Revises: be27eb945d93
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from index_utils import drop_invalid_index
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'c3f1a2b4d5e6'
+down_revision: Union[str, None] = 'be27eb945d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (tên index, bảng, cột) - giữ đồng bộ với __table_args__ trong app/models/models.py
+INDEXES = [
+    ("ix_tasks_user_id_status", "tasks", ["user_id", "status"]),
+    ("ix_tasks_user_id_next_review_date", "tasks", ["user_id", "next_review_date"]),
+    ("ix_tasks_parent_task_id", "tasks", ["parent_task_id"]),
+    ("ix_schedules_user_id_start_time", "schedules", ["user_id", "start_time"]),
+    ("ix_notifications_user_id_created_at", "notifications", ["user_id", "created_at"]),
+    ("ix_direct_messages_sender_receiver_created_at", "direct_messages", ["sender_id", "receiver_id", "created_at"]),
+    ("ix_subject_channel_messages_channel_id_created_at", "subject_channel_messages", ["channel_id", "created_at"]),
+    ("ix_study_room_messages_room_id_created_at", "study_room_messages", ["room_id", "created_at"]),
+    ("ix_pomodoro_sessions_user_id_session_date", "pomodoro_sessions", ["user_id", "session_date"]),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY không chạy được trong transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            drop_invalid_index(name)
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,32 @@
+"""drop_role_version_trigger
+
+Bản đầu của a6b7c8d9e0f1 tạo trigger trên user_roles tăng users.role_version, trong khi
+code cũng gọi bump_role_version -> 1 thay đổi tăng 2 lần và không rõ cơ chế nào quyết định.
+Chỉ giữ bump_role_version (chạy được trên mọi DB): xóa trigger trên các DB đã có.
+
+Revision ID: c8d9e0f1a2b3
+Revises: b7c8d9e0f1a2
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'c8d9e0f1a2b3'
+down_revision: Union[str, None] = 'b7c8d9e0f1a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP TRIGGER IF EXISTS user_roles_bump_role_version ON user_roles")
+        op.execute("DROP FUNCTION IF EXISTS bump_user_role_version()")
+
+
+def downgrade() -> None:
+    # a6b7c8d9e0f1 không còn tạo trigger nên không có gì để khôi phục
+    pass
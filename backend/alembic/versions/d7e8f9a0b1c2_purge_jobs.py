@@ -0,0 +1,49 @@
+"""purge_jobs
+
+Bảng job xóa dữ liệu chạy nền (tài khoản, phòng học, nhóm, hội thoại).
+
+Revision ID: d7e8f9a0b1c2
+Revises: c3f1a2b4d5e6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'd7e8f9a0b1c2'
+down_revision: Union[str, None] = 'c3f1a2b4d5e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('purge_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=30), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('requested_by', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('step', sa.Integer(), nullable=True),
+    sa.Column('deleted_rows', sa.Integer(), nullable=True),
+    sa.Column('progress', sa.Text(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_purge_jobs_id'), 'purge_jobs', ['id'], unique=False)
+    op.create_index('ix_purge_jobs_status_id', 'purge_jobs', ['status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_purge_jobs_status_id', table_name='purge_jobs')
+    op.drop_index(op.f('ix_purge_jobs_id'), table_name='purge_jobs')
+    op.drop_table('purge_jobs')
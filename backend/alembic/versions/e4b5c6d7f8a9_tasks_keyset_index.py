@@ -0,0 +1,38 @@
+"""tasks_keyset_index
+
+Index tasks(user_id, id) cho phân trang keyset của GET /stms/tasks
+(WHERE user_id = ? AND id > ? ORDER BY id LIMIT n).
+
+Tạo CONCURRENTLY như c3f1a2b4d5e6; index INVALID do lần chạy trước bị ngắt
+được xóa rồi tạo lại.
+
+Revision ID: e4b5c6d7f8a9
+Revises: d7e8f9a0b1c2
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from index_utils import drop_invalid_index
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'e4b5c6d7f8a9'
+down_revision: Union[str, None] = 'd7e8f9a0b1c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_tasks_user_id_id"
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        drop_invalid_index(INDEX_NAME)
+        op.create_index(INDEX_NAME, "tasks", ["user_id", "id"], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX_NAME, table_name="tasks", postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,66 @@
+"""schedule_task_link
+
+Thêm schedules.task_id (FK -> tasks, ON DELETE SET NULL, có index): lịch do AI
+auto-schedule tạo cho 1 task được liên kết trực tiếp, thay cho việc tìm lịch
+bằng `title LIKE '%<tên task>%'` khi xóa task.
+
+Backfill các lịch AI cũ (title bắt đầu bằng "✨ "): ghép với task cùng user có
+tên nằm trong title lịch (tên dài nhất thắng). Block đặt theo tên subtask được
+gán cho task cha - auto-schedule chạy trên task cha. Chỉ ghép khi môn học của
+lịch khớp môn học của task và lịch được tạo sau task.
+
+Revision ID: f5c6d7e8a9b0
+Revises: e4b5c6d7f8a9
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Định danh revision, dùng bởi Alembic.
+revision: str = 'f5c6d7e8a9b0'
+down_revision: Union[str, None] = 'e4b5c6d7f8a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = "ix_schedules_task_id"
+FK_NAME = "fk_schedules_task_id_tasks"
+
+# Tên quá ngắn (vd "a", "Ôn") khớp gần như mọi lịch -> bỏ qua
+MIN_TITLE_LENGTH = 3
+
+BACKFILL_SQL = f"""
+UPDATE schedules SET task_id = (
+    SELECT root.id
+    FROM tasks t
+    JOIN tasks root ON root.id = COALESCE(t.parent_task_id, t.id)
+    WHERE t.user_id = schedules.user_id
+      AND root.user_id = schedules.user_id
+      AND length(t.title) >= {MIN_TITLE_LENGTH}
+      AND strpos(schedules.title, t.title) > 0
+      AND root.subject_id IS NOT DISTINCT FROM schedules.subject_id
+      AND (root.created_at IS NULL OR schedules.created_at IS NULL OR schedules.created_at >= root.created_at)
+    ORDER BY length(t.title) DESC, root.id
+    LIMIT 1
+)
+WHERE task_id IS NULL AND title LIKE '✨ %'
+"""
+
+
+def upgrade() -> None:
+    op.add_column('schedules', sa.Column('task_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(FK_NAME, 'schedules', 'tasks', ['task_id'], ['id'], ondelete='SET NULL')
+    op.execute(BACKFILL_SQL)
+    # Index tạo CONCURRENTLY (ngoài transaction) như c3f1a2b4d5e6
+    with op.get_context().autocommit_block():
+        op.create_index(INDEX_NAME, 'schedules', ['task_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX_NAME, table_name='schedules', postgresql_concurrently=True, if_exists=True)
+    op.drop_constraint(FK_NAME, 'schedules', type_='foreignkey')
+    op.drop_column('schedules', 'task_id')
@@ -1,6 +1,8 @@
+import asyncio
 import os
 import re
-import joblib
+import threading
+import time
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "toxic_model.pkl")
@@ -8,6 +10,11 @@ MODEL_PATH = os.path.join(BASE_DIR, "toxic_model.pkl")
 # Biến toàn cục lưu trữ mô hình
 _ai_pipeline = None
 _last_model_mtime = 0
+# Model nạp trễ ở lần kiểm duyệt đầu tiên: tránh nhiều thread cùng nạp một lúc
+_model_lock = threading.Lock()
+# Kiểm tra mtime file model (reload khi train lại) tối đa 1 lần mỗi khoảng này, không phải mỗi tin nhắn
+MODEL_RELOAD_CHECK_SECONDS = float(os.getenv("AI_MODEL_RELOAD_CHECK_SECONDS", "30"))
+_next_mtime_check = 0.0
 
 # Danh sách từ cấm
 TOXIC_KEYWORDS = [
@@ -214,11 +221,21 @@ def keyword_check(text: str) -> bool:
 
 def load_model():
     """Tải mô hình vào bộ nhớ và tự động reload nếu file .pkl thay đổi"""
-    global _ai_pipeline, _last_model_mtime
+    global _ai_pipeline, _last_model_mtime, _next_mtime_check
+    now = time.monotonic()
+    if _ai_pipeline is not None and now < _next_mtime_check:
+        return
+    _next_mtime_check = now + MODEL_RELOAD_CHECK_SECONDS
     if os.path.exists(MODEL_PATH):
         current_mtime = os.path.getmtime(MODEL_PATH)
-        if _ai_pipeline is None or current_mtime > _last_model_mtime:
+        if _ai_pipeline is not None and current_mtime <= _last_model_mtime:
+            return
+        with _model_lock:
+            if _ai_pipeline is not None and current_mtime <= _last_model_mtime:
+                return
             try:
+                # Import trễ: joblib/scikit-learn/numpy chỉ nạp khi thật sự cần model
+                import joblib
                 _ai_pipeline = joblib.load(MODEL_PATH)
                 _last_model_mtime = current_mtime
                 print("[AI Filter] Model loaded successfully!")
@@ -227,6 +244,9 @@ def load_model():
     else:
         print("[AI Filter] toxic_model.pkl not found. Run train_model.py first.")
 
+def model_loaded() -> bool:
+    return _ai_pipeline is not None
+
 # Mapping ký tự lách luật
 TEENCODE_MAP = {
     '0': 'o',
@@ -296,3 +316,8 @@ def is_toxic_message(message: str) -> bool:
     except Exception as e:
         print(f"[AI Filter] Prediction error: {e}")
         return False
+
+
+async def is_toxic_message_async(message: str) -> bool:
+    """Như is_toxic_message nhưng không chặn event loop (lần đầu có thể phải nạp joblib/scikit-learn)"""
+    return await asyncio.to_thread(is_toxic_message, message)
@@ -1,20 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..database import get_db
-from ..models.models import User, Task, StudyRoom, StudySession, Role, UserRole
-from ..utils.auth import get_current_user
-import psutil
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select
+from ..database import get_db, get_async_db
+from ..models.models import User, Task, StudyRoom, StudySession, Role, UserRole, PurgeJob
+from ..purge import job_progress
+from ..utils.auth import CurrentUser, get_current_async_user
+from ..utils.cache import cache_breaker, invalidate_all_cache, local_cache
+from ..utils.config import config_service
+from ..utils.query_stats import query_metrics
+from ..utils.runtime import worker_stats
+from ..utils.security import password_hasher
 import time
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/stms/admin", tags=["admin"])
 
-CONFIG_FILE = "server_config.json"
-
 class SystemSettings(BaseModel):
     smtp_host: str
     smtp_port: str
@@ -24,28 +28,9 @@ class SystemSettings(BaseModel):
     maintenance_mode: bool = False
     auto_scan: bool = True
 
-def get_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {
-        "smtp_host": "smtp.eduflow.io",
-        "smtp_port": "587",
-        "db_pool_size": "20",
-        "cache_ttl": "3600",
-        "max_upload_size": "50",
-        "maintenance_mode": False,
-        "auto_scan": True
-    }
-
-def save_config(config: dict):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
-
 # Hàm kiểm tra quyền admin
-async def get_current_admin(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_roles = [r.role.role_name for r in current_user.roles]
-    if "admin" not in user_roles:
+async def get_current_admin(current_user: CurrentUser = Depends(get_current_async_user)):
+    if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     return current_user
 
@@ -70,6 +55,8 @@ def get_admin_stats(db: Session = Depends(get_db), current_admin: User = Depends
 
 @router.get("/system-health")
 def get_system_health(current_admin: User = Depends(get_current_admin)):
+    import psutil  # import trễ: chỉ cần cho trang admin
+
     cpu_percent = psutil.cpu_percent(interval=0.5)
     ram = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
@@ -78,9 +65,33 @@ def get_system_health(current_admin: User = Depends(get_current_admin)):
         "cpu_usage": cpu_percent,
         "ram_usage": ram.percent,
         "disk_usage": disk.percent,
-        "uptime_seconds": time.time() - psutil.boot_time()
+        "uptime_seconds": time.time() - psutil.boot_time(),
+        "local_cache": local_cache.get_stats(),
+        "cache_breaker": cache_breaker.snapshot(),
+        "password_hasher": password_hasher.snapshot(),
+        "worker": worker_stats()
     }
 
+@router.get("/query-stats")
+async def get_query_stats(reset: bool = False, current_admin: User = Depends(get_current_admin)):
+    """Số câu SQL / thời gian DB theo endpoint của worker này (endpoint nhiều query nhất lên đầu)"""
+    snapshot = query_metrics.snapshot()
+    if reset:
+        query_metrics.reset()
+    return snapshot
+
+@router.get("/purge-jobs")
+async def get_purge_jobs(
+    status: Optional[str] = None, limit: int = 50,
+    db: AsyncSession = Depends(get_async_db), current_admin: User = Depends(get_current_admin)
+):
+    """Các purge job gần nhất (lọc theo status: pending/running/done/failed)"""
+    query = select(PurgeJob).order_by(PurgeJob.id.desc()).limit(min(limit, 200))
+    if status:
+        query = query.where(PurgeJob.status == status)
+    jobs = (await db.execute(query)).scalars().all()
+    return [job_progress(job) for job in jobs]
+
 @router.get("/logs")
 def get_admin_logs(db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
     logs = []
@@ -143,47 +154,37 @@ def get_admin_logs(db: Session = Depends(get_db), current_admin: User = Depends(
     return logs[:10]
 
 @router.get("/settings")
-def get_system_settings(current_admin: User = Depends(get_current_admin)):
-    return get_config()
+async def get_system_settings(current_admin: User = Depends(get_current_admin)):
+    return config_service.all()
 
 @router.post("/settings")
-def update_system_settings(settings: SystemSettings, current_admin: User = Depends(get_current_admin)):
-    save_config(settings.dict())
+async def update_system_settings(settings: SystemSettings, current_admin: User = Depends(get_current_admin)):
+    # Ghi file + publish: mọi worker áp dụng ngay (vd: bật chế độ bảo trì)
+    await config_service.save(settings.dict())
     return {"status": "success", "message": "Settings updated successfully"}
 
 @router.post("/cleanup")
-def cleanup_database(db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
-    """Dọn dẹp dữ liệu cũ: OTP hết hạn, thông báo cũ, cache Redis"""
+async def cleanup_database(db: AsyncSession = Depends(get_async_db), current_admin: User = Depends(get_current_admin)):
+    """Dọn dẹp dữ liệu cũ: thông báo cũ, cache Redis (OTP nằm trong Redis và tự hết hạn)"""
     from ..models.models import Notification
     from datetime import datetime, timedelta
-    from ..utils.cache import redis_client
 
     cleaned = 0
 
-    # 1. Xóa OTP code đã dùng hoặc hết hạn
-    expired_otp = db.query(User).filter(User.otp_code != None, User.is_verified == True).all()
-    for u in expired_otp:
-        u.otp_code = None
-        cleaned += 1
-
-    # 2. Xóa thông báo cũ hơn 30 ngày
+    # 1. Xóa thông báo cũ hơn 30 ngày
     cutoff = datetime.now() - timedelta(days=30)
-    old_notifs = db.query(Notification).filter(Notification.created_at < cutoff).delete(synchronize_session=False)
-    cleaned += old_notifs
+    result = await db.execute(delete(Notification).where(Notification.created_at < cutoff))
+    cleaned += result.rowcount
 
-    db.commit()
+    await db.commit()
 
-    # 3. Xóa cache Redis
-    cache_cleared = 0
-    try:
-        keys = redis_client.keys("cache:*")
-        if keys:
-            cache_cleared = len(keys)
-            redis_client.delete(*keys)
-    except Exception:
-        pass
+    # 2. Vô hiệu toàn bộ cache Redis (tăng epoch, key cũ tự hết hạn theo TTL)
+    if await invalidate_all_cache() is not None:
+        cache_message = "làm mới toàn bộ cache"
+    else:
+        cache_message = "không thể làm mới cache"
 
     return {
         "status": "success",
-        "message": f"Đã dọn dẹp {cleaned} bản ghi orphaned và xóa {cache_cleared} cache entries."
+        "message": f"Đã dọn dẹp {cleaned} bản ghi orphaned và {cache_message}."
     }
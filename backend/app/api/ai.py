@@ -9,7 +9,6 @@ from ..models.models import Task, User, Subject, PomodoroSession, ChatHistory, U
 from ..utils.auth import get_current_active_user
 import os
 import io
-import httpx
 import json
 import base64
 from dotenv import load_dotenv
@@ -91,6 +90,8 @@ async def _try_model(model_id: str, prompt, headers: dict, max_tokens: int) -> t
             "messages": [{"role": "user", "content": messages_content}],
             "max_tokens": max_tokens,
         }
+        import httpx  # import trễ: chỉ worker nào gọi AI mới nạp httpx
+
         async with httpx.AsyncClient(timeout=15.0) as client:
             t0 = _time.time()
             response = await client.post(AI_URL, json=payload, headers=headers)
@@ -1059,7 +1060,8 @@ Rules:
                 start_time=start_t,
                 end_time=end_t,
                 status='scheduled',
-                created_by=current_user.id
+                created_by=current_user.id,
+                task_id=request.task_id
             )
             db.add(new_schedule)
             db.flush() # flush để lấy ID hoặc tiếp tục
@@ -1071,7 +1073,7 @@ Rules:
             })
             
         db.commit()
-        invalidate_cache("/stms/schedules", current_user.id)
+        await invalidate_cache("/stms/schedules", current_user.id)
         
         return {"blocks": blocks}
         
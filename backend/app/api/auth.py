@@ -1,15 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi import BackgroundTasks
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models.models import User, Role, UserRole
-from ..utils.security import verify_password, get_password_hash
-from ..utils.auth import create_access_token
+from ..utils.security import get_password_hash_async, verify_password_async
+from ..utils.auth import create_access_token, invalidate_user_cache
+from ..utils.otp import OTP_OK, OTP_TOO_MANY_ATTEMPTS, check_send_rate, issue_otp, verify_otp as check_otp
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
-import random
-import string
 
 router = APIRouter(prefix="/stms/auth", tags=["auth"])
 
@@ -33,6 +32,9 @@ class VerifyOTPRequest(BaseModel):
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
 
+class ResendOTPRequest(BaseModel):
+    email: EmailStr
+
 class ResetPasswordRequest(BaseModel):
     email: EmailStr
     otp_code: str
@@ -40,12 +42,24 @@ class ResetPasswordRequest(BaseModel):
 
 from sqlalchemy import or_
 
+
+def _client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
+async def _require_otp(purpose: str, identity: str, code: str, invalid_detail: str):
+    result = await check_otp(purpose, identity, code)
+    if result == OTP_TOO_MANY_ATTEMPTS:
+        raise HTTPException(status_code=400, detail="Nhập sai quá nhiều lần, vui lòng yêu cầu mã mới")
+    if result != OTP_OK:
+        raise HTTPException(status_code=400, detail=invalid_detail)
+
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(User).filter(
         or_(User.username == form_data.username, User.email == form_data.username)
     ).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -62,9 +76,8 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             detail="Account not verified. Please verify your OTP.",
         )
     
-    access_token = create_access_token(
-        data={"sub": user.username, "id": user.id, "roles": user_roles}
-    )
+    claims = {"sub": user.username, "id": user.id, "roles": user_roles, "rv": user.role_version or 0}
+    access_token = create_access_token(data=claims)
     return {
         "access_token": access_token, 
         "token_type": "bearer",
@@ -73,7 +86,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     }
 
 @router.post("/register")
-async def register(req: RegisterRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def register(req: RegisterRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    # Giới hạn tần suất trước khi chạm DB / gửi mail
+    await check_send_rate(req.email, _client_ip(request))
+
     # Kiểm tra user tồn tại
     if db.query(User).filter(User.username == req.username).first():
         raise HTTPException(status_code=400, detail="Username already exists")
@@ -86,37 +102,40 @@ async def register(req: RegisterRequest, background_tasks: BackgroundTasks, db:
         raise HTTPException(status_code=400, detail="Invalid role selection")
 
     try:
-        # Tạo OTP
-        otp = ''.join(random.choices(string.digits, k=6))
-        
         # Tạo User
         new_user = User(
             username=req.username,
             email=req.email,
-            password_hash=get_password_hash(req.password),
+            password_hash=await get_password_hash_async(req.password),
             full_name=req.full_name,
-            otp_code=otp,
             is_verified=False
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        db.flush()
 
         # Gán Role
         user_role = UserRole(user_id=new_user.id, role_id=role.id)
         db.add(user_role)
+
+        # OTP lưu trong Redis (hết hạn sau 5 phút). Cấp trước khi commit: Redis lỗi (503) thì
+        # tài khoản chưa được tạo, người dùng đăng ký lại được thay vì kẹt tài khoản chưa xác minh
+        otp = await issue_otp("verify", req.username)
         db.commit()
 
         # Gọi Background Task để gửi OTP qua FastAPI
         try:
             from ..worker import send_otp_email
             background_tasks.add_task(send_otp_email, req.email, otp)
-            print(f"DEBUG: Added OTP task to FastAPI Background tasks for {req.username}: {otp}")
+            print(f"DEBUG: Added OTP task to FastAPI Background tasks for {req.username}")
         except Exception as e:
             print(f"WARNING: Task add failed: {e}")
 
         return {"message": "Registration successful. Please verify OTP.", "username": req.username}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
+        db.rollback()
         import traceback
         err_msg = str(e)
         if "IntegrityError" in err_msg or "null value in column" in err_msg:
@@ -125,28 +144,46 @@ async def register(req: RegisterRequest, background_tasks: BackgroundTasks, db:
 
 @router.post("/verify-otp")
 async def verify_otp(req: VerifyOTPRequest, db: Session = Depends(get_db)):
+    await _require_otp("verify", req.username, req.otp_code, "Invalid OTP code")
+
     user = db.query(User).filter(User.username == req.username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    if user.otp_code == req.otp_code:
-        user.is_verified = True
-        user.otp_code = None
-        db.commit()
-        return {"message": "OTP verified successfully. You can now login."}
-    else:
-        raise HTTPException(status_code=400, detail="Invalid OTP code")
+    user.is_verified = True
+    db.commit()
+    return {"message": "OTP verified successfully. You can now login."}
+
+@router.post("/resend-otp")
+async def resend_otp(req: ResendOTPRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Gửi lại mã xác thực tài khoản (mã cũ hết hạn sau 5 phút)"""
+    await check_send_rate(req.email, _client_ip(request))
+
+    user = db.query(User).filter(User.email == req.email).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Email không tồn tại trong hệ thống")
+    if user.is_verified:
+        raise HTTPException(status_code=400, detail="Tài khoản đã được xác thực")
+
+    otp = await issue_otp("verify", user.username)
+    try:
+        from ..worker import send_otp_email
+        background_tasks.add_task(send_otp_email, user.email, otp)
+    except Exception as e:
+        print(f"WARNING: failed to send OTP: {e}")
+
+    return {"message": "Mã xác thực đã được gửi đến email của bạn"}
 
 @router.post("/forgot-password")
-async def forgot_password(req: ForgotPasswordRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def forgot_password(req: ForgotPasswordRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    # Giới hạn tần suất trước khi chạm DB / gửi mail
+    await check_send_rate(req.email, _client_ip(request))
+
     user = db.query(User).filter(User.email == req.email).first()
     if not user:
         raise HTTPException(status_code=404, detail="Email không tồn tại trong hệ thống")
     
-    # Tạo OTP
-    otp = ''.join(random.choices(string.digits, k=6))
-    user.otp_code = otp
-    db.commit()
+    # Tạo OTP (Redis, hết hạn sau 5 phút) - không ghi vào bảng users
+    otp = await issue_otp("reset", user.email)
     
     # Gửi OTP
     try:
@@ -159,18 +196,17 @@ async def forgot_password(req: ForgotPasswordRequest, background_tasks: Backgrou
 
 @router.post("/reset-password")
 async def reset_password(req: ResetPasswordRequest, db: Session = Depends(get_db)):
+    await _require_otp("reset", req.email, req.otp_code, "Mã OTP không đúng hoặc đã hết hạn")
+
     user = db.query(User).filter(User.email == req.email).first()
     if not user:
         raise HTTPException(status_code=404, detail="Email không tồn tại")
         
-    if not user.otp_code or user.otp_code != req.otp_code:
-        raise HTTPException(status_code=400, detail="Mã OTP không đúng hoặc đã hết hạn")
-        
-    user.password_hash = get_password_hash(req.new_password)
-    user.otp_code = None  # Xóa OTP
+    user.password_hash = await get_password_hash_async(req.new_password)
     # Tự động verify user luôn nếu họ chưa verify
     if not user.is_verified:
         user.is_verified = True
     db.commit()
+    await invalidate_user_cache(user.username)
     
     return {"message": "Đặt lại mật khẩu thành công. Bạn có thể đăng nhập ngay."}
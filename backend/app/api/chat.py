@@ -2,12 +2,14 @@
 Chat API - Tin nhắn trong Study Room
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from ..database import get_db
-from ..models.models import StudyRoomMessage, StudyRoomMember, User
+from ..database import get_async_db
+from ..models.models import StudyRoomMessage, StudyRoomMember
+from ..utils.user_cards import UserCardLoader
 
 router = APIRouter(prefix="/api/chat", tags=["Chat"])
 
@@ -25,15 +27,20 @@ class ChatMessageOut(BaseModel):
 
 
 @router.get("/room/{room_id}/messages", response_model=List[ChatMessageOut])
-async def get_room_messages(room_id: int, limit: int = 50, db: Session = Depends(get_db)):
+async def get_room_messages(room_id: int, limit: int = 50, db: AsyncSession = Depends(get_async_db)):
     """Lấy lịch sử chat phòng"""
-    messages = db.query(StudyRoomMessage).filter(
-        StudyRoomMessage.room_id == room_id
-    ).order_by(StudyRoomMessage.created_at.desc()).limit(limit).all()
+    messages = (await db.execute(
+        select(StudyRoomMessage)
+        .where(StudyRoomMessage.room_id == room_id)
+        .order_by(StudyRoomMessage.created_at.desc())
+        .limit(limit)
+    )).scalars().all()
 
+    # Thông tin người gửi của cả trang: 1 lần đọc cache/1 query thay vì 1 query mỗi tin
+    cards = await UserCardLoader(db).load(msg.user_id for msg in messages)
     result = []
     for msg in reversed(messages):
-        user = db.query(User).filter(User.id == msg.user_id).first()
+        user = cards.get(msg.user_id)
         result.append(ChatMessageOut(
             id=msg.id, room_id=msg.room_id, user_id=msg.user_id,
             username=user.username if user else "Unknown",
@@ -46,13 +53,15 @@ async def get_room_messages(room_id: int, limit: int = 50, db: Session = Depends
 
 
 @router.post("/room/{room_id}/send")
-async def send_room_message(room_id: int, user_id: int, message: str, db: Session = Depends(get_db)):
+async def send_room_message(room_id: int, user_id: int, message: str, db: AsyncSession = Depends(get_async_db)):
     """Gửi tin nhắn vào phòng (HTTP fallback)"""
     # Kiểm tra quyền
-    member = db.query(StudyRoomMember).filter(
-        StudyRoomMember.room_id == room_id,
-        StudyRoomMember.user_id == user_id
-    ).first()
+    member = (await db.execute(
+        select(StudyRoomMember).where(
+            StudyRoomMember.room_id == room_id,
+            StudyRoomMember.user_id == user_id
+        )
+    )).scalars().first()
     if not member:
         raise HTTPException(status_code=403, detail="Bạn chưa tham gia phòng này")
 
@@ -61,6 +70,6 @@ async def send_room_message(room_id: int, user_id: int, message: str, db: Sessio
         message=message, message_type="text"
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     return {"id": msg.id, "message": "Đã gửi"}
@@ -2,14 +2,18 @@
 Subject Community API - Kênh chat theo môn học (Công khai & Riêng tư)
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from ..database import get_db
-from ..models.models import SubjectChannel, SubjectChannelMember, SubjectChannelMessage, ChannelJoinRequest, User, Notification
-from ..ai.ai_filter import is_toxic_message
+from ..database import get_async_db
+from ..models.models import SubjectChannel, SubjectChannelMember, SubjectChannelMessage, ChannelJoinRequest, User, UserRole, Notification
+from ..ai.ai_filter import is_toxic_message_async
 from .websocket import manager
+from ..utils.cache import invalidate_cache
+from ..utils.user_cards import UserCardLoader
+from ..purge import enqueue_purge, purge_worker
 import os
 
 router = APIRouter(prefix="/api/community", tags=["Community"])
@@ -58,8 +62,31 @@ class CreateChannelRequest(BaseModel):
     description: Optional[str] = None
     is_private: bool = False
 
+async def _get_member(db: AsyncSession, channel_id: int, user_id: int):
+    # Nhóm đã xóa (đang chờ purge) coi như không còn thành viên
+    result = await db.execute(
+        select(SubjectChannelMember)
+        .join(SubjectChannel, SubjectChannel.id == SubjectChannelMember.channel_id)
+        .where(
+            SubjectChannelMember.channel_id == channel_id,
+            SubjectChannelMember.user_id == user_id,
+            SubjectChannel.is_active == True
+        )
+    )
+    return result.scalars().first()
+
+async def _get_pending_request(db: AsyncSession, channel_id: int, user_id: int):
+    result = await db.execute(
+        select(ChannelJoinRequest).where(
+            ChannelJoinRequest.channel_id == channel_id,
+            ChannelJoinRequest.user_id == user_id,
+            ChannelJoinRequest.status == "pending"
+        )
+    )
+    return result.scalars().first()
+
 @router.post("/channels/create", response_model=ChannelOut)
-async def create_channel(req: CreateChannelRequest, user_id: int, db: Session = Depends(get_db)):
+async def create_channel(req: CreateChannelRequest, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Tạo channel mới (Công khai hoặc Riêng tư)"""
     ch = SubjectChannel(
         subject_name=req.subject_name,
@@ -71,13 +98,13 @@ async def create_channel(req: CreateChannelRequest, user_id: int, db: Session =
         member_count=1
     )
     db.add(ch)
-    db.commit()
-    db.refresh(ch)
+    await db.commit()
+    await db.refresh(ch)
     
     # Tự động tham gia 
     member = SubjectChannelMember(channel_id=ch.id, user_id=user_id)
     db.add(member)
-    db.commit()
+    await db.commit()
     
     return ChannelOut(
         id=ch.id, subject_name=ch.subject_name, grade_level=ch.grade_level,
@@ -86,27 +113,22 @@ async def create_channel(req: CreateChannelRequest, user_id: int, db: Session =
     )
 
 @router.get("/channels", response_model=List[ChannelOut])
-async def get_channels(user_id: Optional[int] = None, db: Session = Depends(get_db)):
+async def get_channels(user_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
     """Lấy danh sách tất cả channels"""
 
-    channels = db.query(SubjectChannel).filter(SubjectChannel.is_active == True).all()
+    channels = (await db.execute(
+        select(SubjectChannel).where(SubjectChannel.is_active == True)
+    )).scalars().all()
     result = []
     for ch in channels:
         is_joined = False
         pending_request = False
         if user_id:
-            member = db.query(SubjectChannelMember).filter(
-                SubjectChannelMember.channel_id == ch.id,
-                SubjectChannelMember.user_id == user_id
-            ).first()
+            member = await _get_member(db, ch.id, user_id)
             is_joined = member is not None
             # Kiểm tra đã gửi yêu cầu
             if not is_joined and ch.is_private:
-                req = db.query(ChannelJoinRequest).filter(
-                    ChannelJoinRequest.channel_id == ch.id,
-                    ChannelJoinRequest.user_id == user_id,
-                    ChannelJoinRequest.status == "pending"
-                ).first()
+                req = await _get_pending_request(db, ch.id, user_id)
                 pending_request = req is not None
         result.append(ChannelOut(
             id=ch.id, subject_name=ch.subject_name, grade_level=ch.grade_level,
@@ -118,27 +140,20 @@ async def get_channels(user_id: Optional[int] = None, db: Session = Depends(get_
 
 
 @router.post("/channels/{channel_id}/join")
-async def join_channel(channel_id: int, user_id: int, db: Session = Depends(get_db)):
+async def join_channel(channel_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Tham gia channel (public) hoặc Gửi yêu cầu (private)"""
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-    if not channel:
+    channel = await db.get(SubjectChannel, channel_id)
+    if not channel or not channel.is_active:
         raise HTTPException(status_code=404, detail="Channel không tồn tại")
 
-    existing = db.query(SubjectChannelMember).filter(
-        SubjectChannelMember.channel_id == channel_id,
-        SubjectChannelMember.user_id == user_id
-    ).first()
+    existing = await _get_member(db, channel_id, user_id)
     if existing:
         return {"message": "Đã tham gia channel này rồi"}
 
     # RIÊNG TƯ: Gửi yêu cầu 
     if channel.is_private:
         # Check gửi yêu cầu
-        existing_req = db.query(ChannelJoinRequest).filter(
-            ChannelJoinRequest.channel_id == channel_id,
-            ChannelJoinRequest.user_id == user_id,
-            ChannelJoinRequest.status == "pending"
-        ).first()
+        existing_req = await _get_pending_request(db, channel_id, user_id)
         if existing_req:
             raise HTTPException(status_code=400, detail="Bạn đã gửi yêu cầu rồi, vui lòng chờ duyệt.")
 
@@ -147,7 +162,7 @@ async def join_channel(channel_id: int, user_id: int, db: Session = Depends(get_
         db.add(join_req)
 
         # Gửi thông báo đến Chủ nhóm
-        requester = db.query(User).filter(User.id == user_id).first()
+        requester = await db.get(User, user_id)
         requester_name = requester.full_name or requester.username if requester else "Ai đó"
         notif = Notification(
             user_id=channel.creator_id,
@@ -160,11 +175,12 @@ async def join_channel(channel_id: int, user_id: int, db: Session = Depends(get_
             is_read=False
         )
         db.add(notif)
-        db.commit()
-        db.refresh(notif)
+        await db.commit()
+        await db.refresh(notif)
+        await invalidate_cache("/stms/notifications", notif.user_id)
 
         # Thông báo 
-        if manager.is_online(channel.creator_id):
+        if await manager.is_online(channel.creator_id):
             await manager.send_personal(channel.creator_id, {
                 "type": "new_notification",
                 "event": "new_notification",
@@ -185,47 +201,47 @@ async def join_channel(channel_id: int, user_id: int, db: Session = Depends(get_
     member = SubjectChannelMember(channel_id=channel_id, user_id=user_id)
     db.add(member)
     channel.member_count = (channel.member_count or 0) + 1
-    db.commit()
+    await db.commit()
     return {"message": f"Đã tham gia {channel.subject_name}"}
 
 
 @router.post("/channels/{channel_id}/leave")
-async def leave_channel(channel_id: int, user_id: int, db: Session = Depends(get_db)):
+async def leave_channel(channel_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Rời channel"""
-    member = db.query(SubjectChannelMember).filter(
-        SubjectChannelMember.channel_id == channel_id,
-        SubjectChannelMember.user_id == user_id
-    ).first()
+    member = await _get_member(db, channel_id, user_id)
     if not member:
         raise HTTPException(status_code=404, detail="Chưa tham gia channel này")
 
-    db.delete(member)
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
+    await db.delete(member)
+    channel = await db.get(SubjectChannel, channel_id)
     if channel:
         channel.member_count = max(0, (channel.member_count or 1) - 1)
-    db.commit()
+    await db.commit()
     return {"message": "Đã rời channel"}
 
 
 # QUẢN LÝ YÊU CẦU (Nhóm riêng tư)
 
 @router.get("/channels/{channel_id}/join-requests", response_model=List[JoinRequestOut])
-async def get_join_requests(channel_id: int, user_id: int, db: Session = Depends(get_db)):
+async def get_join_requests(channel_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Lấy danh sách yêu cầu tham gia (chỉ dành cho Chủ nhóm)"""
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-    if not channel:
+    channel = await db.get(SubjectChannel, channel_id)
+    if not channel or not channel.is_active:
         raise HTTPException(status_code=404, detail="Channel không tồn tại")
     if channel.creator_id != user_id:
         raise HTTPException(status_code=403, detail="Chỉ chủ nhóm mới xem được yêu cầu")
 
-    requests = db.query(ChannelJoinRequest).filter(
-        ChannelJoinRequest.channel_id == channel_id,
-        ChannelJoinRequest.status == "pending"
-    ).order_by(ChannelJoinRequest.created_at.desc()).all()
+    requests = (await db.execute(
+        select(ChannelJoinRequest).where(
+            ChannelJoinRequest.channel_id == channel_id,
+            ChannelJoinRequest.status == "pending"
+        ).order_by(ChannelJoinRequest.created_at.desc())
+    )).scalars().all()
 
+    cards = await UserCardLoader(db).load(r.user_id for r in requests)
     result = []
     for r in requests:
-        user = db.query(User).filter(User.id == r.user_id).first()
+        user = cards.get(r.user_id)
         result.append(JoinRequestOut(
             id=r.id, user_id=r.user_id,
             username=user.username if user else "Unknown",
@@ -237,19 +253,21 @@ async def get_join_requests(channel_id: int, user_id: int, db: Session = Depends
 
 
 @router.put("/channels/{channel_id}/join-requests/{request_id}/accept")
-async def accept_join_request(channel_id: int, request_id: int, user_id: int, db: Session = Depends(get_db)):
+async def accept_join_request(channel_id: int, request_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Chấp nhận yêu cầu tham gia nhóm"""
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-    if not channel:
+    channel = await db.get(SubjectChannel, channel_id)
+    if not channel or not channel.is_active:
         raise HTTPException(status_code=404, detail="Channel không tồn tại")
     if channel.creator_id != user_id:
         raise HTTPException(status_code=403, detail="Chỉ chủ nhóm mới duyệt được yêu cầu")
 
-    join_req = db.query(ChannelJoinRequest).filter(
-        ChannelJoinRequest.id == request_id,
-        ChannelJoinRequest.channel_id == channel_id,
-        ChannelJoinRequest.status == "pending"
-    ).first()
+    join_req = (await db.execute(
+        select(ChannelJoinRequest).where(
+            ChannelJoinRequest.id == request_id,
+            ChannelJoinRequest.channel_id == channel_id,
+            ChannelJoinRequest.status == "pending"
+        )
+    )).scalars().first()
     if not join_req:
         raise HTTPException(status_code=404, detail="Yêu cầu không tồn tại hoặc đã được xử lý")
 
@@ -273,11 +291,12 @@ async def accept_join_request(channel_id: int, request_id: int, user_id: int, db
         is_read=False
     )
     db.add(notif)
-    db.commit()
-    db.refresh(notif)
+    await db.commit()
+    await db.refresh(notif)
+    await invalidate_cache("/stms/notifications", notif.user_id)
 
     # Thông báo real-time cho người yêu cầu
-    if manager.is_online(join_req.user_id):
+    if await manager.is_online(join_req.user_id):
         await manager.send_personal(join_req.user_id, {
             "type": "new_notification",
             "event": "new_notification",
@@ -296,19 +315,21 @@ async def accept_join_request(channel_id: int, request_id: int, user_id: int, db
 
 
 @router.put("/channels/{channel_id}/join-requests/{request_id}/reject")
-async def reject_join_request(channel_id: int, request_id: int, user_id: int, db: Session = Depends(get_db)):
+async def reject_join_request(channel_id: int, request_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Từ chối yêu cầu tham gia nhóm"""
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-    if not channel:
+    channel = await db.get(SubjectChannel, channel_id)
+    if not channel or not channel.is_active:
         raise HTTPException(status_code=404, detail="Channel không tồn tại")
     if channel.creator_id != user_id:
         raise HTTPException(status_code=403, detail="Chỉ chủ nhóm mới duyệt được yêu cầu")
 
-    join_req = db.query(ChannelJoinRequest).filter(
-        ChannelJoinRequest.id == request_id,
-        ChannelJoinRequest.channel_id == channel_id,
-        ChannelJoinRequest.status == "pending"
-    ).first()
+    join_req = (await db.execute(
+        select(ChannelJoinRequest).where(
+            ChannelJoinRequest.id == request_id,
+            ChannelJoinRequest.channel_id == channel_id,
+            ChannelJoinRequest.status == "pending"
+        )
+    )).scalars().first()
     if not join_req:
         raise HTTPException(status_code=404, detail="Yêu cầu không tồn tại hoặc đã được xử lý")
 
@@ -326,11 +347,12 @@ async def reject_join_request(channel_id: int, request_id: int, user_id: int, db
         is_read=False
     )
     db.add(notif)
-    db.commit()
-    db.refresh(notif)
+    await db.commit()
+    await db.refresh(notif)
+    await invalidate_cache("/stms/notifications", notif.user_id)
 
     # Thông báo
-    if manager.is_online(join_req.user_id):
+    if await manager.is_online(join_req.user_id):
         await manager.send_personal(join_req.user_id, {
             "type": "new_notification",
             "event": "new_notification",
@@ -349,15 +371,19 @@ async def reject_join_request(channel_id: int, request_id: int, user_id: int, db
 
 
 @router.get("/channels/{channel_id}/messages", response_model=List[MessageOut])
-async def get_channel_messages(channel_id: int, limit: int = 50, db: Session = Depends(get_db)):
+async def get_channel_messages(channel_id: int, limit: int = 50, db: AsyncSession = Depends(get_async_db)):
     """Lấy lịch sử tin nhắn channel"""
-    messages = db.query(SubjectChannelMessage).filter(
-        SubjectChannelMessage.channel_id == channel_id
-    ).order_by(SubjectChannelMessage.created_at.desc()).limit(limit).all()
-
+    messages = (await db.execute(
+        select(SubjectChannelMessage)
+        .where(SubjectChannelMessage.channel_id == channel_id)
+        .order_by(SubjectChannelMessage.created_at.desc())
+        .limit(limit)
+    )).scalars().all()
+
+    cards = await UserCardLoader(db).load(msg.user_id for msg in messages)
     result = []
     for msg in reversed(messages):
-        user = db.query(User).filter(User.id == msg.user_id).first()
+        user = cards.get(msg.user_id)
         result.append(MessageOut(
             id=msg.id, user_id=msg.user_id,
             username=user.username if user else "Unknown",
@@ -369,10 +395,10 @@ async def get_channel_messages(channel_id: int, limit: int = 50, db: Session = D
 
 
 @router.post("/channels/{channel_id}/messages")
-async def send_channel_message(channel_id: int, user_id: int, message: str, db: Session = Depends(get_db)):
+async def send_channel_message(channel_id: int, user_id: int, message: str, db: AsyncSession = Depends(get_async_db)):
     """Gửi tin nhắn vào channel (HTTP fallback, thường dùng WebSocket)"""
     # Kiểm tra bộ lọc AI
-    if is_toxic_message(message):
+    if await is_toxic_message_async(message):
         raise HTTPException(
             status_code=400, 
             detail="Tin nhắn của bạn chứa ngôn từ không phù hợp."
@@ -383,58 +409,55 @@ async def send_channel_message(channel_id: int, user_id: int, message: str, db:
         message=message, message_type="text"
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     return {"id": msg.id, "message": "Đã gửi"}
 
 
 @router.get("/channels/{channel_id}/members", response_model=List[MemberOut])
-async def get_channel_members(channel_id: int, db: Session = Depends(get_db)):
+async def get_channel_members(channel_id: int, db: AsyncSession = Depends(get_async_db)):
     """Lấy danh sách members trong channel, loại trừ Admin vì Admin chỉ quản lý hệ thống"""
-    members = db.query(SubjectChannelMember).filter(
-        SubjectChannelMember.channel_id == channel_id
-    ).all()
-
-    result = []
-    for m in members:
-        user = db.query(User).filter(User.id == m.user_id).first()
-        is_admin = False
-        if user and user.roles:
-            is_admin = any(ur.role.role_name == "admin" for ur in user.roles)
-            
-        if user and not is_admin:
-            result.append(MemberOut(
-                user_id=user.id, username=user.username,
-                full_name=user.full_name, avatar_url=user.avatar_url,
-                joined_at=m.joined_at
-            ))
-    return result
+    # 1 query: join user và loại admin ngay trong SQL thay vì lazy-load roles từng người
+    rows = (await db.execute(
+        select(SubjectChannelMember, User)
+        .join(User, User.id == SubjectChannelMember.user_id)
+        .where(
+            SubjectChannelMember.channel_id == channel_id,
+            ~User.roles.any(UserRole.role.has(role_name="admin")),
+        )
+    )).all()
+    return [
+        MemberOut(
+            user_id=user.id, username=user.username,
+            full_name=user.full_name, avatar_url=user.avatar_url,
+            joined_at=m.joined_at
+        )
+        for m, user in rows
+    ]
 
 
 @router.delete("/channels/{channel_id}")
-async def delete_channel(channel_id: int, user_id: int, db: Session = Depends(get_db)):
-    """Xóa nhóm hoàn toàn - Dành cho Creator"""
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-    if not channel:
+async def delete_channel(channel_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Xóa nhóm - Dành cho Creator. Ẩn nhóm ngay; tin nhắn, thành viên, file, thông báo xóa ở nền (purge job)"""
+    channel = await db.get(SubjectChannel, channel_id)
+    if not channel or not channel.is_active:
         raise HTTPException(status_code=404, detail="Channel không tồn tại")
     
     if channel.creator_id != user_id:
         raise HTTPException(status_code=403, detail="Chỉ người tạo nhóm (Chủ nhóm) mới có quyền xóa Nhóm")
     
-    db.query(Notification).filter(
-        Notification.title.contains(channel.subject_name),
-        Notification.notification_type.in_(["join_request", "community", "community_message"])
-    ).delete(synchronize_session=False)
-    db.delete(channel)
-    db.commit()
-    return {"message": "Nhóm đã được giải tán thành công"}
+    channel.is_active = False
+    job = enqueue_purge(db, "channel", channel.id, params={"subject_name": channel.subject_name}, requested_by=user_id)
+    await db.commit()
+    purge_worker.wake()
+    return {"message": "Nhóm đã được giải tán thành công", "purge_job_id": job.id}
 
 
 @router.delete("/channels/{channel_id}/members/{member_id}")
-async def kick_channel_member(channel_id: int, member_id: int, user_id: int, db: Session = Depends(get_db)):
+async def kick_channel_member(channel_id: int, member_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Kích một thành viên ra khỏi nhóm - Dành cho Creator"""
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-    if not channel:
+    channel = await db.get(SubjectChannel, channel_id)
+    if not channel or not channel.is_active:
         raise HTTPException(status_code=404, detail="Channel không tồn tại")
     
     if channel.creator_id != user_id:
@@ -443,35 +466,32 @@ async def kick_channel_member(channel_id: int, member_id: int, user_id: int, db:
     if member_id == user_id:
         raise HTTPException(status_code=400, detail="Bạn không thể tự kích chính mình. Hãy dùng chức năng Rời Nhóm.")
 
-    member = db.query(SubjectChannelMember).filter(
-        SubjectChannelMember.channel_id == channel_id,
-        SubjectChannelMember.user_id == member_id
-    ).first()
+    member = await _get_member(db, channel_id, member_id)
     
     if not member:
         raise HTTPException(status_code=404, detail="Người dùng này không còn trong nhóm")
 
-    db.delete(member)
+    await db.delete(member)
     channel.member_count = max(0, (channel.member_count or 1) - 1)
-    db.commit()
+    await db.commit()
     return {"message": "Thành viên đã bị mời ra khỏi nhóm"}
 
 
 @router.delete("/channels/{channel_id}/messages/{message_id}")
-async def delete_channel_message(channel_id: int, message_id: int, user_id: int, db: Session = Depends(get_db)):
+async def delete_channel_message(channel_id: int, message_id: int, user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Xóa / Thu hồi tin nhắn - Dành cho người gửi hoặc Creator"""
-    msg = db.query(SubjectChannelMessage).filter(SubjectChannelMessage.id == message_id).first()
+    msg = await db.get(SubjectChannelMessage, message_id)
     if not msg:
         raise HTTPException(status_code=404, detail="Tin nhắn không tồn tại")
     
-    channel = db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
+    channel = await db.get(SubjectChannel, channel_id)
     
     if msg.user_id != user_id:
         raise HTTPException(status_code=403, detail="Bạn không có quyền thu hồi tin nhắn của người khác")
         
     msg.message = "Tin nhắn đã bị thu hồi"
     msg.message_type = "recalled"
-    db.commit()
+    await db.commit()
     return {"message": "Tin nhắn đã được thu hồi"}
 
 
@@ -481,14 +501,11 @@ async def upload_file_to_channel(
     user_id: int = Form(...),
     caption: str = Form(""),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload file (ảnh, tài liệu) vào channel chat"""
     # Kiểm tra thành viên
-    member = db.query(SubjectChannelMember).filter(
-        SubjectChannelMember.channel_id == channel_id,
-        SubjectChannelMember.user_id == user_id
-    ).first()
+    member = await _get_member(db, channel_id, user_id)
     if not member:
         raise HTTPException(status_code=403, detail="Bạn chưa tham gia channel này")
     
@@ -521,7 +538,7 @@ async def upload_file_to_channel(
         message=message_text, message_type=msg_type
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     
     return {"id": msg.id, "file_url": file_url, "message_type": msg_type, "message": "Đã gửi file"}
@@ -2,14 +2,15 @@
 Direct Message API - Chat riêng 1-1 giữa friends
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from ..database import get_db
-from ..models.models import DirectMessage, FriendRelationship, User
-from ..ai.ai_filter import is_toxic_message
+from ..database import get_async_db
+from ..models.models import DirectMessage, FriendRelationship
+from ..ai.ai_filter import is_toxic_message_async
+from ..utils.user_cards import UserCardLoader
 import os
 
 router = APIRouter(prefix="/api/dm", tags=["Direct Messages"])
@@ -36,36 +37,41 @@ class ConversationOut(BaseModel):
 
 
 @router.get("/conversations", response_model=List[ConversationOut])
-async def get_conversations(user_id: int, db: Session = Depends(get_db)):
+async def get_conversations(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Lấy danh sách conversations (friends có tin nhắn)"""
-    friends = db.query(FriendRelationship).filter(
-        FriendRelationship.user_id == user_id
-    ).all()
+    friends = (await db.execute(
+        select(FriendRelationship).where(FriendRelationship.user_id == user_id)
+    )).scalars().all()
 
+    cards = await UserCardLoader(db).load(rel.friend_id for rel in friends)
     result = []
     for rel in friends:
-        friend = db.query(User).filter(User.id == rel.friend_id).first()
+        friend = cards.get(rel.friend_id)
         if not friend:
             continue
 
         # Tin nhắn cuối
-        last_msg = db.query(DirectMessage).filter(
-            or_(
-                and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == rel.friend_id),
-                and_(DirectMessage.sender_id == rel.friend_id, DirectMessage.receiver_id == user_id)
-            )
-        ).order_by(DirectMessage.created_at.desc()).first()
+        last_msg = (await db.execute(
+            select(DirectMessage).where(
+                or_(
+                    and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == rel.friend_id),
+                    and_(DirectMessage.sender_id == rel.friend_id, DirectMessage.receiver_id == user_id)
+                )
+            ).order_by(DirectMessage.created_at.desc()).limit(1)
+        )).scalars().first()
 
         # Số tin chưa đọc
-        unread = db.query(DirectMessage).filter(
-            DirectMessage.sender_id == rel.friend_id,
-            DirectMessage.receiver_id == user_id,
-            DirectMessage.is_read == False
-        ).count()
+        unread = (await db.execute(
+            select(func.count(DirectMessage.id)).where(
+                DirectMessage.sender_id == rel.friend_id,
+                DirectMessage.receiver_id == user_id,
+                DirectMessage.is_read == False
+            )
+        )).scalar()
 
         result.append(ConversationOut(
             friend_id=friend.id,
-            friend_name=friend.full_name or friend.username,
+            friend_name=friend.display_name,
             friend_avatar=friend.avatar_url,
             last_message=last_msg.message if last_msg else None,
             last_time=last_msg.created_at if last_msg else rel.created_at,
@@ -77,29 +83,36 @@ async def get_conversations(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/{friend_id}/messages", response_model=List[DMOut])
-async def get_messages(friend_id: int, user_id: int, limit: int = 50, db: Session = Depends(get_db)):
+async def get_messages(friend_id: int, user_id: int, limit: int = 50, db: AsyncSession = Depends(get_async_db)):
     """Lấy lịch sử chat 1-1 với friend"""
-    messages = db.query(DirectMessage).filter(
-        or_(
-            and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == friend_id),
-            and_(DirectMessage.sender_id == friend_id, DirectMessage.receiver_id == user_id)
-        )
-    ).order_by(DirectMessage.created_at.desc()).limit(limit).all()
+    messages = (await db.execute(
+        select(DirectMessage).where(
+            or_(
+                and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == friend_id),
+                and_(DirectMessage.sender_id == friend_id, DirectMessage.receiver_id == user_id)
+            )
+        ).order_by(DirectMessage.created_at.desc()).limit(limit)
+    )).scalars().all()
 
     # Đánh dấu đã đọc
-    db.query(DirectMessage).filter(
-        DirectMessage.sender_id == friend_id,
-        DirectMessage.receiver_id == user_id,
-        DirectMessage.is_read == False
-    ).update({"is_read": True, "read_at": datetime.now()})
-    db.commit()
+    await db.execute(
+        update(DirectMessage)
+        .where(
+            DirectMessage.sender_id == friend_id,
+            DirectMessage.receiver_id == user_id,
+            DirectMessage.is_read == False
+        )
+        .values(is_read=True, read_at=datetime.now())
+    )
+    await db.commit()
 
+    cards = await UserCardLoader(db).load(msg.sender_id for msg in messages)
     result = []
     for msg in reversed(messages):
-        sender = db.query(User).filter(User.id == msg.sender_id).first()
+        sender = cards.get(msg.sender_id)
         result.append(DMOut(
             id=msg.id, sender_id=msg.sender_id, receiver_id=msg.receiver_id,
-            sender_name=sender.full_name or sender.username if sender else "Unknown",
+            sender_name=sender.display_name if sender else "Unknown",
             sender_avatar=sender.avatar_url if sender else None,
             message=msg.message, message_type=msg.message_type,
             is_read=msg.is_read, created_at=msg.created_at
@@ -108,10 +121,10 @@ async def get_messages(friend_id: int, user_id: int, limit: int = 50, db: Sessio
 
 
 @router.post("/{friend_id}/send")
-async def send_message(friend_id: int, user_id: int, message: str, db: Session = Depends(get_db)):
+async def send_message(friend_id: int, user_id: int, message: str, db: AsyncSession = Depends(get_async_db)):
     """Gửi tin nhắn (HTTP fallback, thường dùng WebSocket)"""
     # Bộ lọc AI kiểm tra
-    if is_toxic_message(message):
+    if await is_toxic_message_async(message):
         raise HTTPException(
             status_code=400, 
             detail="Tin nhắn của bạn chứa ngôn từ không phù hợp."
@@ -122,8 +135,8 @@ async def send_message(friend_id: int, user_id: int, message: str, db: Session =
         message=message, message_type="text"
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     return {"id": msg.id, "message": "Đã gửi"}
 
 
@@ -133,7 +146,7 @@ async def upload_file_dm(
     user_id: int = Form(...),
     caption: str = Form(""),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload file (ảnh, tài liệu) trong chat 1-1 với friend"""
     # Lưu file
@@ -162,7 +175,7 @@ async def upload_file_dm(
         message=message_text, message_type=msg_type
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     
     return {"id": msg.id, "file_url": file_url, "message_type": msg_type, "message": "Đã gửi file"}
@@ -10,6 +10,9 @@ from datetime import datetime
 from ..database import get_db
 from ..models.models import FriendRequest, FriendRelationship, User, UserProfile, Notification
 from .websocket import manager
+from ..utils.cache import invalidate_cache
+from ..utils.user_cards import UserCardLoader
+from ..purge import enqueue_purge, purge_worker
 
 router = APIRouter(prefix="/api/friends", tags=["Friends"])
 
@@ -89,9 +92,10 @@ async def send_friend_request(target_user_id: int, sender_id: int, message: str
     db.add(notif)
     db.commit()
     db.refresh(notif)
+    await invalidate_cache("/stms/notifications", notif.user_id)
 
     # Đẩy thông báo
-    if manager.is_online(target_user_id):
+    if await manager.is_online(target_user_id):
         await manager.send_personal(target_user_id, {
             "type": "new_notification",
             "event": "new_notification",
@@ -145,9 +149,10 @@ async def accept_friend_request(request_id: int, db: Session = Depends(get_db)):
     db.add(notif)
     db.commit()
     db.refresh(notif)
+    await invalidate_cache("/stms/notifications", notif.user_id)
 
     # Đẩy thông báo 
-    if manager.is_online(request.sender_id):
+    if await manager.is_online(request.sender_id):
         await manager.send_personal(request.sender_id, {
             "type": "new_notification",
             "event": "new_notification",
@@ -184,16 +189,16 @@ async def get_my_friends(user_id: int, db: Session = Depends(get_db)):
         FriendRelationship.user_id == user_id
     ).all()
 
+    cards = await UserCardLoader(db).load(rel.friend_id for rel in relationships)
     result = []
     for rel in relationships:
-        friend = db.query(User).filter(User.id == rel.friend_id).first()
+        friend = cards.get(rel.friend_id)
         if friend:
-            profile = db.query(UserProfile).filter(UserProfile.user_id == friend.id).first()
             result.append(FriendOut(
                 user_id=friend.id, username=friend.username,
                 full_name=friend.full_name, avatar_url=friend.avatar_url,
-                school_name=profile.school_name if profile else None,
-                grade_level=profile.grade_level if profile else None,
+                school_name=friend.school_name,
+                grade_level=friend.grade_level,
                 since=rel.created_at
             ))
     return result
@@ -207,12 +212,13 @@ async def get_pending_requests(user_id: int, db: Session = Depends(get_db)):
         FriendRequest.status == "pending"
     ).order_by(FriendRequest.created_at.desc()).all()
 
+    cards = await UserCardLoader(db).load(req.sender_id for req in requests)
     result = []
     for req in requests:
-        sender = db.query(User).filter(User.id == req.sender_id).first()
+        sender = cards.get(req.sender_id)
         result.append(RequestOut(
             id=req.id, sender_id=req.sender_id,
-            sender_name=sender.full_name or sender.username if sender else "Unknown",
+            sender_name=sender.display_name if sender else "Unknown",
             sender_avatar=sender.avatar_url if sender else None,
             message=req.message, status=req.status, created_at=req.created_at
         ))
@@ -221,18 +227,10 @@ async def get_pending_requests(user_id: int, db: Session = Depends(get_db)):
 
 @router.delete("/{friend_id}")
 async def remove_friend(friend_id: int, user_id: int, db: Session = Depends(get_db)):
-    """Hủy kết bạn - xóa sạch toàn bộ: quan hệ, tin nhắn, lời mời, thông báo"""
-    from ..models.models import DirectMessage, Notification
-
-    # 1. Xóa toàn bộ tin nhắn
-    db.query(DirectMessage).filter(
-        or_(
-            and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == friend_id),
-            and_(DirectMessage.sender_id == friend_id, DirectMessage.receiver_id == user_id)
-        )
-    ).delete(synchronize_session=False)
-
-    # 2. Xóa toàn bộ lời mời kết bạn 
+    """
+    Hủy kết bạn: xóa quan hệ + lời mời ngay (vài dòng); tin nhắn và thông báo giữa
+    hai người (có thể rất nhiều) xóa ở nền bằng purge job.
+    """
     db.query(FriendRequest).filter(
         or_(
             and_(FriendRequest.sender_id == user_id, FriendRequest.receiver_id == friend_id),
@@ -240,17 +238,6 @@ async def remove_friend(friend_id: int, user_id: int, db: Session = Depends(get_
         )
     ).delete(synchronize_session=False)
 
-    # 3. Xóa thông báo kết bạn
-    db.query(Notification).filter(
-        or_(
-            and_(Notification.user_id == user_id, Notification.sender_id == friend_id,
-                 Notification.notification_type.in_(["friend_request", "friend_accepted", "direct_message"])),
-            and_(Notification.user_id == friend_id, Notification.sender_id == user_id,
-                 Notification.notification_type.in_(["friend_request", "friend_accepted", "direct_message"]))
-        )
-    ).delete(synchronize_session=False)
-
-    # 4. Xóa bạn bè
     db.query(FriendRelationship).filter(
         or_(
             and_(FriendRelationship.user_id == user_id, FriendRelationship.friend_id == friend_id),
@@ -258,8 +245,10 @@ async def remove_friend(friend_id: int, user_id: int, db: Session = Depends(get_
         )
     ).delete(synchronize_session=False)
 
+    job = enqueue_purge(db, "friendship", user_id, params={"friend_id": friend_id}, requested_by=user_id)
     db.commit()
-    return {"message": "Đã hủy kết bạn và xóa toàn bộ dữ liệu liên quan"}
+    purge_worker.wake()
+    return {"message": "Đã hủy kết bạn và xóa toàn bộ dữ liệu liên quan", "purge_job_id": job.id}
 
 
 @router.get("/browse", response_model=List[BrowseUserOut])
@@ -288,9 +277,14 @@ async def browse_users(user_id: int, subject: Optional[str] = None, grade: Optio
     for p in pending:
         pending_ids.add(p.receiver_id)
 
+    # Profile của cả trang trong 1 query (trước đây 1 query mỗi user)
+    profiles = {
+        p.user_id: p for p in db.query(UserProfile).filter(UserProfile.user_id.in_([u.id for u in users])).all()
+    } if users else {}
+
     result = []
     for u in users:
-        profile = db.query(UserProfile).filter(UserProfile.user_id == u.id).first()
+        profile = profiles.get(u.id)
         result.append(BrowseUserOut(
             user_id=u.id, username=u.username,
             full_name=u.full_name, avatar_url=u.avatar_url,
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status, WebSocket, WebSocketDisconnect
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import json
-from ..database import get_db
+from ..database import get_async_db
 from ..models.models import Notification, User
 from ..utils.auth import get_current_active_user, get_current_user_ws
 from ..api.websocket import manager
+from ..utils.cache import conditional_response, invalidate_cache
+from ..utils.serializer import serialize
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -24,47 +27,67 @@ class NotificationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+async def _get_own_notification(db: AsyncSession, notification_id: int, user_id: int):
+    result = await db.execute(
+        select(Notification).where(Notification.id == notification_id, Notification.user_id == user_id)
+    )
+    return result.scalars().first()
+
 @router.get("/", response_model=List[NotificationResponse])
-async def get_notifications(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    return db.query(Notification).filter(Notification.user_id == current_user.id).order_by(Notification.created_at.desc()).all()
+async def get_notifications(request: Request, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    async def load() -> bytes:
+        result = await db.execute(
+            select(Notification).where(Notification.user_id == current_user.id).order_by(Notification.created_at.desc())
+        )
+        return serialize(List[NotificationResponse], result.scalars().all())
+
+    # If-None-Match khớp version -> 304, không query DB
+    return await conditional_response(request, "/stms/notifications", current_user.id, load)
 
 @router.put("/{notification_id}/read")
-async def mark_as_read(notification_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    notification = db.query(Notification).filter(Notification.id == notification_id, Notification.user_id == current_user.id).first()
+async def mark_as_read(notification_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    notification = await _get_own_notification(db, notification_id, current_user.id)
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     
     notification.is_read = True
     notification.read_at = datetime.now()
-    db.commit()
+    await db.commit()
+    await invalidate_cache("/stms/notifications", current_user.id)
     return {"message": "Notification marked as read"}
 
 @router.put("/read-all")
-async def mark_all_as_read(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    db.query(Notification).filter(Notification.user_id == current_user.id, Notification.is_read == False).update({
-        "is_read": True,
-        "read_at": datetime.now()
-    }, synchronize_session=False)
-    db.commit()
+async def mark_all_as_read(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    await db.execute(
+        update(Notification)
+        .where(Notification.user_id == current_user.id, Notification.is_read == False)
+        .values(is_read=True, read_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await invalidate_cache("/stms/notifications", current_user.id)
     return {"message": "All notifications marked as read"}
 
 @router.delete("/{notification_id}")
-async def delete_notification(notification_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    notification = db.query(Notification).filter(Notification.id == notification_id, Notification.user_id == current_user.id).first()
+async def delete_notification(notification_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    notification = await _get_own_notification(db, notification_id, current_user.id)
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
-    db.delete(notification)
-    db.commit()
+    await db.delete(notification)
+    await db.commit()
+    await invalidate_cache("/stms/notifications", current_user.id)
     return {"message": "Notification deleted"}
 
 # Cổng WebSockets
 @router.websocket("/ws/{token}")
-async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, token: str, db: AsyncSession = Depends(get_async_db)):
     """
     Cổng WebSocket cho thông báo real-time.
     Client phải truyền JWT token trong URL.
     """
-    user = get_current_user_ws(token, db)
+    user = await get_current_user_ws(token, db)
+    # Trả connection về pool, không giữ suốt vòng đời WebSocket
+    await db.close()
     if not user:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
@@ -75,10 +98,10 @@ async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Dep
             # Giữ kết nối
             data = await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user.id)
+        await manager.disconnect(websocket, user.id)
 
 # Hàm phụ trợ tạo thông báo và gửi qua WS
-async def create_and_broadcast_notification(db: Session, user_id: int, title: str, message: str, type: str = "system"):
+async def create_and_broadcast_notification(db: AsyncSession, user_id: int, title: str, message: str, type: str = "system"):
     new_notif = Notification(
         user_id=user_id,
         title=title,
@@ -86,8 +109,9 @@ async def create_and_broadcast_notification(db: Session, user_id: int, title: st
         type=type
     )
     db.add(new_notif)
-    db.commit()
-    db.refresh(new_notif)
+    await db.commit()
+    await db.refresh(new_notif)
+    await invalidate_cache("/stms/notifications", user_id)
     
     ws_message = {
         "event": "new_notification",
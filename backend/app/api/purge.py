@@ -0,0 +1,24 @@
+"""
+Purge Jobs API - Theo dõi tiến độ xóa dữ liệu chạy nền
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..models.models import PurgeJob
+from ..purge import job_progress
+from ..utils.auth import CurrentUser, get_current_async_user
+
+router = APIRouter(prefix="/stms/purge-jobs", tags=["Purge Jobs"])
+
+
+@router.get("/{job_id}")
+async def get_purge_job(
+    job_id: int,
+    current_user: CurrentUser = Depends(get_current_async_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Tiến độ 1 purge job (người yêu cầu hoặc admin)"""
+    job = await db.get(PurgeJob, job_id)
+    if not job or (job.requested_by != current_user.id and not current_user.is_admin):
+        raise HTTPException(status_code=404, detail="Job không tồn tại")
+    return job_progress(job)
@@ -9,7 +9,8 @@ from datetime import datetime
 import os
 import uuid
 from ..database import get_db
-from ..models.models import Resource, User
+from ..models.models import Resource
+from ..utils.user_cards import UserCardLoader
 
 router = APIRouter(prefix="/api/resources", tags=["Resources"])
 
@@ -108,12 +109,13 @@ async def get_resources(
 
     resources = query.order_by(Resource.created_at.desc()).limit(limit).all()
 
+    cards = await UserCardLoader(db).load(r.user_id for r in resources)
     result = []
     for r in resources:
-        user = db.query(User).filter(User.id == r.user_id).first()
+        user = cards.get(r.user_id)
         result.append(ResourceOut(
             id=r.id, user_id=r.user_id,
-            uploader_name=user.full_name or user.username if user else "Unknown",
+            uploader_name=user.display_name if user else "Unknown",
             uploader_avatar=user.avatar_url if user else None,
             title=r.title, description=r.description,
             subject_name=r.subject_name, grade_level=r.grade_level,
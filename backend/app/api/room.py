@@ -2,6 +2,7 @@
 Study Room API - Phòng học nhóm với Room Code
 """
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -9,7 +10,9 @@ from datetime import datetime
 import random
 import string
 from ..database import get_db
-from ..models.models import StudyRoom, StudyRoomMember, User
+from ..models.models import StudyRoom, StudyRoomMember, User, UserRole
+from ..purge import enqueue_purge, purge_worker
+from ..utils.user_cards import UserCardLoader
 
 router = APIRouter(prefix="/api/room", tags=["Room"])
 
@@ -124,7 +127,7 @@ async def get_my_rooms(user_id: int, db: Session = Depends(get_db)):
         StudyRoom.is_active == True
     ).order_by(StudyRoom.updated_at.desc()).all()
 
-    return _rooms_to_output(rooms, db)
+    return await _rooms_to_output(rooms, db)
 
 
 @router.get("/public", response_model=List[RoomOut])
@@ -134,63 +137,54 @@ async def get_public_rooms(subject: Optional[str] = None, limit: int = 20, db: S
     if subject:
         query = query.filter(StudyRoom.subject_name.ilike(f"%{subject}%"))
     rooms = query.order_by(StudyRoom.created_at.desc()).limit(limit).all()
-    return _rooms_to_output(rooms, db)
+    return await _rooms_to_output(rooms, db)
 
 
 @router.get("/{room_id}", response_model=RoomOut)
 async def get_room(room_id: int, db: Session = Depends(get_db)):
     """Chi tiết phòng"""
     room = db.query(StudyRoom).filter(StudyRoom.id == room_id).first()
-    if not room:
+    if not room or not room.is_active:
         raise HTTPException(status_code=404, detail="Phòng không tồn tại")
-    return _rooms_to_output([room], db)[0]
+    return (await _rooms_to_output([room], db))[0]
 
 
 @router.get("/{room_id}/members", response_model=List[RoomMemberOut])
 async def get_room_members(room_id: int, db: Session = Depends(get_db)):
     """Danh sách thành viên"""
-    members = db.query(StudyRoomMember).filter(StudyRoomMember.room_id == room_id).all()
-    result = []
-    for m in members:
-        user = db.query(User).filter(User.id == m.user_id).first()
-        is_admin = False
-        if user and user.roles:
-            is_admin = any(ur.role.role_name == "admin" for ur in user.roles)
-            
-        if user and not is_admin:
-            result.append(RoomMemberOut(
-                user_id=user.id, username=user.username,
-                full_name=user.full_name, avatar_url=user.avatar_url,
-                role=m.role, is_online=m.is_online, joined_at=m.joined_at
-            ))
-    return result
+    # 1 query: join user và loại admin ngay trong SQL thay vì query + lazy-load roles từng người
+    rows = db.query(StudyRoomMember, User).join(User, User.id == StudyRoomMember.user_id).filter(
+        StudyRoomMember.room_id == room_id,
+        ~User.roles.any(UserRole.role.has(role_name="admin"))
+    ).all()
+    return [
+        RoomMemberOut(
+            user_id=user.id, username=user.username,
+            full_name=user.full_name, avatar_url=user.avatar_url,
+            role=m.role, is_online=m.is_online, joined_at=m.joined_at
+        )
+        for m, user in rows
+    ]
 
 
 @router.delete("/{room_id}")
 async def close_room(room_id: int, user_id: int, db: Session = Depends(get_db)):
-    """Đóng phòng (host only) - Xóa hoàn toàn phòng, tin nhắn, thành viên"""
-    from ..models.models import StudyRoomMessage
-    
+    """Đóng phòng (host only) - Ẩn phòng ngay, tin nhắn/thành viên xóa ở nền (purge job)"""
     room = db.query(StudyRoom).filter(StudyRoom.id == room_id).first()
-    if not room:
+    if not room or not room.is_active:
         raise HTTPException(status_code=404, detail="Phòng không tồn tại")
     if room.host_id != user_id:
         raise HTTPException(status_code=403, detail="Chỉ host mới được đóng phòng")
-    
-    db.query(StudyRoomMessage).filter(StudyRoomMessage.room_id == room_id).delete()
-    db.query(StudyRoomMember).filter(StudyRoomMember.room_id == room_id).delete()
-    db.delete(room)
-    db.commit()
-    return {"message": "Đã xóa phòng hoàn toàn"}
+
+    job = _dissolve(room, user_id, db)
+    return {"message": "Đã xóa phòng hoàn toàn", "purge_job_id": job.id}
 
 
 @router.post("/{room_id}/leave")
 async def leave_room(room_id: int, user_id: int, db: Session = Depends(get_db)):
     """Rời phòng - Nếu host rời hoặc không còn ai → xóa phòng hoàn toàn (giống Zoom)"""
-    from ..models.models import StudyRoomMessage
-    
     room = db.query(StudyRoom).filter(StudyRoom.id == room_id).first()
-    if not room:
+    if not room or not room.is_active:
         return {"message": "Phòng không tồn tại"}
 
     member = db.query(StudyRoomMember).filter(
@@ -205,26 +199,40 @@ async def leave_room(room_id: int, user_id: int, db: Session = Depends(get_db)):
     is_host = (room.host_id == user_id)
 
     if is_host or remaining == 0:
-        db.query(StudyRoomMessage).filter(StudyRoomMessage.room_id == room_id).delete()
-        db.query(StudyRoomMember).filter(StudyRoomMember.room_id == room_id).delete()
-        db.delete(room)
-        db.commit()
-        return {"message": "Phòng đã được giải tán", "room_deleted": True}
+        job = _dissolve(room, user_id, db)
+        return {"message": "Phòng đã được giải tán", "room_deleted": True, "purge_job_id": job.id}
 
     db.commit()
     return {"message": "Đã rời phòng", "room_deleted": False}
 
 
-def _rooms_to_output(rooms, db):
+def _dissolve(room: StudyRoom, user_id: int, db: Session):
+    """Đánh dấu phòng đã đóng + tạo purge job trong cùng transaction"""
+    room.is_active = False
+    job = enqueue_purge(db, "room", room.id, requested_by=user_id)
+    db.commit()
+    purge_worker.wake()
+    return job
+
+
+async def _rooms_to_output(rooms, db):
+    # Host và số thành viên của cả danh sách: 1 lần đọc card + 1 query đếm gộp
+    cards = await UserCardLoader(db).load(room.host_id for room in rooms)
+    counts = dict(
+        db.query(StudyRoomMember.room_id, func.count(StudyRoomMember.id))
+        .filter(StudyRoomMember.room_id.in_([room.id for room in rooms]))
+        .group_by(StudyRoomMember.room_id)
+        .all()
+    ) if rooms else {}
     result = []
     for room in rooms:
-        host = db.query(User).filter(User.id == room.host_id).first()
-        count = db.query(StudyRoomMember).filter(StudyRoomMember.room_id == room.id).count()
+        host = cards.get(room.host_id)
+        count = counts.get(room.id, 0)
         result.append(RoomOut(
             id=room.id, room_code=room.room_code, name=room.name,
             description=room.description, subject_name=room.subject_name,
             host_id=room.host_id,
-            host_name=host.full_name or host.username if host else "Unknown",
+            host_name=host.display_name if host else "Unknown",
             max_participants=room.max_participants,
             current_participants=count,
             is_public=room.is_public, is_active=room.is_active,
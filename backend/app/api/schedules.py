@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, date
-from ..database import get_db
+from ..database import get_async_db
 from ..models.models import Schedule, User, Subject
 from ..utils.auth import get_current_active_user
-import json
-from ..utils.cache import redis_client, get_cache_key, invalidate_cache
+from ..utils.cache import CACHE_STALE_SECONDS, _etag_headers, cached_fetch, etag_matches, get_etag_version, invalidate_cache, not_modified
+from ..utils.serializer import json_response, serialize
 
 router = APIRouter(prefix="/stms/schedules", tags=["schedules"])
 
@@ -32,44 +33,47 @@ class ScheduleUpdate(ScheduleBase):
 class ScheduleResponse(ScheduleBase):
     id: int
     user_id: int
+    task_id: Optional[int] = None
     status: str
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+async def _get_own_schedule(db: AsyncSession, schedule_id: int, user_id: int):
+    result = await db.execute(select(Schedule).where(Schedule.id == schedule_id, Schedule.user_id == user_id))
+    return result.scalars().first()
+
+async def _load_schedules(db: AsyncSession, user_id: int) -> bytes:
+    print(f"[REDIS CACHE MISS] Querying DB for schedules of user {user_id}")
+    result = await db.execute(select(Schedule).where(Schedule.user_id == user_id))
+    return serialize(List[ScheduleResponse], result.scalars().all())
+
 @router.get("/", response_model=List[ScheduleResponse])
-async def get_schedules(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    cache_key = f"cache:/stms/schedules:user:{current_user.id}"
-    try:
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
-            print(f"[REDIS CACHE HIT] Served schedules for user {current_user.id}")
-            return json.loads(cached_data)
-    except Exception as e:
-        print(f"[REDIS ERROR] {str(e)}")
-
-    print(f"[REDIS CACHE MISS] Querying DB for schedules of user {current_user.id}")
-    schedules = db.query(Schedule).filter(Schedule.user_id == current_user.id).all()
-    
-    try:
-        schedules_list = []
-        for s in schedules:
-            d = s.__dict__.copy()
-            d.pop('_sa_instance_state', None)
-            for k, v in d.items():
-                if hasattr(v, 'isoformat'):
-                    d[k] = str(v)
-            schedules_list.append(d)
-        redis_client.setex(cache_key, 180, json.dumps(schedules_list))
-    except Exception as e:
-        print(f"[REDIS ERROR] Could not cache schedules: {str(e)}")
-        
-    return schedules
+async def get_schedules(request: Request, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    # If-None-Match khớp version -> 304, không chạm DB/cache body.
+    version, etag = await get_etag_version("/stms/schedules", current_user.id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # Single-flight + stale-while-revalidate: chỉ 1 request nạp lại khi cache hết hạn.
+    # Body phải ứng với version của ETag (cache cục bộ lưu ở version khác coi như miss)
+    body, source = await cached_fetch(
+        "/stms/schedules", current_user.id, db,
+        lambda session: _load_schedules(session, current_user.id),
+        expire_seconds=180, stale_seconds=CACHE_STALE_SECONDS, version=version,
+    )
+    if source != "db":
+        print(f"[CACHE HIT:{source}] Served schedules for user {current_user.id}")
+
+    # Trả thẳng JSON bytes đã serialize, không validate lại
+    return json_response(body, headers=_etag_headers(etag))
 
 @router.post("/", response_model=ScheduleResponse)
-async def create_schedule(schedule: ScheduleCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    subject = db.query(Subject).filter(Subject.id == schedule.subject_id, Subject.user_id == current_user.id).first()
+async def create_schedule(schedule: ScheduleCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    subject = (await db.execute(
+        select(Subject).where(Subject.id == schedule.subject_id, Subject.user_id == current_user.id)
+    )).scalars().first()
     if not subject:
         raise HTTPException(status_code=400, detail="Invalid subject ID")
 
@@ -79,41 +83,41 @@ async def create_schedule(schedule: ScheduleCreate, db: Session = Depends(get_db
         created_by=current_user.id
     )
     db.add(db_schedule)
-    db.commit()
-    db.refresh(db_schedule)
+    await db.commit()
+    await db.refresh(db_schedule)
 
     # Xóa cache
-    invalidate_cache("/stms/schedules", current_user.id)
+    await invalidate_cache("/stms/schedules", current_user.id)
 
     return db_schedule
 
 @router.put("/{schedule_id}", response_model=ScheduleResponse)
-async def update_schedule(schedule_id: int, schedule_update: ScheduleUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    db_schedule = db.query(Schedule).filter(Schedule.id == schedule_id, Schedule.user_id == current_user.id).first()
+async def update_schedule(schedule_id: int, schedule_update: ScheduleUpdate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    db_schedule = await _get_own_schedule(db, schedule_id, current_user.id)
     if not db_schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
     
     for key, value in schedule_update.model_dump().items():
         setattr(db_schedule, key, value)
     
-    db.commit()
-    db.refresh(db_schedule)
+    await db.commit()
+    await db.refresh(db_schedule)
 
     # Xóa cache
-    invalidate_cache("/stms/schedules", current_user.id)
+    await invalidate_cache("/stms/schedules", current_user.id)
 
     return db_schedule
 
 @router.delete("/{schedule_id}")
-async def delete_schedule(schedule_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    db_schedule = db.query(Schedule).filter(Schedule.id == schedule_id, Schedule.user_id == current_user.id).first()
+async def delete_schedule(schedule_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    db_schedule = await _get_own_schedule(db, schedule_id, current_user.id)
     if not db_schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
     
-    db.delete(db_schedule)
-    db.commit()
+    await db.delete(db_schedule)
+    await db.commit()
 
     # Xóa cache
-    invalidate_cache("/stms/schedules", current_user.id)
+    await invalidate_cache("/stms/schedules", current_user.id)
 
     return {"message": "Schedule deleted"}
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from typing import List
 from pydantic import BaseModel
 from ..database import get_db
 from ..models.models import Subject, User
 from ..utils.auth import get_current_active_user
+from ..utils.cache import conditional_response, invalidate_cache
+from ..utils.serializer import serialize
 import os
 import shutil
 
@@ -33,8 +35,13 @@ class SubjectResponse(SubjectBase):
         from_attributes = True
 
 @router.get("/", response_model=List[SubjectResponse])
-async def get_subjects(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    return db.query(Subject).filter(Subject.user_id == current_user.id).all()
+async def get_subjects(request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    async def load() -> bytes:
+        subjects = db.query(Subject).filter(Subject.user_id == current_user.id).all()
+        return serialize(List[SubjectResponse], subjects)
+
+    # If-None-Match khớp version -> 304, không query DB
+    return await conditional_response(request, "/stms/subjects", current_user.id, load)
 
 @router.post("/", response_model=SubjectResponse)
 async def create_subject(subject: SubjectCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -42,6 +49,7 @@ async def create_subject(subject: SubjectCreate, db: Session = Depends(get_db),
     db.add(db_subject)
     db.commit()
     db.refresh(db_subject)
+    await invalidate_cache("/stms/subjects", current_user.id)
     return db_subject
 
 @router.get("/{subject_id}", response_model=SubjectResponse)
@@ -62,6 +70,7 @@ async def update_subject(subject_id: int, subject_update: SubjectUpdate, db: Ses
     
     db.commit()
     db.refresh(db_subject)
+    await invalidate_cache("/stms/subjects", current_user.id)
     return db_subject
 
 @router.delete("/{subject_id}")
@@ -84,6 +93,10 @@ async def delete_subject(subject_id: int, db: Session = Depends(get_db), current
     
     db.delete(db_subject)
     db.commit()
+    # Task bị gỡ subject_id, schedule của môn bị xóa -> các list đó cũng đổi
+    await invalidate_cache("/stms/subjects", current_user.id)
+    await invalidate_cache("/stms/tasks", current_user.id)
+    await invalidate_cache("/stms/schedules", current_user.id)
     return {"message": "Đã xóa môn học và toàn bộ dữ liệu liên quan"}
 
 # Tài liệu môn học
@@ -1,17 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from pydantic import BaseModel
-from datetime import datetime
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select, update, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from pydantic import BaseModel, create_model
+from datetime import datetime, timedelta
+from functools import lru_cache
+from ..database import get_async_db
 from ..models.models import Task, User, Subject, TaskGroup
 from ..utils.auth import get_current_active_user
+import asyncio
+import base64
+import hashlib
 import json
 import os
 import shutil
-from ..utils.cache import redis_client, get_cache_key, invalidate_cache
+from ..utils.cache import CACHE_STALE_SECONDS, _etag_headers, cached_fetch, etag_matches, get_etag_version, invalidate_cache, not_modified
+from ..utils.serializer import json_response, serialize
 from fastapi import UploadFile, File
-from decimal import Decimal
 
 router = APIRouter(prefix="/stms/tasks", tags=["tasks"])
 
@@ -71,43 +76,168 @@ class GroupResponse(BaseModel):
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=List[TaskResponse])
-async def get_tasks(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    cache_key = f"cache:/stms/tasks:user:{current_user.id}"
-    try:
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
-            print(f"[REDIS CACHE HIT] Served tasks for user {current_user.id}")
-            return json.loads(cached_data)
-    except Exception as e:
-        print(f"[REDIS ERROR] {str(e)}")
-
-    print(f"[REDIS CACHE MISS] Querying DB for tasks of user {current_user.id}")
-    tasks = db.query(Task).filter(Task.user_id == current_user.id).all()
-    
-    # Cache kết quả thủ công
+async def _get_own_task(db: AsyncSession, task_id: int, user_id: int):
+    result = await db.execute(select(Task).where(Task.id == task_id, Task.user_id == user_id))
+    return result.scalars().first()
+
+class TaskQuery(BaseModel):
+    """Bộ lọc + phân trang của GET /stms/tasks (đã chuẩn hóa, dùng làm cache key)"""
+    status: Optional[List[str]] = None
+    subject_id: Optional[int] = None
+    group_id: Optional[int] = None
+    due_from: Optional[datetime] = None
+    due_to: Optional[datetime] = None
+    top_level: Optional[bool] = None
+    parent_task_id: Optional[int] = None
+    is_reviewable: Optional[bool] = None
+    fields: Optional[List[str]] = None
+    limit: Optional[int] = None
+    after_id: Optional[int] = None
+
+    def cache_path(self) -> str:
+        """Mỗi tổ hợp lọc 1 key, cùng namespace /stms/tasks nên invalidate_cache xóa hết"""
+        params = self.model_dump(exclude_none=True, mode="json")
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+        return f"/stms/tasks/q/{digest}"
+
+
+def _split_list(value: Optional[str]) -> Optional[List[str]]:
+    items = sorted({item.strip() for item in (value or "").split(",") if item.strip()})
+    return items or None
+
+
+def _encode_cursor(task_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": task_id}).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
     try:
-        tasks_list = []
-        for t in tasks:
-            d = t.__dict__.copy()
-            d.pop('_sa_instance_state', None)
-            for k, v in d.items():
-                if hasattr(v, 'isoformat'):
-                    d[k] = str(v)
-                elif isinstance(v, Decimal):
-                    d[k] = float(v)
-            tasks_list.append(d)
-        redis_client.setex(cache_key, 180, json.dumps(tasks_list)) # cache 3 phút
-    except Exception as e:
-        print(f"[REDIS ERROR] Could not cache tasks: {str(e)}")
-        
-    return tasks
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(data["after"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@lru_cache(maxsize=128)
+def _projection_model(fields: tuple):
+    """Response model chỉ gồm các trường được chọn (fields=id,title,status,...)"""
+    return create_model(
+        "TaskProjection",
+        **{name: (info.annotation, info) for name, info in TaskResponse.model_fields.items() if name in fields},
+    )
+
+
+def _task_filters(user_id: int, q: TaskQuery) -> list:
+    filters = [Task.user_id == user_id]
+    if q.status:
+        filters.append(Task.status.in_(q.status))
+    if q.subject_id is not None:
+        filters.append(Task.subject_id == q.subject_id)
+    if q.group_id is not None:
+        filters.append(Task.group_id == q.group_id)
+    if q.due_from is not None:
+        filters.append(Task.due_date >= q.due_from)
+    if q.due_to is not None:
+        filters.append(Task.due_date <= q.due_to)
+    if q.top_level is not None:
+        filters.append(Task.parent_task_id.is_(None) if q.top_level else Task.parent_task_id.isnot(None))
+    if q.parent_task_id is not None:
+        filters.append(Task.parent_task_id == q.parent_task_id)
+    if q.is_reviewable is not None:
+        filters.append(Task.is_reviewable == q.is_reviewable)
+    if q.after_id is not None:
+        filters.append(Task.id > q.after_id)
+    return filters
+
+
+async def _load_tasks(db: AsyncSession, user_id: int, q: TaskQuery) -> bytes:
+    """
+    JSON bytes của 1 trang task. Cache lưu kèm cursor trang sau ở dòng đầu
+    (`<cursor>\n<json>`) để lần hit trả header X-Next-Cursor mà không phải parse body.
+    """
+    print(f"[REDIS CACHE MISS] Querying DB for tasks of user {user_id}")
+    if q.fields:
+        model = _projection_model(tuple(q.fields))
+        stmt = select(*[getattr(Task, name) for name in q.fields])
+    else:
+        model = TaskResponse
+        stmt = select(Task)
+    # Keyset theo id: trang sau = id > id cuối của trang trước (index tasks(user_id, id))
+    stmt = stmt.where(*_task_filters(user_id, q)).order_by(Task.id)
+    if q.limit:
+        stmt = stmt.limit(q.limit + 1)
+    result = await db.execute(stmt)
+    rows = [row._mapping for row in result] if q.fields else list(result.scalars())
+    next_cursor = b""
+    if q.limit and len(rows) > q.limit:
+        rows = rows[:q.limit]
+        next_cursor = _encode_cursor(rows[-1]["id"] if q.fields else rows[-1].id).encode()
+    return next_cursor + b"\n" + serialize(List[model], rows)
+
+
+@router.get("/", response_model=List[TaskResponse])
+async def get_tasks(
+    request: Request,
+    status: Optional[str] = Query(None, description="Lọc theo trạng thái, nhiều giá trị cách nhau bởi dấu phẩy"),
+    subject_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    top_level: Optional[bool] = Query(None, description="true: chỉ task gốc, false: chỉ subtask"),
+    parent_task_id: Optional[int] = None,
+    is_reviewable: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description="Chỉ trả các trường này, vd: id,title,status,due_date"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Số task mỗi trang; không truyền = trả tất cả"),
+    cursor: Optional[str] = Query(None, description="Giá trị header X-Next-Cursor của trang trước"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Danh sách task (sắp theo id). Có `limit` thì phân trang keyset: header
+    X-Next-Cursor chứa cursor trang sau (không có header = trang cuối).
+    """
+    selected = _split_list(fields)
+    if selected:
+        unknown = set(selected) - set(TaskResponse.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        selected = sorted(set(selected) | {"id"})
+    q = TaskQuery(
+        status=_split_list(status), subject_id=subject_id, group_id=group_id, due_from=due_from, due_to=due_to,
+        top_level=top_level, parent_task_id=parent_task_id, is_reviewable=is_reviewable,
+        fields=selected, limit=limit, after_id=_decode_cursor(cursor) if cursor else None,
+    )
+    path = q.cache_path()
+
+    # If-None-Match khớp version -> 304, không chạm DB/cache body.
+    version, etag = await get_etag_version(path, current_user.id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # Single-flight + stale-while-revalidate: chỉ 1 request nạp lại khi cache hết hạn.
+    # Body phải ứng với version của ETag (cache cục bộ lưu ở version khác coi như miss)
+    cached, source = await cached_fetch(
+        path, current_user.id, db,
+        lambda session: _load_tasks(session, current_user.id, q),
+        expire_seconds=180, stale_seconds=CACHE_STALE_SECONDS, version=version,
+    )
+    if source != "db":
+        print(f"[CACHE HIT:{source}] Served tasks for user {current_user.id}")
+
+    # Trả thẳng JSON bytes đã serialize, không validate lại
+    next_cursor, _, body = cached.partition(b"\n")
+    headers = _etag_headers(etag) or {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor.decode()
+    return json_response(body, headers=headers)
 
 @router.post("/", response_model=TaskResponse)
-async def create_task(task: TaskCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
     # Kiểm tra môn học thuộc về user
     if task.subject_id:
-        subject = db.query(Subject).filter(Subject.id == task.subject_id, Subject.user_id == current_user.id).first()
+        subject = (await db.execute(
+            select(Subject).where(Subject.id == task.subject_id, Subject.user_id == current_user.id)
+        )).scalars().first()
         if not subject:
             raise HTTPException(status_code=400, detail="Invalid subject ID")
 
@@ -118,125 +248,168 @@ async def create_task(task: TaskCreate, db: Session = Depends(get_db), current_u
         status="pending"
     )
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task)
     
     # Xóa cache
-    invalidate_cache("/stms/tasks", current_user.id)
+    await invalidate_cache("/stms/tasks", current_user.id)
     
     return db_task
 
 @router.put("/{task_id}", response_model=TaskResponse)
-async def update_task(task_id: int, task_update: TaskUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    db_task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+async def update_task(task_id: int, task_update: TaskUpdate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    db_task = await _get_own_task(db, task_id, current_user.id)
     if not db_task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    old_subject_id = db_task.subject_id
     for key, value in task_update.model_dump().items():
         setattr(db_task, key, value)
     
     if task_update.status == "completed" and not db_task.completion_date:
         db_task.completion_date = datetime.now()
         db_task.completion_percentage = 100
-    
-    db.commit()
-    db.refresh(db_task)
+
+    moved = {task_id: db_task.subject_id} if db_task.subject_id != old_subject_id else {}
+    await _sync_linked_schedules(db, current_user.id, moved)
+    await db.commit()
+    await db.refresh(db_task)
 
     # Xóa cache
-    invalidate_cache("/stms/tasks", current_user.id)
+    await invalidate_cache("/stms/tasks", current_user.id)
+    if moved:
+        await invalidate_cache("/stms/schedules", current_user.id)
 
     return db_task
 
-@router.delete("/{task_id}")
-async def delete_task(task_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def _sync_linked_schedules(db: AsyncSession, user_id: int, subjects: dict):
+    """Task đổi môn học -> lịch auto-schedule của task ({task_id: subject_id mới}) đổi theo"""
+    from ..models.models import Schedule
+
+    by_subject = {}
+    for task_id, subject_id in subjects.items():
+        by_subject.setdefault(subject_id, []).append(task_id)
+    for subject_id, task_ids in by_subject.items():
+        await db.execute(update(Schedule).where(
+            Schedule.user_id == user_id, Schedule.task_id.in_(task_ids)
+        ).values(subject_id=subject_id).execution_options(synchronize_session=False))
+
+
+async def _delete_tasks(db: AsyncSession, user_id: int, tasks: List[Task]) -> List[str]:
+    """
+    Xóa các task (kèm subtask, chat, pomodoro, lịch auto-schedule) bằng vài câu
+    DELETE ... IN, không commit. Trả về đường dẫn file đính kèm để xóa sau commit.
+    """
     from ..models.models import PomodoroSession, TaskChatHistory, Schedule
-    
-    db_task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
-    if not db_task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    # Xóa subtask
-    db.query(Task).filter(Task.parent_task_id == task_id).delete(synchronize_session=False)
 
-    db.query(TaskChatHistory).filter(TaskChatHistory.task_id == task_id).delete(synchronize_session=False)
+    task_ids = [t.id for t in tasks]
+    subtask_ids = (await db.execute(select(Task.id).where(Task.parent_task_id.in_(task_ids)))).scalars().all()
+    all_ids = list(set(task_ids) | set(subtask_ids))
+
+    await db.execute(delete(TaskChatHistory).where(TaskChatHistory.task_id.in_(all_ids)).execution_options(synchronize_session=False))
+    await db.execute(delete(PomodoroSession).where(PomodoroSession.task_id.in_(all_ids)).execution_options(synchronize_session=False))
+
+    # Xóa lịch auto-schedule tạo cho task (liên kết qua schedules.task_id)
+    await db.execute(delete(Schedule).where(
+        Schedule.user_id == user_id, Schedule.task_id.in_(all_ids)
+    ).execution_options(synchronize_session=False))
 
-    db.query(PomodoroSession).filter(PomodoroSession.task_id == task_id).delete(synchronize_session=False)
+    # Subtask trước (id lớn hơn cha, tham chiếu parent_task_id) rồi tới task
+    if subtask_ids:
+        await db.execute(delete(Task).where(Task.id.in_(subtask_ids)).execution_options(synchronize_session=False))
+    await db.execute(delete(Task).where(Task.id.in_(task_ids)).execution_options(synchronize_session=False))
 
-    # Xóa lịch liên quan đến task (auto-schedule tạo ra)
-    task_title = db_task.title
-    if task_title:
-        db.query(Schedule).filter(
-            Schedule.user_id == current_user.id,
-            Schedule.title.contains(task_title)
-        ).delete(synchronize_session=False)
+    paths = []
+    for t in tasks:
+        if t.attachments:
+            try:
+                paths.extend(f["path"] for f in json.loads(t.attachments) if f.get("path"))
+            except Exception:
+                pass
+    return paths
 
-    if db_task.attachments:
+
+def _remove_files(paths: List[str]):
+    for path in paths:
         try:
-            files = json.loads(db_task.attachments)
-            for f in files:
-                if os.path.exists(f.get("path", "")):
-                    os.remove(f["path"])
+            if os.path.exists(path):
+                os.remove(path)
         except Exception:
             pass
 
-    # 5. Xóa nhiệm vụ
-    db.delete(db_task)
-    db.commit()
+
+@router.delete("/{task_id}")
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    db_task = await _get_own_task(db, task_id, current_user.id)
+    if not db_task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    paths = await _delete_tasks(db, current_user.id, [db_task])
+    await db.commit()
+    await asyncio.to_thread(_remove_files, paths)
 
     # Xóa cache
-    invalidate_cache("/stms/tasks", current_user.id)
-    invalidate_cache("/stms/schedules", current_user.id)
+    await invalidate_cache("/stms/tasks", current_user.id)
+    await invalidate_cache("/stms/schedules", current_user.id)
 
     return {"message": "Đã xóa nhiệm vụ và toàn bộ dữ liệu liên quan"}
 
 class TaskReview(BaseModel):
     quality: int
 
+def _sm2_review(repetitions: int, interval: int, easiness_factor, q: int) -> dict:
+    """Thuật toán SM-2: giá trị mới của các cột sm2_* sau 1 lần ôn với điểm q (0-5)"""
+    repetitions = repetitions or 0
+    interval = interval or 0
+    if q >= 3:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = int(round(interval * float(easiness_factor)))
+        repetitions += 1
+    else:
+        repetitions = 0
+        interval = 1
+
+    ef = float(easiness_factor) + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    if ef < 1.3:
+        ef = 1.3
+
+    return {
+        "is_reviewable": True,
+        "sm2_interval": interval,
+        "sm2_repetitions": repetitions,
+        "sm2_easiness_factor": ef,
+        "next_review_date": datetime.now() + timedelta(days=interval),
+    }
+
 @router.post("/{task_id}/review", response_model=TaskResponse)
-async def review_task(task_id: int, review: TaskReview, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def review_task(task_id: int, review: TaskReview, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
     """
     Gửi điểm đánh giá (0-5) để tính ngày ôn tập tiếp theo bằng thuật toán SM-2.
     """
-    db_task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+    db_task = await _get_own_task(db, task_id, current_user.id)
     if not db_task:
         raise HTTPException(status_code=404, detail="Task not found")
         
     q = review.quality
     if q < 0 or q > 5:
         raise HTTPException(status_code=400, detail="Quality must be between 0 and 5")
-        
-    if not db_task.is_reviewable:
-        db_task.is_reviewable = True
-        
-    if q >= 3:
-        if db_task.sm2_repetitions == 0:
-            db_task.sm2_interval = 1
-        elif db_task.sm2_repetitions == 1:
-            db_task.sm2_interval = 6
-        else:
-            db_task.sm2_interval = int(round(db_task.sm2_interval * float(db_task.sm2_easiness_factor)))
-        db_task.sm2_repetitions += 1
-    else:
-        db_task.sm2_repetitions = 0
-        db_task.sm2_interval = 1
-        
-    ef = float(db_task.sm2_easiness_factor) + (0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
-    if ef < 1.3:
-        ef = 1.3
-    db_task.sm2_easiness_factor = ef
-    
-    from datetime import timedelta
-    db_task.next_review_date = datetime.now() + timedelta(days=db_task.sm2_interval)
-    
-    db.commit()
-    db.refresh(db_task)
-    invalidate_cache("/stms/tasks", current_user.id)
+
+    for key, value in _sm2_review(db_task.sm2_repetitions, db_task.sm2_interval, db_task.sm2_easiness_factor, q).items():
+        setattr(db_task, key, value)
+
+    await db.commit()
+    await db.refresh(db_task)
+    await invalidate_cache("/stms/tasks", current_user.id)
     
     return db_task
 
 @router.post("/{task_id}/upload")
-async def upload_task_file(task_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    db_task = db.query(Task).filter(Task.id == task_id, Task.user_id == current_user.id).first()
+async def upload_task_file(task_id: int, file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    db_task = await _get_own_task(db, task_id, current_user.id)
     if not db_task:
         raise HTTPException(status_code=404, detail="Task not found")
 
@@ -250,31 +423,272 @@ async def upload_task_file(task_id: int, file: UploadFile = File(...), db: Sessi
     existing = json.loads(db_task.attachments) if db_task.attachments else []
     existing.append({"name": file.filename, "path": file_path})
     db_task.attachments = json.dumps(existing)
-    db.commit()
+    await db.commit()
 
-    invalidate_cache("/stms/tasks", current_user.id)
+    await invalidate_cache("/stms/tasks", current_user.id)
     return {"message": "File uploaded", "files": existing}
 
+# Thao tác hàng loạt
+BULK_MAX_OPERATIONS = int(os.getenv("TASK_BULK_MAX_OPERATIONS", "200"))
+
+class TaskPatch(BaseModel):
+    """Cập nhật một phần: chỉ các trường được gửi lên"""
+    title: Optional[str] = None
+    description: Optional[str] = None
+    subject_id: Optional[int] = None
+    task_type: Optional[str] = None
+    priority: Optional[str] = None
+    difficulty: Optional[str] = None
+    due_date: Optional[datetime] = None
+    estimated_duration: Optional[int] = None
+    group_id: Optional[int] = None
+    parent_task_id: Optional[int] = None
+    is_reviewable: Optional[bool] = None
+    status: Optional[str] = None
+    completion_percentage: Optional[int] = None
+    actual_duration: Optional[int] = None
+
+class BulkTaskOperation(BaseModel):
+    op: Literal["create", "update", "delete", "review"]
+    id: Optional[int] = None                # update / delete / review
+    task: Optional[TaskCreate] = None       # create
+    ref: Optional[str] = None               # create: tên tạm để các create sau tham chiếu
+    parent_ref: Optional[str] = None        # create: subtask của 1 create trước đó trong batch
+    changes: Optional[TaskPatch] = None     # update
+    quality: Optional[int] = None           # review (0-5)
+
+class BulkTaskRequest(BaseModel):
+    operations: List[BulkTaskOperation]
+    # True: 1 thao tác lỗi -> không áp dụng gì (400); False: bỏ qua thao tác lỗi
+    atomic: bool = True
+
+class BulkTaskResult(BaseModel):
+    index: int
+    op: str
+    ok: bool
+    id: Optional[int] = None
+    ref: Optional[str] = None
+    error: Optional[str] = None
+
+
+# Cột NOT NULL (title) hoặc bắt buộc trong TaskResponse: patch không được đặt về null
+_NON_NULL_FIELDS = ("title", "task_type", "priority", "status", "completion_percentage", "is_reviewable")
+
+
+def _creates_cycle(tree: dict, task_id: int, parent_id: int) -> bool:
+    """Đặt parent_id làm cha của task_id có tạo vòng lặp không (duyệt chuỗi cha trong tree)"""
+    seen = set()
+    while parent_id is not None and parent_id not in seen:
+        if parent_id == task_id:
+            return True
+        seen.add(parent_id)
+        parent_id = tree.get(parent_id)
+    return False
+
+
+def _validate_bulk(ops: List[BulkTaskOperation], owned: dict, subject_ids: set, parents: dict) -> List[Optional[str]]:
+    """
+    Lỗi của từng thao tác (None = hợp lệ), không chạm DB. parents: id -> parent_task_id
+    của các task được tham chiếu và tổ tiên của chúng.
+    """
+    errors: List[Optional[str]] = []
+    refs = set()
+    deleted = {op.id for op in ops if op.op == "delete"}
+    # Cây cha-con sau các update hợp lệ (áp dụng theo thứ tự gửi)
+    tree = dict(parents)
+    for op in ops:
+        error = None
+        if op.op == "create":
+            if op.task is None:
+                error = "Missing task"
+            elif op.ref is not None and op.ref in refs:
+                error = f"Duplicate ref: {op.ref}"
+            elif op.parent_ref is not None and op.parent_ref not in refs:
+                error = f"Unknown parent_ref: {op.parent_ref}"
+            elif op.parent_ref is not None and op.task.parent_task_id is not None:
+                error = "Use either parent_ref or task.parent_task_id"
+            elif op.task.parent_task_id is not None and op.task.parent_task_id not in owned:
+                error = "Parent task not found"
+            elif op.task.parent_task_id in deleted:
+                # Delete chạy sau cùng và xóa cả subtask: task mới sẽ mất theo cha
+                error = "Parent task is deleted in the same batch"
+            elif op.task.subject_id and op.task.subject_id not in subject_ids:
+                error = "Invalid subject ID"
+            if op.ref is not None:
+                refs.add(op.ref)
+        elif op.id is None or op.id not in owned:
+            error = "Task not found"
+        elif op.op != "delete" and op.id in deleted:
+            error = "Task is deleted in the same batch"
+        elif op.op == "update":
+            changes = op.changes.model_dump(exclude_unset=True) if op.changes else {}
+            null_fields = [field for field in _NON_NULL_FIELDS if field in changes and changes[field] is None]
+            if not changes:
+                error = "Missing changes"
+            elif null_fields:
+                error = f"Field cannot be null: {', '.join(null_fields)}"
+            elif changes.get("parent_task_id") == op.id:
+                error = "Task cannot be its own parent"
+            elif changes.get("subject_id") and changes["subject_id"] not in subject_ids:
+                error = "Invalid subject ID"
+            elif changes.get("parent_task_id") is not None and changes["parent_task_id"] not in owned:
+                error = "Parent task not found"
+            elif changes.get("parent_task_id") in deleted:
+                error = "Parent task is deleted in the same batch"
+            elif changes.get("parent_task_id") is not None and _creates_cycle(tree, op.id, changes["parent_task_id"]):
+                error = "Parent chain would form a cycle"
+            elif "parent_task_id" in changes:
+                tree[op.id] = changes["parent_task_id"]
+        elif op.op == "review" and (op.quality is None or not 0 <= op.quality <= 5):
+            error = "Quality must be between 0 and 5"
+        errors.append(error)
+
+    # Task giữ cha cũ nhưng cha bị xóa trong batch: bị xóa theo như subtask, không báo ok
+    for i, op in enumerate(ops):
+        if errors[i] is None and op.op in ("update", "review") and tree.get(op.id) in deleted:
+            errors[i] = "Parent task is deleted in the same batch"
+    return errors
+
+
+@router.post("/bulk", response_model=List[BulkTaskResult])
+async def bulk_tasks(body: BulkTaskRequest, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    """
+    Nhiều thao tác create/update/delete/review trong 1 transaction (áp dụng AI breakdown,
+    sắp xếp lại bảng, hoàn thành/xóa nhiều task). Thứ tự áp dụng: create (cha trước con),
+    update/review theo thứ tự gửi, cuối cùng delete. Cache chỉ bị xóa 1 lần.
+    """
+    ops = body.operations
+    if not ops:
+        return []
+    if len(ops) > BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_OPERATIONS} operations per request")
+    user_id = current_user.id
+
+    # Quyền sở hữu: 1 query cho mọi task được tham chiếu, 1 query cho môn học
+    task_ids = {op.id for op in ops if op.id is not None}
+    task_ids |= {op.task.parent_task_id for op in ops if op.task and op.task.parent_task_id}
+    task_ids |= {op.changes.parent_task_id for op in ops if op.changes and op.changes.parent_task_id}
+    owned = {}
+    if task_ids:
+        rows = (await db.execute(select(Task).where(Task.id.in_(task_ids), Task.user_id == user_id))).scalars().all()
+        owned = {t.id: t for t in rows}
+    # Chuỗi cha của các task được tham chiếu (mỗi tầng 1 query) để chặn vòng lặp khi đổi cha
+    parents = {t.id: t.parent_task_id for t in owned.values()}
+    if any(op.changes and op.changes.parent_task_id for op in ops):
+        missing = {p for p in parents.values() if p is not None and p not in parents}
+        while missing:
+            rows = (await db.execute(
+                select(Task.id, Task.parent_task_id).where(Task.id.in_(missing), Task.user_id == user_id)
+            )).all()
+            parents.update({row.id: row.parent_task_id for row in rows})
+            missing = {row.parent_task_id for row in rows if row.parent_task_id is not None and row.parent_task_id not in parents}
+    wanted_subjects = {op.task.subject_id for op in ops if op.task and op.task.subject_id}
+    wanted_subjects |= {op.changes.subject_id for op in ops if op.changes and op.changes.subject_id}
+    subject_ids = set()
+    if wanted_subjects:
+        subject_ids = set((await db.execute(
+            select(Subject.id).where(Subject.id.in_(wanted_subjects), Subject.user_id == user_id)
+        )).scalars().all())
+
+    errors = _validate_bulk(ops, owned, subject_ids, parents)
+    results = [
+        BulkTaskResult(index=i, op=op.op, ok=error is None, id=op.id, ref=op.ref, error=error)
+        for i, (op, error) in enumerate(zip(ops, errors))
+    ]
+    if body.atomic and any(errors):
+        raise HTTPException(status_code=400, detail={
+            "message": "No operation applied",
+            "results": [r.model_dump() for r in results],
+        })
+    valid = [i for i, error in enumerate(errors) if error is None]
+
+    # 1. Create: INSERT nhiều dòng 1 lần cho mỗi tầng (task gốc, rồi subtask theo parent_ref)
+    ref_ids = {}
+    creates = [i for i in valid if ops[i].op == "create"]
+    while creates:
+        wave = [i for i in creates if ops[i].parent_ref is None or ops[i].parent_ref in ref_ids]
+        if not wave:
+            # parent_ref trỏ tới create bị bỏ qua (atomic=False)
+            for i in creates:
+                results[i].ok, results[i].error = False, f"Parent {ops[i].parent_ref} was not created"
+            break
+        rows = []
+        for i in wave:
+            values = ops[i].task.model_dump()
+            if ops[i].parent_ref is not None:
+                values["parent_task_id"] = ref_ids[ops[i].parent_ref]
+            rows.append({**values, "user_id": user_id, "created_by": user_id, "status": "pending"})
+        new_ids = (await db.execute(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True), rows
+        )).scalars().all()
+        for i, new_id in zip(wave, new_ids):
+            results[i].id = new_id
+            if ops[i].ref is not None:
+                ref_ids[ops[i].ref] = new_id
+        creates = [i for i in creates if i not in wave]
+
+    # 2. Update / review: gộp thay đổi theo task rồi UPDATE theo khóa chính 1 lần
+    changes = {}
+    for i in valid:
+        op = ops[i]
+        if op.op not in ("update", "review"):
+            continue
+        task = owned[op.id]
+        current = changes.setdefault(op.id, {})
+        if op.op == "update":
+            current.update(op.changes.model_dump(exclude_unset=True))
+            if current.get("status") == "completed" and not task.completion_date:
+                current.setdefault("completion_date", datetime.now())
+                current["completion_percentage"] = 100
+        else:
+            state = {key: current.get(key, getattr(task, key)) for key in ("sm2_repetitions", "sm2_interval", "sm2_easiness_factor")}
+            current.update(_sm2_review(state["sm2_repetitions"], state["sm2_interval"], state["sm2_easiness_factor"], op.quality))
+    moved = {
+        task_id: values["subject_id"] for task_id, values in changes.items()
+        if "subject_id" in values and values["subject_id"] != owned[task_id].subject_id
+    }
+    if changes:
+        await db.execute(update(Task), [{"id": task_id, **values} for task_id, values in changes.items()])
+    await _sync_linked_schedules(db, user_id, moved)
+
+    # 3. Delete (cascade như DELETE /{task_id})
+    to_delete = list({ops[i].id: owned[ops[i].id] for i in valid if ops[i].op == "delete"}.values())
+    paths = await _delete_tasks(db, user_id, to_delete) if to_delete else []
+
+    await db.commit()
+    if paths:
+        await asyncio.to_thread(_remove_files, paths)
+
+    await invalidate_cache("/stms/tasks", user_id)
+    if to_delete or moved:
+        await invalidate_cache("/stms/schedules", user_id)
+    return results
+
 # Task Groups
 @router.get("/groups", response_model=List[GroupResponse])
-async def get_groups(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    return db.query(TaskGroup).filter(TaskGroup.user_id == current_user.id).order_by(TaskGroup.created_at.asc()).all()
+async def get_groups(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    result = await db.execute(
+        select(TaskGroup).where(TaskGroup.user_id == current_user.id).order_by(TaskGroup.created_at.asc())
+    )
+    return result.scalars().all()
 
 @router.post("/groups", response_model=GroupResponse)
-async def create_group(group: GroupCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def create_group(group: GroupCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
     db_group = TaskGroup(user_id=current_user.id, name=group.name, color=group.color)
     db.add(db_group)
-    db.commit()
-    db.refresh(db_group)
+    await db.commit()
+    await db.refresh(db_group)
     return db_group
 
 @router.delete("/groups/{group_id}")
-async def delete_group(group_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    group = db.query(TaskGroup).filter(TaskGroup.id == group_id, TaskGroup.user_id == current_user.id).first()
+async def delete_group(group_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
+    group = (await db.execute(
+        select(TaskGroup).where(TaskGroup.id == group_id, TaskGroup.user_id == current_user.id)
+    )).scalars().first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     # Hủy liên kết các tác vụ khỏi nhóm này
-    db.query(Task).filter(Task.group_id == group_id).update({"group_id": None})
-    db.delete(group)
-    db.commit()
+    await db.execute(update(Task).where(Task.group_id == group_id).values(group_id=None))
+    await db.delete(group)
+    await db.commit()
     return {"message": "Group deleted"}
@@ -1,13 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
 import os
-import shutil
-import glob
 from uuid import uuid4
 from ..database import get_db
+from ..purge import enqueue_purge, purge_worker
 from ..models.models import User, UserProfile
-from ..utils.auth import get_current_user
-from ..utils.security import get_password_hash, verify_password
+from ..utils.auth import CurrentUser, bump_role_version, get_current_async_user, get_current_user, invalidate_user_cache
+from ..utils.user_cards import invalidate_user_cards
+from ..utils.security import get_password_hash_async, verify_password_async
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 
@@ -27,14 +27,14 @@ class UserProfileUpdate(BaseModel):
 
 @router.get("/me")
 async def get_my_profile(
-    current_user: User = Depends(get_current_user), 
+    current_user: CurrentUser = Depends(get_current_async_user), 
     db: Session = Depends(get_db)
 ):
     """
     Returns the current user's profile information.
     Includes extended profile data if they have one (e.g. Students).
     """
-    user_roles = [ur.role.role_name for ur in current_user.roles]
+    user_roles = current_user.roles
     profile_data = None
     
     if "student" in user_roles:
@@ -79,7 +79,7 @@ async def update_my_profile(
         current_user.full_name = update_data.full_name
         
     if update_data.password is not None and update_data.password != "":
-        current_user.password_hash = get_password_hash(update_data.password)
+        current_user.password_hash = await get_password_hash_async(update_data.password)
         
     if update_data.avatar_url is not None:
         current_user.avatar_url = update_data.avatar_url
@@ -106,6 +106,8 @@ async def update_my_profile(
 
     db.commit()
     db.refresh(current_user)
+    await invalidate_user_cache(current_user.username)
+    await invalidate_user_cards(current_user.id)
     
     return {"message": "Profile updated successfully"}
 
@@ -152,6 +154,8 @@ async def upload_avatar(
     current_user.avatar_url = avatar_url
     db.commit()
     db.refresh(current_user)
+    await invalidate_user_cache(current_user.username)
+    await invalidate_user_cards(current_user.id)
 
     return {
         "message": "Avatar uploaded successfully",
@@ -167,7 +171,7 @@ async def verify_user_password(
     current_user: User = Depends(get_current_user)
 ):
     """Verify user's current password before sensitive actions."""
-    if not verify_password(body.password, current_user.password_hash):
+    if not await verify_password_async(body.password, current_user.password_hash):
         raise HTTPException(status_code=400, detail="Mật khẩu không đúng")
     return {"verified": True}
 
@@ -177,137 +181,31 @@ async def delete_my_account(
     db: Session = Depends(get_db)
 ):
     """
-    Permanently deletes the current user's account and all associated data.
-    This action is irreversible. The User model has cascade delete configured,
-    so all related records (roles, profile, tasks, schedules, etc.) will be removed.
+    Xóa tài khoản: khóa tài khoản ngay (ẩn khỏi API, không đăng nhập được) rồi để
+    purge job xóa dữ liệu liên quan và file theo lô ở nền.
+    Tiến độ: GET /stms/purge-jobs/{purge_job_id}.
     """
-    # 1. Xóa tất cả avatar của user
-    try:
-        avatar_pattern = os.path.join("uploads", "avatars", f"{current_user.id}_*")
-        for f in glob.glob(avatar_pattern):
-            try:
-                os.remove(f)
-            except Exception:
-                pass
-    except Exception as e:
-        print(f"Error cleaning avatars: {e}")
-
-    # 2. Xóa các thư mục riêng của user
-    uid_str = str(current_user.id)
-    dirs_to_remove = [
-        os.path.join("uploads", "ai", uid_str),
-        os.path.join("uploads", "subjects", uid_str),
-        os.path.join("uploads", "tasks", uid_str)
-    ]
-    
-    for d in dirs_to_remove:
-        try:
-            if os.path.exists(d):
-                shutil.rmtree(d)
-        except Exception as e:
-            print(f"Error cleaning directory {d}: {e}")
-
-    from ..models.models import (
-        Task, Subject, PomodoroSession, Schedule, Notification, 
-        ChatHistory, AIInteraction, 
-        StudySession, SubjectStatistic, Note, Goal, GoalProgressLog, UserRole,
-        UserProfile, UserPreference, UserAchievement, TaskGroup, SystemSetting,
-        StudyReport, Feedback, ActivityLog,
-        FriendRequest, FriendRelationship, DirectMessage,
-        SubjectChannelMember, SubjectChannelMessage, ChannelJoinRequest, SubjectChannel,
-        StudyRoomMember, StudyRoomMessage, StudyRoom,
-        Resource, TaskChatHistory
-    )
+    from ..models.models import StudyRoom, SubjectChannel
 
     uid = current_user.id
+    username = current_user.username
 
-    db.query(Notification).filter(Notification.sender_id == uid).update({"sender_id": None}, synchronize_session=False)
-    db.query(UserRole).filter(UserRole.assigned_by == uid).update({"assigned_by": None}, synchronize_session=False)
-    db.query(SystemSetting).filter(SystemSetting.updated_by == uid).update({"updated_by": None}, synchronize_session=False)
-    db.query(Feedback).filter(Feedback.resolved_by == uid).update({"resolved_by": None}, synchronize_session=False)
-
-    # Xóa dữ liệu phụ thuộc
-    goals = db.query(Goal).filter((Goal.user_id == uid) | (Goal.created_by == uid)).all()
-    if goals:
-        goal_ids = [g.id for g in goals]
-        db.query(GoalProgressLog).filter(GoalProgressLog.goal_id.in_(goal_ids)).delete(synchronize_session=False)
-
-    # Xóa dữ liệu phụ thuộc trực tiếp vào User
-    db.query(StudySession).filter(StudySession.user_id == uid).delete(synchronize_session=False)
-    db.query(PomodoroSession).filter(PomodoroSession.user_id == uid).delete(synchronize_session=False)
-    db.query(Task).filter((Task.user_id == uid) | (Task.created_by == uid)).delete(synchronize_session=False)
-    db.query(Schedule).filter((Schedule.user_id == uid) | (Schedule.created_by == uid)).delete(synchronize_session=False)
-    db.query(StudyReport).filter(StudyReport.user_id == uid).delete(synchronize_session=False)
-    db.query(SubjectStatistic).filter(SubjectStatistic.user_id == uid).delete(synchronize_session=False)
-    
-    # An toàn để xóa Subjects, TaskGroups, Goals
-    db.query(Subject).filter(Subject.user_id == uid).delete(synchronize_session=False)
-    db.query(TaskGroup).filter(TaskGroup.user_id == uid).delete(synchronize_session=False)
-    db.query(Goal).filter((Goal.user_id == uid) | (Goal.created_by == uid)).delete(synchronize_session=False)
-
-    # Xóa dữ liệu độc lập của user
-    db.query(Note).filter(Note.user_id == uid).delete(synchronize_session=False)
-    db.query(UserAchievement).filter(UserAchievement.user_id == uid).delete(synchronize_session=False)
-    db.query(Notification).filter(Notification.user_id == uid).delete(synchronize_session=False)
-    db.query(ChatHistory).filter(ChatHistory.user_id == uid).delete(synchronize_session=False)
-    db.query(TaskChatHistory).filter(TaskChatHistory.user_id == uid).delete(synchronize_session=False)
-    db.query(AIInteraction).filter(AIInteraction.user_id == uid).delete(synchronize_session=False)
-    db.query(ActivityLog).filter(ActivityLog.user_id == uid).delete(synchronize_session=False)
-    db.query(Feedback).filter(Feedback.user_id == uid).delete(synchronize_session=False)
-    
-
-
-    
-    # Tin nhắn trực tiếp
-    db.query(DirectMessage).filter(
-        (DirectMessage.sender_id == uid) | (DirectMessage.receiver_id == uid)
-    ).delete(synchronize_session=False)
-
-    # Yêu cầu & Quan hệ
-    db.query(FriendRequest).filter(
-        (FriendRequest.sender_id == uid) | (FriendRequest.receiver_id == uid)
-    ).delete(synchronize_session=False)
-    db.query(FriendRelationship).filter(
-        (FriendRelationship.user_id == uid) | (FriendRelationship.friend_id == uid)
-    ).delete(synchronize_session=False)
-
-    # Tin nhắn Channel 
-    db.query(SubjectChannelMessage).filter(SubjectChannelMessage.user_id == uid).delete(synchronize_session=False)
-
-    # Thành viên Channel & Yêu cầu tham gia
-    db.query(SubjectChannelMember).filter(SubjectChannelMember.user_id == uid).delete(synchronize_session=False)
-    db.query(ChannelJoinRequest).filter(ChannelJoinRequest.user_id == uid).delete(synchronize_session=False)
+    # Giải phóng username/email để đăng ký lại được; mật khẩu ngẫu nhiên để không đăng nhập lại được
+    current_user.is_active = False
+    current_user.username = f"deleted_{uid}"
+    current_user.email = f"deleted_{uid}@deleted.invalid"
+    current_user.password_hash = await get_password_hash_async(uuid4().hex)
+    # Purge job gỡ role ở nền; token đã cấp không còn được tin claim roles từ bây giờ
+    bump_role_version(current_user)
 
-    # Channels tạo bởi user
-    user_channels = db.query(SubjectChannel).filter(SubjectChannel.creator_id == uid).all()
-    for ch in user_channels:
-        db.delete(ch)
+    # Phòng học / nhóm do user tạo biến mất khỏi danh sách ngay, dữ liệu xóa ở nền
+    db.query(StudyRoom).filter(StudyRoom.host_id == uid).update({"is_active": False}, synchronize_session=False)
+    db.query(SubjectChannel).filter(SubjectChannel.creator_id == uid).update({"is_active": False}, synchronize_session=False)
 
-    # Tin nhắn & Thành viên 
-    db.query(StudyRoomMessage).filter(StudyRoomMessage.user_id == uid).delete(synchronize_session=False)
-    db.query(StudyRoomMember).filter(StudyRoomMember.user_id == uid).delete(synchronize_session=False)
-
-    # Study Rooms do user host
-    user_rooms = db.query(StudyRoom).filter(StudyRoom.host_id == uid).all()
-    for room in user_rooms:
-        db.delete(room)
-
-    # Tài liệu
-    user_resources = db.query(Resource).filter(Resource.user_id == uid).all()
-    for res in user_resources:
-        try:
-            file_path = res.file_url.lstrip("/")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception:
-            pass
-        db.delete(res)
-
-    # Cuối cùng xóa các quan hệ trực tiếp của User
-    db.query(UserProfile).filter(UserProfile.user_id == uid).delete(synchronize_session=False)
-    db.query(UserPreference).filter(UserPreference.user_id == uid).delete(synchronize_session=False)
-    db.query(UserRole).filter(UserRole.user_id == uid).delete(synchronize_session=False)
-    db.delete(current_user)
+    job = enqueue_purge(db, "user", uid, requested_by=uid)
     db.commit()
-    
-    return {"message": "Account deleted successfully"}
+    purge_worker.wake()
+    await invalidate_user_cache(username)
+    await invalidate_user_cards(uid)
+
+    return {"message": "Account deleted successfully", "purge_job_id": job.id}
@@ -1,106 +1,487 @@
 """
 WebSocket Manager cho EduFlow
 Quản lý kết nối real-time: Chat channels, DM, Study Room, Notifications
+
+Mỗi worker chỉ giữ các socket của chính nó. Backplane (mặc định: local,
+hoặc Redis pub/sub khi WS_BACKPLANE=redis) định tuyến broadcast, tin nhắn
+cá nhân và tín hiệu WebRTC sang các worker/node khác, đồng thời cung cấp
+trạng thái online và thành viên phòng trên toàn cluster.
 """
 
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Optional, Iterable
+import asyncio
 import json
+import os
+import time
+import uuid
 from datetime import datetime
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+WS_BACKPLANE = os.getenv("WS_BACKPLANE", "local")
+# Số tin nhắn tối đa chờ gửi cho mỗi socket, vượt quá thì ngắt kết nối
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+
+class Backplane:
+    """Backplane mặc định: chỉ 1 process, không có node nào khác"""
+
+    async def start(self, on_message):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, envelope: dict):
+        pass
+
+    async def user_connected(self, user_id: int):
+        pass
+
+    async def user_disconnected(self, user_id: int):
+        pass
+
+    async def room_joined(self, room_id: str, user_id: int):
+        pass
+
+    async def room_left(self, room_id: str, user_id: int):
+        pass
+
+    async def is_online(self, user_id: int) -> bool:
+        return False
+
+    async def get_room_members(self, room_id: str) -> Set[int]:
+        return set()
+
+    async def filter_online(self, user_ids: List[int]) -> Set[int]:
+        return set()
+
+    async def get_online_users(self) -> Set[int]:
+        return set()
+
+
+class RedisBackplane(Backplane):
+    """
+    Backplane dùng Redis pub/sub.
+    - Tin nhắn: publish lên kênh `ws:bus`, mỗi node tự giao cho socket của mình.
+    - Presence: mỗi node ghi user/phòng của nó vào `ws:node:{node_id}:*`,
+      và heartbeat vào ZSET `ws:nodes`. Node chết quá NODE_TTL giây bị dọn dẹp.
+    """
+
+    CHANNEL = "ws:bus"
+    NODES_KEY = "ws:nodes"
+    HEARTBEAT_SECONDS = 5
+    NODE_TTL = 20
+
+    def __init__(self, url: str = REDIS_URL):
+        self.url = url
+        self.node_id = uuid.uuid4().hex[:12]
+        self.redis = None
+        self._pubsub = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _users_key(self, node_id: str) -> str:
+        return f"ws:node:{node_id}:users"
+
+    def _rooms_key(self, node_id: str) -> str:
+        return f"ws:node:{node_id}:rooms"
+
+    def _room_key(self, node_id: str, room_id: str) -> str:
+        return f"ws:node:{node_id}:room:{room_id}"
+
+    async def start(self, on_message):
+        import redis.asyncio as aioredis
+
+        self.redis = aioredis.from_url(self.url, decode_responses=True)
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.CHANNEL)
+        await self.redis.zadd(self.NODES_KEY, {self.node_id: time.time()})
+        self._tasks = [
+            asyncio.create_task(self._listen(on_message)),
+            asyncio.create_task(self._heartbeat()),
+        ]
+        print(f"[WS] Redis backplane started (node {self.node_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.redis is None:
+            return
+        try:
+            await self._purge_node(self.node_id)
+            await self._pubsub.unsubscribe(self.CHANNEL)
+            await self._pubsub.close()
+            await self.redis.close()
+        except Exception as e:
+            print(f"[WS] Backplane stop error: {e}")
+
+    async def _listen(self, on_message):
+        while True:
+            try:
+                async for raw in self._pubsub.listen():
+                    if raw.get("type") != "message":
+                        continue
+                    envelope = json.loads(raw["data"])
+                    if envelope.get("origin") == self.node_id:
+                        continue
+                    await on_message(envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WS] Backplane listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                now = time.time()
+                await self.redis.zadd(self.NODES_KEY, {self.node_id: now})
+                dead = await self.redis.zrangebyscore(self.NODES_KEY, "-inf", now - self.NODE_TTL)
+                for node_id in dead:
+                    await self._purge_node(node_id)
+                    print(f"[WS] Removed stale node {node_id}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WS] Backplane heartbeat error: {e}")
+            await asyncio.sleep(self.HEARTBEAT_SECONDS)
+
+    async def _purge_node(self, node_id: str):
+        rooms = await self.redis.smembers(self._rooms_key(node_id))
+        keys = [self._users_key(node_id), self._rooms_key(node_id)]
+        keys += [self._room_key(node_id, room_id) for room_id in rooms]
+        await self.redis.delete(*keys)
+        await self.redis.zrem(self.NODES_KEY, node_id)
+
+    async def _other_nodes(self) -> List[str]:
+        nodes = await self.redis.zrangebyscore(self.NODES_KEY, time.time() - self.NODE_TTL, "+inf")
+        return [n for n in nodes if n != self.node_id]
+
+    async def publish(self, envelope: dict):
+        envelope["origin"] = self.node_id
+        try:
+            await self.redis.publish(self.CHANNEL, json.dumps(envelope, default=str))
+        except Exception as e:
+            print(f"[WS] Backplane publish error: {e}")
+
+    async def user_connected(self, user_id: int):
+        try:
+            await self.redis.sadd(self._users_key(self.node_id), user_id)
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+
+    async def user_disconnected(self, user_id: int):
+        try:
+            await self.redis.srem(self._users_key(self.node_id), user_id)
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+
+    async def room_joined(self, room_id: str, user_id: int):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.sadd(self._room_key(self.node_id, room_id), user_id)
+            pipe.sadd(self._rooms_key(self.node_id), room_id)
+            await pipe.execute()
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+
+    async def room_left(self, room_id: str, user_id: int):
+        try:
+            room_key = self._room_key(self.node_id, room_id)
+            await self.redis.srem(room_key, user_id)
+            if not await self.redis.scard(room_key):
+                await self.redis.srem(self._rooms_key(self.node_id), room_id)
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+
+    async def is_online(self, user_id: int) -> bool:
+        try:
+            nodes = await self._other_nodes()
+            if not nodes:
+                return False
+            pipe = self.redis.pipeline()
+            for node_id in nodes:
+                pipe.sismember(self._users_key(node_id), user_id)
+            return any(await pipe.execute())
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+            return False
+
+    async def get_room_members(self, room_id: str) -> Set[int]:
+        try:
+            nodes = await self._other_nodes()
+            if not nodes:
+                return set()
+            members = await self.redis.sunion([self._room_key(n, room_id) for n in nodes])
+            return {int(m) for m in members}
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+            return set()
+
+    async def filter_online(self, user_ids: List[int]) -> Set[int]:
+        try:
+            nodes = await self._other_nodes()
+            if not nodes or not user_ids:
+                return set()
+            pipe = self.redis.pipeline()
+            for node_id in nodes:
+                pipe.smismember(self._users_key(node_id), user_ids)
+            online = set()
+            for flags in await pipe.execute():
+                online.update(uid for uid, flag in zip(user_ids, flags) if flag)
+            return online
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+            return set()
+
+    async def get_online_users(self) -> Set[int]:
+        try:
+            nodes = await self._other_nodes()
+            if not nodes:
+                return set()
+            users = await self.redis.sunion([self._users_key(n) for n in nodes])
+            return {int(u) for u in users}
+        except Exception as e:
+            print(f"[WS] Backplane presence error: {e}")
+            return set()
+
+
+def create_backplane(kind: str = WS_BACKPLANE) -> Backplane:
+    if kind == "redis":
+        return RedisBackplane()
+    return Backplane()
+
+
+class ClientConnection:
+    """
+    Một socket kèm hàng đợi gửi riêng (có giới hạn) và writer task.
+    Client chậm chỉ làm đầy hàng đợi của chính nó, không chặn broadcast.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, on_error, maxsize: int = WS_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+        self._on_error = on_error
+        self._writer = asyncio.create_task(self._run())
+
+    def enqueue(self, message: str) -> bool:
+        """Đưa tin nhắn (đã serialize) vào hàng đợi; False nếu hàng đợi đầy"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _run(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await self.websocket.send_text(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            await self._on_error(self)
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if code != 1000:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
 
 class ConnectionManager:
     """Quản lý tất cả WebSocket connections"""
 
-    def __init__(self):
-        # user_id -> danh sách các kết nối WebSocket
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+    def __init__(self, backplane: Optional[Backplane] = None, send_queue_size: int = WS_SEND_QUEUE_SIZE):
+        # user_id -> danh sách các kết nối (chỉ trên worker này)
+        self.active_connections: Dict[int, List[ClientConnection]] = {}
         self.room_members: Dict[str, Set[int]] = {}
+        # Chỉ mục ngược user_id -> các room đang tham gia (đồng bộ với room_members)
+        self.user_rooms: Dict[int, Set[str]] = {}
+        self.backplane = backplane or Backplane()
+        self.send_queue_size = send_queue_size
+        self.dropped_connections = 0
+        # Đếm số socket thay vì cộng dồn active_connections mỗi lần log
+        self.connection_count = 0
+
+    async def start(self):
+        await self.backplane.start(self._on_backplane_message)
+
+    async def stop(self):
+        await self.backplane.stop()
 
     async def connect(self, websocket: WebSocket, user_id: int):
         """Kết nối user mới"""
         await websocket.accept()
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+            await self.backplane.user_connected(user_id)
+        conn = ClientConnection(websocket, user_id, self._on_send_error, self.send_queue_size)
+        self.active_connections[user_id].append(conn)
+        self.connection_count += 1
         print(f"[WS] User {user_id} connected. Total connections: {self._total_connections()}")
 
-    def disconnect(self, websocket: WebSocket, user_id: int):
+    async def disconnect(self, websocket: WebSocket, user_id: int):
         """Ngắt kết nối user"""
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-        # Xóa khỏi tất cả các phòng
-        for room_id in list(self.room_members.keys()):
-            self.room_members[room_id].discard(user_id)
-            if not self.room_members[room_id]:
-                del self.room_members[room_id]
+        for conn in list(self.active_connections.get(user_id, [])):
+            if conn.websocket is websocket:
+                await self._remove_connection(conn)
         print(f"[WS] User {user_id} disconnected. Total connections: {self._total_connections()}")
 
-    def is_online(self, user_id: int) -> bool:
-        """Check user có online không"""
+    async def _remove_connection(self, conn: ClientConnection, code: int = 1000):
+        await conn.close(code)
+        conns = self.active_connections.get(conn.user_id)
+        if conns is None or conn not in conns:
+            return
+        conns.remove(conn)
+        self.connection_count -= 1
+        if not conns:
+            # Tab cuối cùng đã đóng -> rời các phòng của user
+            del self.active_connections[conn.user_id]
+            await self._leave_all_rooms(conn.user_id)
+            await self.backplane.user_disconnected(conn.user_id)
+
+    async def _on_send_error(self, conn: ClientConnection):
+        """Writer task gửi lỗi (socket đã đóng) -> bỏ kết nối"""
+        await self._remove_connection(conn)
+
+    def _is_local_online(self, user_id: int) -> bool:
         return user_id in self.active_connections and len(self.active_connections[user_id]) > 0
 
-    def get_online_users(self) -> List[int]:
-        """Lấy danh sách user đang online"""
-        return list(self.active_connections.keys())
+    async def is_online(self, user_id: int) -> bool:
+        """Check user có online không (trên toàn cluster)"""
+        if self._is_local_online(user_id):
+            return True
+        return await self.backplane.is_online(user_id)
+
+    async def filter_online(self, user_ids: Iterable[int]) -> Set[int]:
+        """Lọc ra các user đang online trong danh sách (1 lần hỏi backplane)"""
+        user_ids = list(user_ids)
+        online = {uid for uid in user_ids if self._is_local_online(uid)}
+        remaining = [uid for uid in user_ids if uid not in online]
+        if remaining:
+            online |= await self.backplane.filter_online(remaining)
+        return online
+
+    async def get_online_users(self) -> List[int]:
+        """Lấy danh sách user đang online (trên toàn cluster)"""
+        users = set(self.active_connections.keys())
+        users |= await self.backplane.get_online_users()
+        return list(users)
 
     # Quản lý Phòng
 
-    def join_room(self, room_id: str, user_id: int):
+    async def join_room(self, room_id: str, user_id: int):
         """User join vào room (study room hoặc subject channel)"""
         if room_id not in self.room_members:
             self.room_members[room_id] = set()
         self.room_members[room_id].add(user_id)
+        self.user_rooms.setdefault(user_id, set()).add(room_id)
+        await self.backplane.room_joined(room_id, user_id)
         print(f"[WS] User {user_id} joined room {room_id}")
 
-    def leave_room(self, room_id: str, user_id: int):
+    async def leave_room(self, room_id: str, user_id: int):
         """User rời khỏi room"""
         if room_id in self.room_members:
             self.room_members[room_id].discard(user_id)
             if not self.room_members[room_id]:
                 del self.room_members[room_id]
+        if user_id in self.user_rooms:
+            self.user_rooms[user_id].discard(room_id)
+            if not self.user_rooms[user_id]:
+                del self.user_rooms[user_id]
+        await self.backplane.room_left(room_id, user_id)
         print(f"[WS] User {user_id} left room {room_id}")
 
-    def get_room_members(self, room_id: str) -> Set[int]:
-        """Lấy danh sách members trong room"""
-        return self.room_members.get(room_id, set())
+    async def _leave_all_rooms(self, user_id: int):
+        """Rời mọi room của user - chỉ duyệt các room user đang ở"""
+        for room_id in list(self.user_rooms.get(user_id, ())):
+            await self.leave_room(room_id, user_id)
+
+    async def get_room_members(self, room_id: str) -> Set[int]:
+        """Lấy danh sách members trong room (trên toàn cluster)"""
+        members = set(self.room_members.get(room_id, set()))
+        members |= await self.backplane.get_room_members(room_id)
+        return members
 
     # Gửi Tin Nhắn
+    # Payload chỉ serialize 1 lần cho mỗi lần gửi, rồi đưa vào hàng đợi của từng socket
 
     async def send_personal(self, user_id: int, data: dict):
-        """Gửi tin nhắn đến 1 user cụ thể (tất cả tabs)"""
-        if user_id in self.active_connections:
-            message = json.dumps(data, default=str)
-            disconnected = []
-            for ws in self.active_connections[user_id]:
-                try:
-                    await ws.send_text(message)
-                except Exception:
-                    disconnected.append(ws)
-            for ws in disconnected:
-                self.active_connections[user_id].remove(ws)
+        """Gửi tin nhắn đến 1 user cụ thể (tất cả tabs, trên mọi worker)"""
+        message = json.dumps(data, default=str)
+        await self._deliver_local([user_id], message)
+        await self.backplane.publish({"kind": "personal", "target": user_id, "message": message})
+
+    async def send_to_users(self, user_ids: Iterable[int], data: dict):
+        """Gửi cùng 1 tin nhắn đến nhiều user (serialize và publish 1 lần)"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        message = json.dumps(data, default=str)
+        await self._deliver_local(user_ids, message)
+        await self.backplane.publish({"kind": "users", "target": user_ids, "message": message})
 
     async def broadcast_to_room(self, room_id: str, data: dict, exclude_user: int = None):
         """Broadcast tin nhắn đến tất cả members trong room"""
-        members = self.get_room_members(room_id)
-        for user_id in members:
-            if user_id != exclude_user:
-                await self.send_personal(user_id, data)
+        message = json.dumps(data, default=str)
+        await self._deliver_local(self._local_room_targets(room_id, exclude_user), message)
+        await self.backplane.publish({"kind": "room", "target": room_id, "exclude": exclude_user, "message": message})
 
     async def broadcast_to_all(self, data: dict, exclude_user: int = None):
         """Broadcast đến tất cả users đang online"""
-        for user_id in list(self.active_connections.keys()):
-            if user_id != exclude_user:
-                await self.send_personal(user_id, data)
+        message = json.dumps(data, default=str)
+        await self._deliver_local([u for u in self.active_connections if u != exclude_user], message)
+        await self.backplane.publish({"kind": "all", "exclude": exclude_user, "message": message})
+
+    # Giao tin nhắn cho socket trên worker này
+
+    def _local_room_targets(self, room_id: str, exclude_user: int = None) -> List[int]:
+        return [u for u in self.room_members.get(room_id, ()) if u != exclude_user]
+
+    async def _deliver_local(self, user_ids: Iterable[int], message: str):
+        """Đưa message vào hàng đợi của mọi socket; socket bị đầy hàng đợi sẽ bị ngắt"""
+        overflowed = []
+        for user_id in user_ids:
+            for conn in self.active_connections.get(user_id, ()):
+                if not conn.enqueue(message):
+                    overflowed.append(conn)
+        for conn in overflowed:
+            self.dropped_connections += 1
+            print(f"[WS] Dropping slow connection of user {conn.user_id} (send queue full)")
+            # 1013: Try Again Later - client sẽ tự kết nối lại
+            await self._remove_connection(conn, code=1013)
+
+    async def _on_backplane_message(self, envelope: dict):
+        """Nhận tin nhắn từ worker khác qua backplane"""
+        kind = envelope.get("kind")
+        message = envelope.get("message")
+        if kind == "personal":
+            await self._deliver_local([envelope.get("target")], message)
+        elif kind == "users":
+            await self._deliver_local(envelope.get("target", []), message)
+        elif kind == "room":
+            await self._deliver_local(self._local_room_targets(envelope.get("target"), envelope.get("exclude")), message)
+        elif kind == "all":
+            exclude_user = envelope.get("exclude")
+            await self._deliver_local([u for u in self.active_connections if u != exclude_user], message)
 
     # Hàm Phụ Trợ
 
     def _total_connections(self) -> int:
-        return sum(len(conns) for conns in self.active_connections.values())
+        return self.connection_count
 
 
 # Khởi tạo một đối tượng duy nhất
-manager = ConnectionManager()
+manager = ConnectionManager(backplane=create_backplane())
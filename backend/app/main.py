@@ -1,42 +1,44 @@
+from .utils import runtime
+runtime.mark_import_start()
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from .api import auth, subjects, tasks, schedules, notifications, users, pomodoros, ai, chat, room, admin
 from .api.websocket import manager
-from .api import community, friends, dm, resources, video_signaling, matching
+from .notifier import notifier
+from .purge import purge_worker
+from .utils.cache import invalidate_cache, start_invalidation_listener, stop_invalidation_listener
+from .utils.config import config_service
+from .utils.query_stats import QueryStatsMiddleware
+from .api import community, friends, dm, resources, video_signaling, matching, purge
 import json
-from .database import engine, Base
-from .models import models  # Ensure models are loaded before creation
-import time
-
-# Auto-create tables (with retry logic for slow DB startup)
-for _ in range(30):
-    try:
-        Base.metadata.create_all(bind=engine)
-        print("Database tables created successfully")
-        
-        # Seed default roles
-        from .database import SessionLocal
-        from .models.models import Role
-        db = SessionLocal()
-        try:
-            if not db.query(Role).first():
-                db.add_all([
-                    Role(role_name="admin", role_description="Administrator"),
-                    Role(role_name="student", role_description="Student")
-                ])
-                db.commit()
-                print("Default roles seeded.")
-        finally:
-            db.close()
-            
-        break
-    except Exception as e:
-        print(f"Waiting for database to be ready... {e}")
-        time.sleep(2)
-else:
-    raise RuntimeError("Could not connect to database after 30 retries!")
-
-app = FastAPI(title="EduFlow STMS API")
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
+from . import startup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Kiểm tra migration/seed và nạp model chạy nền -> worker khởi động ngay, /stms/ready báo khi xong
+    startup.start()
+    # Kết nối backplane để broadcast/presence hoạt động giữa nhiều worker
+    await manager.start()
+    await notifier.start()
+    start_invalidation_listener()
+    config_service.start()
+    # Xóa dữ liệu nặng chạy nền (PURGE_WORKER=0 để tắt trên worker này)
+    await purge_worker.start()
+    print(runtime.startup_summary())
+    yield
+    await purge_worker.stop()
+    config_service.stop()
+    stop_invalidation_listener()
+    await notifier.stop()
+    await manager.stop()
+    startup.stop()
+
+
+app = FastAPI(title="EduFlow STMS API", lifespan=lifespan)
 
 # Cấu hình CORS
 app.add_middleware(
@@ -45,7 +47,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor trang sau của GET /stms/tasks
+    expose_headers=["X-Next-Cursor"],
 )
+# Đếm số câu SQL / thời gian DB mỗi request (header khi QUERY_STATS_HEADERS=1, log khi vượt QUERY_BUDGET)
+app.add_middleware(QueryStatsMiddleware)
 
 # Routers
 app.include_router(auth.router)
@@ -64,8 +70,13 @@ app.include_router(dm.router)
 app.include_router(resources.router)
 app.include_router(video_signaling.router)
 app.include_router(matching.router)
+app.include_router(purge.router)
 app.include_router(admin.router)
 
+# Thời gian import tính đến khi đăng ký xong router (model AI / parser nạp trễ, không nằm trong số này)
+runtime.mark_imported()
+
+
 import os
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -96,7 +107,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
             if msg_type == "join_room":
                 room_id = message.get("room_id")
                 if room_id:
-                    manager.join_room(str(room_id), user_id)
+                    await manager.join_room(str(room_id), user_id)
                     await manager.broadcast_to_room(str(room_id), {
                         "type": "user_joined",
                         "user_id": user_id,
@@ -106,7 +117,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
             elif msg_type == "leave_room":
                 room_id = message.get("room_id")
                 if room_id:
-                    manager.leave_room(str(room_id), user_id)
+                    await manager.leave_room(str(room_id), user_id)
                     await manager.broadcast_to_room(str(room_id), {
                         "type": "user_left",
                         "user_id": user_id,
@@ -143,69 +154,8 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
                         "timestamp": str(__import__('datetime').datetime.now())
                     }, exclude_user=user_id)
 
-                    # Thông báo chuông cho thành viên offline
-                    try:
-                        from .database import SessionLocal
-                        from .models.models import SubjectChannelMember, SubjectChannel, Notification, User
-                        from datetime import datetime, timedelta
-
-                        notify_db = SessionLocal()
-                        try:
-                            channel = notify_db.query(SubjectChannel).filter(SubjectChannel.id == channel_id).first()
-                            if channel:
-                                channel_name = channel.subject_name
-                                members = notify_db.query(SubjectChannelMember).filter(
-                                    SubjectChannelMember.channel_id == channel_id
-                                ).all()
-                                online_in_room = manager.get_room_members(f"channel_{channel_id}")
-                                sender = notify_db.query(User).filter(User.id == user_id).first()
-                                sender_name = (sender.full_name or sender.username) if sender else username
-                                five_min_ago = datetime.now() - timedelta(minutes=5)
-
-                                for m in members:
-                                    if m.user_id == user_id:
-                                        continue
-                                    if m.user_id in online_in_room:
-                                        continue
-
-                                    recent = notify_db.query(Notification).filter(
-                                        Notification.user_id == m.user_id,
-                                        Notification.notification_type == "community_message",
-                                        Notification.title.contains(channel_name),
-                                        Notification.created_at > five_min_ago
-                                    ).first()
-                                    if recent:
-                                        continue
-
-                                    notif = Notification(
-                                        user_id=m.user_id,
-                                        sender_id=user_id,
-                                        notification_type="community_message",
-                                        title=f"Tin nhắn mới trong {channel_name}",
-                                        message=f"{sender_name}: {msg_content[:80]}",
-                                        link_url="/stms/student/community/group",
-                                        priority="low",
-                                        is_read=False
-                                    )
-                                    notify_db.add(notif)
-
-                                    if manager.is_online(m.user_id):
-                                        await manager.send_personal(m.user_id, {
-                                            "type": "new_notification",
-                                            "event": "new_notification",
-                                            "data": {
-                                                "title": notif.title,
-                                                "message": notif.message,
-                                                "notification_type": "community_message",
-                                                "link_url": notif.link_url
-                                            }
-                                        })
-
-                                notify_db.commit()
-                        finally:
-                            notify_db.close()
-                    except Exception as notif_err:
-                        print(f"[WS] Notification error: {notif_err}")
+                    # Thông báo chuông cho thành viên offline (xử lý nền, không chặn vòng nhận tin)
+                    notifier.submit(channel_id, user_id, username, msg_content)
 
             elif msg_type == "channel_deleted":
                 channel_id = message.get("channel_id")
@@ -315,6 +265,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
                                 dm_db.add(notif)
                                 dm_db.commit()
                                 dm_db.refresh(notif)
+                                await invalidate_cache("/stms/notifications", receiver_id)
 
                                 # Gửi thông báo WS
                                 await manager.send_personal(receiver_id, {
@@ -354,10 +305,10 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
                     })
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
+        await manager.disconnect(websocket, user_id)
     except Exception as e:
         print(f"[WS] Error: {e}")
-        manager.disconnect(websocket, user_id)
+        await manager.disconnect(websocket, user_id)
 
 
 @app.get("/")
@@ -376,15 +327,6 @@ async def favicon():
         return FileResponse(fav)
     return FileResponse(os.path.join(FRONTEND_DIST, "favicon.ico")) if os.path.isfile(os.path.join(FRONTEND_DIST, "favicon.ico")) else None
 
-# SPA catch-all: serve index.html for all non-API routes
-@app.get("/stms/{full_path:path}")
-async def serve_spa(full_path: str):
-    """Catch-all route for React SPA - serves index.html for client-side routing"""
-    index_file = os.path.join(FRONTEND_DIST, "index.html")
-    if os.path.isfile(index_file):
-        return FileResponse(index_file)
-    return {"error": "Frontend not built"}
-
 @app.get("/stms/health")
 async def health_check():
     return {
@@ -392,5 +334,23 @@ async def health_check():
         "version": "2.0.0",
         "database": "PostgreSQL",
         "websocket": True,
-        "online_users": len(manager.get_online_users())
+        "online_users": len(await manager.get_online_users())
     }
+
+
+@app.get("/stms/ready")
+async def readiness_check():
+    """Readiness probe: 200 khi DB (đúng migration head), Redis và model AI đã sẵn sàng"""
+    status = await startup.check_ready()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+# SPA catch-all: serve index.html for all non-API routes
+# Phải khai báo SAU CÙNG, nếu không sẽ che các route /stms/* khai báo sau nó (vd: /stms/health)
+@app.get("/stms/{full_path:path}")
+async def serve_spa(full_path: str):
+    """Catch-all route for React SPA - serves index.html for client-side routing"""
+    index_file = os.path.join(FRONTEND_DIST, "index.html")
+    if os.path.isfile(index_file):
+        return FileResponse(index_file)
+    return {"error": "Frontend not built"}
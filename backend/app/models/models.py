@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Date, Time, Numeric, Enum, Table
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Date, Time, Numeric, Enum, Table, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -52,6 +52,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     otp_code = Column(String(6), nullable=True)
+    # Tăng mỗi khi role đổi; token chỉ tin claim roles khi "rv" khớp giá trị này
+    role_version = Column(Integer, nullable=False, default=0, server_default="0")
     last_login = Column(DateTime)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -121,9 +123,14 @@ class Subject(Base):
 
 class Schedule(Base):
     __tablename__ = "schedules"
+    __table_args__ = (
+        Index("ix_schedules_user_id_start_time", "user_id", "start_time"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     subject_id = Column(Integer, ForeignKey("subjects.id"))
+    # Task mà lịch được AI auto-schedule tạo cho; xóa task thì xóa các lịch này
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="SET NULL"), nullable=True, index=True)
     title = Column(String(200), nullable=False)
     description = Column(Text)
     start_time = Column(DateTime, nullable=False)
@@ -155,6 +162,14 @@ class TaskGroup(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    # Index cho các truy vấn nóng theo user (migration c3f1a2b4d5e6 tạo CONCURRENTLY)
+    __table_args__ = (
+        Index("ix_tasks_user_id_status", "user_id", "status"),
+        Index("ix_tasks_user_id_next_review_date", "user_id", "next_review_date"),
+        Index("ix_tasks_parent_task_id", "parent_task_id"),
+        # Phân trang keyset GET /stms/tasks (migration e4b5c6d7f8a9)
+        Index("ix_tasks_user_id_id", "user_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=True)
@@ -245,6 +260,9 @@ class StudySession(Base):
 
 class PomodoroSession(Base):
     __tablename__ = "pomodoro_sessions"
+    __table_args__ = (
+        Index("ix_pomodoro_sessions_user_id_session_date", "user_id", "session_date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=True)
@@ -386,6 +404,9 @@ class Note(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_id_created_at", "user_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -525,6 +546,9 @@ class SubjectChannelMember(Base):
 class SubjectChannelMessage(Base):
     """Tin nhắn trong kênh môn học"""
     __tablename__ = "subject_channel_messages"
+    __table_args__ = (
+        Index("ix_subject_channel_messages_channel_id_created_at", "channel_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     channel_id = Column(Integer, ForeignKey("subject_channels.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -575,6 +599,10 @@ class FriendRelationship(Base):
 class DirectMessage(Base):
     """Tin nhắn riêng 1-1 giữa friends"""
     __tablename__ = "direct_messages"
+    # Phục vụ cả 2 chiều hội thoại (OR -> BitmapOr) và đếm tin chưa đọc theo (sender, receiver)
+    __table_args__ = (
+        Index("ix_direct_messages_sender_receiver_created_at", "sender_id", "receiver_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -624,6 +652,9 @@ class StudyRoomMember(Base):
 class StudyRoomMessage(Base):
     """Tin nhắn trong phòng học"""
     __tablename__ = "study_room_messages"
+    __table_args__ = (
+        Index("ix_study_room_messages_room_id_created_at", "room_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("study_rooms.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -655,3 +686,28 @@ class Resource(Base):
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     user = relationship("User", foreign_keys=[user_id])
+
+# 12. Background Jobs
+
+class PurgeJob(Base):
+    """Job xóa dữ liệu nặng chạy nền theo lô (xem app/purge.py)"""
+    __tablename__ = "purge_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(30), nullable=False) # user, room, channel, friendship
+    target_id = Column(Integer, nullable=False)
+    params = Column(Text) # chuỗi JSON
+    requested_by = Column(Integer) # không FK: user có thể chính là đối tượng bị xóa
+    status = Column(String(20), default="pending", nullable=False) # pending, running, done, failed
+    step = Column(Integer, default=0) # chỉ số bước đang chạy, resume từ đây sau khi crash
+    deleted_rows = Column(Integer, default=0)
+    progress = Column(Text) # chuỗi JSON {tên bước: số dòng}
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    locked_by = Column(String(100))
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_purge_jobs_status_id", "status", "id"),
+    )
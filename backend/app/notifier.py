@@ -0,0 +1,154 @@
+"""
+Background notifier cho tin nhắn channel.
+
+Vòng nhận tin của WebSocket chỉ đưa sự kiện vào hàng đợi rồi tiếp tục.
+Task nền gom các tin trong NOTIFY_WINDOW_SECONDS giây, với mỗi cặp
+(channel, người gửi) chạy 1 query dedupe dạng tập hợp + 1 bulk insert, rồi đẩy
+thông báo chuông cho các thành viên đang online qua ConnectionManager.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import insert, select
+
+from .api.websocket import manager
+from .database import AsyncSessionLocal
+from .models.models import Notification, SubjectChannel, SubjectChannelMember, User
+from .utils.cache import invalidate_cache_many
+
+NOTIFY_WINDOW_SECONDS = float(os.getenv("NOTIFY_WINDOW_SECONDS", "1.0"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+# Không tạo thêm thông báo cho cùng channel trong khoảng này
+DEDUPE_MINUTES = 5
+
+
+class ChannelNotifier:
+    """Tạo thông báo chuông cho thành viên không ở trong channel"""
+
+    def __init__(self, window_seconds: float = NOTIFY_WINDOW_SECONDS, max_queue: int = NOTIFY_QUEUE_SIZE):
+        self.window_seconds = window_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def submit(self, channel_id: int, sender_id: int, sender_username: str, content: str):
+        """Gọi từ vòng nhận tin WebSocket - không chờ DB"""
+        try:
+            channel_id = int(channel_id)
+        except (TypeError, ValueError):
+            return
+        try:
+            self.queue.put_nowait({
+                "channel_id": channel_id,
+                "sender_id": sender_id,
+                "sender_username": sender_username,
+                "content": content,
+            })
+        except asyncio.QueueFull:
+            print(f"[Notifier] Queue full, dropping notification for channel {channel_id}")
+
+    async def _run(self):
+        while True:
+            try:
+                first = await self.queue.get()
+                await asyncio.sleep(self.window_seconds)
+                for event in self._collect(first):
+                    await self._notify_channel(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Notifier] Error: {e}")
+
+    def _collect(self, first: dict) -> List[dict]:
+        """
+        Gom các tin đang chờ theo (channel, người gửi), giữ tin đầu tiên của mỗi cặp.
+        Người gửi bị loại khỏi thông báo của chính mình nên mỗi người gửi cần 1 lượt
+        riêng: A rồi B cùng nhắn trong cửa sổ thì A vẫn được báo tin của B.
+        """
+        batch: Dict[Tuple[int, int], dict] = {(first["channel_id"], first["sender_id"]): first}
+        while not self.queue.empty():
+            event = self.queue.get_nowait()
+            batch.setdefault((event["channel_id"], event["sender_id"]), event)
+        return list(batch.values())
+
+    async def _notify_channel(self, event: dict):
+        channel_id = event["channel_id"]
+        sender_id = event["sender_id"]
+        online_in_room = await manager.get_room_members(f"channel_{channel_id}")
+
+        async with AsyncSessionLocal() as db:
+            channel = await db.get(SubjectChannel, channel_id)
+            if not channel:
+                return
+            title = f"Tin nhắn mới trong {channel.subject_name}"
+
+            member_ids = (await db.execute(
+                select(SubjectChannelMember.user_id).where(
+                    SubjectChannelMember.channel_id == channel_id,
+                    SubjectChannelMember.user_id != sender_id,
+                )
+            )).scalars().all()
+            candidates = [uid for uid in set(member_ids) if uid not in online_in_room]
+            if not candidates:
+                return
+
+            since = datetime.now() - timedelta(minutes=DEDUPE_MINUTES)
+            recent = set((await db.execute(
+                select(Notification.user_id).where(
+                    Notification.user_id.in_(candidates),
+                    Notification.notification_type == "community_message",
+                    Notification.title == title,
+                    Notification.created_at > since,
+                ).distinct()
+            )).scalars().all())
+            targets: List[int] = [uid for uid in candidates if uid not in recent]
+            if not targets:
+                return
+
+            sender = await db.get(User, sender_id)
+            sender_name = (sender.full_name or sender.username) if sender else event["sender_username"]
+            body = f"{sender_name}: {event['content'][:80]}"
+            link_url = "/stms/student/community/group"
+
+            await db.execute(insert(Notification), [
+                {
+                    "user_id": uid,
+                    "sender_id": sender_id,
+                    "notification_type": "community_message",
+                    "title": title,
+                    "message": body,
+                    "link_url": link_url,
+                    "priority": "low",
+                    "is_read": False,
+                }
+                for uid in targets
+            ])
+            await db.commit()
+
+        await invalidate_cache_many("/stms/notifications", targets)
+
+        online = await manager.filter_online(targets)
+        await manager.send_to_users(online, {
+            "type": "new_notification",
+            "event": "new_notification",
+            "data": {
+                "title": title,
+                "message": body,
+                "notification_type": "community_message",
+                "link_url": link_url,
+            },
+        })
+
+
+notifier = ChannelNotifier()
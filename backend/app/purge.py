@@ -0,0 +1,481 @@
+"""
+Xóa dữ liệu nặng chạy nền (purge job).
+
+Request chỉ đánh dấu đối tượng đã xóa (ẩn khỏi API) và ghi 1 dòng purge_jobs
+trong CÙNG transaction, rồi trả về ngay. PurgeWorker (chạy trong mỗi worker
+uvicorn, nhận job bằng UPDATE có điều kiện nên nhiều worker không chạy trùng):
+- chạy lần lượt các bước của job, mỗi bước xóa/cập nhật theo lô PURGE_BATCH_SIZE
+  dòng, mỗi lô 1 transaction kèm cập nhật tiến độ;
+- xóa file bằng thread, không chặn event loop;
+- crash giữa chừng: job còn "running" nhưng heartbeat cũ quá PURGE_STALE_SECONDS
+  sẽ được worker khác nhận lại và chạy tiếp từ bước đang dở (các bước idempotent).
+
+Tiến độ: GET /stms/purge-jobs/{id}.
+"""
+
+import asyncio
+import glob
+import json
+import os
+import shutil
+import socket
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, or_, select, update
+
+from .database import AsyncSessionLocal
+from .models.models import (
+    ActivityLog, AIInteraction, ChannelJoinRequest, ChatHistory, DirectMessage, Feedback, FriendRelationship,
+    FriendRequest, Goal, GoalProgressLog, Note, Notification, PomodoroSession, PurgeJob, Resource, Schedule,
+    StudyReport, StudyRoom, StudyRoomMember, StudyRoomMessage, StudySession, Subject, SubjectChannel,
+    SubjectChannelMember, SubjectChannelMessage, SubjectStatistic, SystemSetting, Task, TaskChatHistory, TaskGroup,
+    User, UserAchievement, UserPreference, UserProfile, UserRole,
+)
+from .utils.cache import invalidate_cache_many
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+# Nghỉ giữa các lô để nhường DB cho request
+PURGE_BATCH_PAUSE = float(os.getenv("PURGE_BATCH_PAUSE", "0.05"))
+PURGE_POLL_SECONDS = float(os.getenv("PURGE_POLL_SECONDS", "5"))
+PURGE_STALE_SECONDS = int(os.getenv("PURGE_STALE_SECONDS", "120"))
+# Job lỗi được thử lại sau khoảng này, tối đa PURGE_MAX_ATTEMPTS lần
+PURGE_RETRY_SECONDS = int(os.getenv("PURGE_RETRY_SECONDS", "30"))
+PURGE_MAX_ATTEMPTS = int(os.getenv("PURGE_MAX_ATTEMPTS", "5"))
+PURGE_WORKER_ENABLED = os.getenv("PURGE_WORKER", "1") == "1"
+
+
+class Step:
+    """
+    1 bước của job: `run(db, job, batch)` trả về số dòng/file đã xử lý.
+    repeat=True: chạy lại đến khi 1 lô xử lý ít hơn `batch` dòng.
+    """
+
+    def __init__(self, name: str, run: Callable, repeat: bool = True):
+        self.name = name
+        self.run = run
+        self.repeat = repeat
+
+
+def delete_rows(name: str, model, where: Callable, newest_first: bool = False) -> Step:
+    """DELETE theo lô: WHERE id IN (SELECT id ... LIMIT batch)"""
+    async def run(db, job, batch):
+        ids = select(model.id).where(*where(job)).limit(batch)
+        if newest_first:
+            # Bản ghi con (vd subtask) có id lớn hơn cha -> xóa trước, không vướng FK
+            ids = ids.order_by(model.id.desc())
+        result = await db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        return result.rowcount
+    return Step(name, run)
+
+
+def nullify(name: str, model, column, where: Callable) -> Step:
+    """Gỡ tham chiếu (SET column = NULL) theo lô; dòng đã gỡ không còn khớp điều kiện"""
+    async def run(db, job, batch):
+        ids = select(model.id).where(*where(job)).limit(batch)
+        result = await db.execute(
+            update(model).where(model.id.in_(ids)).values({column.key: None}).execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+    return Step(name, run)
+
+
+# Việc chỉ làm khi lô hiện tại đã commit:
+# - cache cần invalidate: db.info[_PENDING_INVALIDATIONS] = {namespace: {user_id}}. Invalidate trước
+#   commit thì request xen giữa có thể nạp lại dữ liệu cũ vào cache.
+# - file cần xóa: db.info[_PENDING_FILES] = [path]. Xóa file trước commit mà commit lỗi / worker chết
+#   thì dòng còn lại trỏ tới file đã mất; xóa sau thì tệ nhất còn sót file không ai tham chiếu.
+_PENDING_INVALIDATIONS = "purge_pending_invalidations"
+_PENDING_FILES = "purge_pending_files"
+
+
+def _invalidate_after_commit(db, namespace: str, user_ids):
+    db.info.setdefault(_PENDING_INVALIDATIONS, {}).setdefault(namespace, set()).update(user_ids)
+
+
+def _remove_after_commit(db, paths: List[str]):
+    db.info.setdefault(_PENDING_FILES, []).extend(paths)
+
+
+async def _flush_after_commit(db, committed: bool = True):
+    """Gọi sau commit (invalidate, xóa file) hoặc sau rollback (committed=False: bỏ qua)"""
+    pending = db.info.pop(_PENDING_INVALIDATIONS, {})
+    paths = db.info.pop(_PENDING_FILES, [])
+    if not committed:
+        return
+    for namespace, user_ids in pending.items():
+        await invalidate_cache_many(namespace, user_ids)
+    if paths:
+        await asyncio.to_thread(_remove_paths, paths, False)
+
+
+def delete_notifications(name: str, where: Callable) -> Step:
+    """Như delete_rows nhưng invalidate cache thông báo của các user bị ảnh hưởng (sau commit)"""
+    async def run(db, job, batch):
+        ids = select(Notification.id).where(*where(job)).limit(batch)
+        affected = (await db.execute(
+            delete(Notification).where(Notification.id.in_(ids))
+            .returning(Notification.user_id).execution_options(synchronize_session=False)
+        )).scalars().all()
+        if affected:
+            _invalidate_after_commit(db, "/stms/notifications", affected)
+        return len(affected)
+    return Step(name, run)
+
+
+def _remove_paths(patterns: List[str], expand: bool = True) -> int:
+    removed = 0
+    for pattern in patterns:
+        for path in (glob.glob(pattern) if expand else [pattern]):
+            if not os.path.lexists(path):
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"[Purge] Error removing {path}: {e}")
+    return removed
+
+
+def remove_files(name: str, patterns: Callable) -> Step:
+    """Xóa file/thư mục (glob) trong thread; `patterns(db, job)` có thể là coroutine"""
+    async def run(db, job, batch):
+        paths = patterns(db, job)
+        if asyncio.iscoroutine(paths):
+            paths = await paths
+        return await asyncio.to_thread(_remove_paths, paths)
+    return Step(name, run, repeat=False)
+
+
+def _params(job: PurgeJob) -> dict:
+    return json.loads(job.params or "{}")
+
+
+# ---- Thành phần dùng chung ----
+
+def _room_steps(room_ids: Callable) -> List[Step]:
+    return [
+        delete_rows("room_messages", StudyRoomMessage, lambda job: [StudyRoomMessage.room_id.in_(room_ids(job))]),
+        delete_rows("room_members", StudyRoomMember, lambda job: [StudyRoomMember.room_id.in_(room_ids(job))]),
+        delete_rows("rooms", StudyRoom, lambda job: [StudyRoom.id.in_(room_ids(job)), StudyRoom.is_active == False]),  # noqa: E712
+    ]
+
+
+def _channel_steps(channel_ids: Callable) -> List[Step]:
+    async def channel_dirs(db, job):
+        ids = (await db.execute(select(SubjectChannel.id).where(SubjectChannel.id.in_(channel_ids(job))))).scalars().all()
+        return [os.path.join("uploads", "chat", f"channel_{cid}") for cid in ids]
+
+    return [
+        delete_rows("channel_messages", SubjectChannelMessage, lambda job: [SubjectChannelMessage.channel_id.in_(channel_ids(job))]),
+        delete_rows("channel_members", SubjectChannelMember, lambda job: [SubjectChannelMember.channel_id.in_(channel_ids(job))]),
+        delete_rows("channel_join_requests", ChannelJoinRequest, lambda job: [ChannelJoinRequest.channel_id.in_(channel_ids(job))]),
+        remove_files("channel_files", channel_dirs),
+        delete_rows("channels", SubjectChannel, lambda job: [SubjectChannel.id.in_(channel_ids(job)), SubjectChannel.is_active == False]),  # noqa: E712
+    ]
+
+
+# ---- Kế hoạch xóa theo loại job ----
+
+def _user_tasks(job):
+    return select(Task.id).where(or_(Task.user_id == job.target_id, Task.created_by == job.target_id))
+
+
+def _user_goals(job):
+    return select(Goal.id).where(or_(Goal.user_id == job.target_id, Goal.created_by == job.target_id))
+
+
+def _owned_rooms(job):
+    return select(StudyRoom.id).where(StudyRoom.host_id == job.target_id)
+
+
+def _owned_channels(job):
+    return select(SubjectChannel.id).where(SubjectChannel.creator_id == job.target_id)
+
+
+def _user_files(db, job):
+    uid = str(job.target_id)
+    return [
+        os.path.join("uploads", "avatars", f"{uid}_*"),
+        os.path.join("uploads", "ai", uid),
+        os.path.join("uploads", "subjects", uid),
+        os.path.join("uploads", "tasks", uid),
+    ]
+
+
+async def _purge_resources(db, job, batch):
+    """Tài liệu của user: xóa dòng, file được xóa (trong thread) sau khi lô commit"""
+    rows = (await db.execute(
+        select(Resource.id, Resource.file_url).where(Resource.user_id == job.target_id).limit(batch)
+    )).all()
+    if not rows:
+        return 0
+    await db.execute(delete(Resource).where(Resource.id.in_([rid for rid, _ in rows])).execution_options(synchronize_session=False))
+    _remove_after_commit(db, [url.lstrip("/") for _, url in rows if url])
+    return len(rows)
+
+
+def _by_user(*columns):
+    return lambda job: [or_(*[column == job.target_id for column in columns])]
+
+
+USER_PLAN: List[Step] = [
+    remove_files("user_files", _user_files),
+    nullify("notification_senders", Notification, Notification.sender_id, _by_user(Notification.sender_id)),
+    nullify("role_assigners", UserRole, UserRole.assigned_by, _by_user(UserRole.assigned_by)),
+    nullify("setting_editors", SystemSetting, SystemSetting.updated_by, _by_user(SystemSetting.updated_by)),
+    nullify("feedback_resolvers", Feedback, Feedback.resolved_by, _by_user(Feedback.resolved_by)),
+    delete_rows("goal_progress_logs", GoalProgressLog, lambda job: [GoalProgressLog.goal_id.in_(_user_goals(job))]),
+    delete_rows("study_sessions", StudySession, _by_user(StudySession.user_id)),
+    delete_rows("pomodoro_sessions", PomodoroSession, _by_user(PomodoroSession.user_id)),
+    delete_rows("task_chat_history", TaskChatHistory, lambda job: [
+        or_(TaskChatHistory.user_id == job.target_id, TaskChatHistory.task_id.in_(_user_tasks(job)))
+    ]),
+    delete_rows("tasks", Task, _by_user(Task.user_id, Task.created_by), newest_first=True),
+    delete_rows("schedules", Schedule, _by_user(Schedule.user_id, Schedule.created_by)),
+    delete_rows("study_reports", StudyReport, _by_user(StudyReport.user_id)),
+    delete_rows("subject_statistics", SubjectStatistic, _by_user(SubjectStatistic.user_id)),
+    delete_rows("subjects", Subject, _by_user(Subject.user_id)),
+    delete_rows("task_groups", TaskGroup, _by_user(TaskGroup.user_id)),
+    delete_rows("goals", Goal, _by_user(Goal.user_id, Goal.created_by)),
+    delete_rows("notes", Note, _by_user(Note.user_id)),
+    delete_rows("user_achievements", UserAchievement, _by_user(UserAchievement.user_id)),
+    delete_rows("notifications", Notification, _by_user(Notification.user_id)),
+    delete_rows("chat_history", ChatHistory, _by_user(ChatHistory.user_id)),
+    delete_rows("ai_interactions", AIInteraction, _by_user(AIInteraction.user_id)),
+    delete_rows("activity_logs", ActivityLog, _by_user(ActivityLog.user_id)),
+    delete_rows("feedback", Feedback, _by_user(Feedback.user_id)),
+    delete_rows("direct_messages", DirectMessage, _by_user(DirectMessage.sender_id, DirectMessage.receiver_id)),
+    delete_rows("friend_requests", FriendRequest, _by_user(FriendRequest.sender_id, FriendRequest.receiver_id)),
+    delete_rows("friend_relationships", FriendRelationship, _by_user(FriendRelationship.user_id, FriendRelationship.friend_id)),
+    delete_rows("channel_messages_sent", SubjectChannelMessage, _by_user(SubjectChannelMessage.user_id)),
+    delete_rows("channel_memberships", SubjectChannelMember, _by_user(SubjectChannelMember.user_id)),
+    delete_rows("channel_join_requests_sent", ChannelJoinRequest, _by_user(ChannelJoinRequest.user_id)),
+    *[Step(f"owned_{step.name}", step.run, step.repeat) for step in _channel_steps(_owned_channels)],
+    delete_rows("room_messages_sent", StudyRoomMessage, _by_user(StudyRoomMessage.user_id)),
+    delete_rows("room_memberships", StudyRoomMember, _by_user(StudyRoomMember.user_id)),
+    *[Step(f"owned_{step.name}", step.run, step.repeat) for step in _room_steps(_owned_rooms)],
+    Step("resources", _purge_resources),
+    delete_rows("user_profile", UserProfile, _by_user(UserProfile.user_id)),
+    delete_rows("user_preferences", UserPreference, _by_user(UserPreference.user_id)),
+    delete_rows("user_roles", UserRole, _by_user(UserRole.user_id)),
+    delete_rows("user", User, lambda job: [User.id == job.target_id, User.is_active == False]),  # noqa: E712
+]
+
+
+def _pair(job):
+    """(user_id, friend_id) của job friendship"""
+    return job.target_id, _params(job)["friend_id"]
+
+
+def _between(sender_col, receiver_col, created_col):
+    """Dữ liệu giữa 2 người, chỉ tính bản ghi tạo TRƯỚC khi hủy kết bạn (kết bạn lại thì giữ tin mới)"""
+    def where(job):
+        a, b = _pair(job)
+        return [
+            or_(and_(sender_col == a, receiver_col == b), and_(sender_col == b, receiver_col == a)),
+            created_col <= job.created_at,
+        ]
+    return where
+
+
+# Quan hệ + lời mời đã xóa ngay trong request (friends.remove_friend)
+FRIENDSHIP_PLAN: List[Step] = [
+    delete_rows("direct_messages", DirectMessage,
+                _between(DirectMessage.sender_id, DirectMessage.receiver_id, DirectMessage.created_at)),
+    delete_notifications("notifications", lambda job: [
+        *_between(Notification.user_id, Notification.sender_id, Notification.created_at)(job),
+        Notification.notification_type.in_(["friend_request", "friend_accepted", "direct_message"]),
+    ]),
+]
+
+CHANNEL_PLAN: List[Step] = [
+    delete_notifications("notifications", lambda job: [
+        Notification.title.contains(_params(job)["subject_name"]),
+        Notification.notification_type.in_(["join_request", "community", "community_message"]),
+        Notification.created_at <= job.created_at,
+    ]),
+    *_channel_steps(lambda job: [job.target_id]),
+]
+
+ROOM_PLAN: List[Step] = _room_steps(lambda job: [job.target_id])
+
+PURGE_PLANS: Dict[str, List[Step]] = {
+    "user": USER_PLAN,
+    "room": ROOM_PLAN,
+    "channel": CHANNEL_PLAN,
+    "friendship": FRIENDSHIP_PLAN,
+}
+
+
+def enqueue_purge(db, kind: str, target_id: int, params: Optional[dict] = None, requested_by: Optional[int] = None) -> PurgeJob:
+    """
+    Thêm job vào session của request (Session hoặc AsyncSession) - commit cùng
+    thay đổi "đánh dấu đã xóa". Sau commit gọi purge_worker.wake().
+    """
+    if kind not in PURGE_PLANS:
+        raise ValueError(f"Unknown purge job kind: {kind}")
+    job = PurgeJob(
+        kind=kind, target_id=target_id, params=json.dumps(params) if params else None,
+        requested_by=requested_by, status="pending", step=0, deleted_rows=0, attempts=0,
+        created_at=datetime.now(),
+    )
+    db.add(job)
+    return job
+
+
+def job_progress(job: PurgeJob) -> dict:
+    plan = PURGE_PLANS.get(job.kind, [])
+    step = job.step or 0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "status": job.status,
+        "step": step,
+        "total_steps": len(plan),
+        "current_step": plan[step].name if job.status != "done" and step < len(plan) else None,
+        "percent": round(100 * (1 if job.status == "done" else step / len(plan)), 1) if plan else 0,
+        "deleted_rows": job.deleted_rows or 0,
+        "progress": json.loads(job.progress or "{}"),
+        "attempts": job.attempts or 0,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class PurgeWorker:
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task = None
+        self._wake = asyncio.Event()
+
+    async def start(self):
+        if PURGE_WORKER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self):
+        """Gọi sau khi commit job mới để không phải chờ tới lượt poll"""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                job_id = await self._claim()
+                if job_id is not None:
+                    await self.run_job(job_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Purge] Worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=PURGE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _claimable(self, now: datetime):
+        stale = now - timedelta(seconds=PURGE_STALE_SECONDS)
+        retry_after = now - timedelta(seconds=PURGE_RETRY_SECONDS)
+        return or_(
+            and_(PurgeJob.status == "pending", or_(PurgeJob.heartbeat_at == None, PurgeJob.heartbeat_at < retry_after)),  # noqa: E711
+            and_(PurgeJob.status == "running", PurgeJob.heartbeat_at < stale),
+        )
+
+    async def _claim(self) -> Optional[int]:
+        """Nhận 1 job: pending hoặc running nhưng worker cũ đã chết (heartbeat quá hạn)"""
+        async with AsyncSessionLocal() as db:
+            now = datetime.now()
+            candidates = (await db.execute(
+                select(PurgeJob.id).where(self._claimable(now)).order_by(PurgeJob.id).limit(5)
+            )).scalars().all()
+            for job_id in candidates:
+                result = await db.execute(
+                    update(PurgeJob)
+                    .where(PurgeJob.id == job_id, self._claimable(now))
+                    .values(status="running", locked_by=self.worker_id, heartbeat_at=now, attempts=PurgeJob.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return job_id
+        return None
+
+    async def _heartbeat(self, db, job: PurgeJob, **values) -> bool:
+        """Ghi tiến độ trong transaction của lô; False nếu job đã bị worker khác nhận lại"""
+        result = await db.execute(
+            update(PurgeJob)
+            .where(PurgeJob.id == job.id, PurgeJob.locked_by == self.worker_id)
+            .values(heartbeat_at=datetime.now(), **values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    async def run_job(self, job_id: int):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(PurgeJob, job_id)
+            plan = PURGE_PLANS.get(job.kind)
+            if plan is None:
+                job.status, job.error = "failed", f"Unknown purge job kind: {job.kind}"
+                await db.commit()
+                return
+            progress = json.loads(job.progress or "{}")
+            deleted = job.deleted_rows or 0
+            attempts = job.attempts or 0
+            index = job.step or 0
+            print(f"[Purge] Job {job_id} ({job.kind} {job.target_id}) starting at step {index}/{len(plan)}")
+            try:
+                for index in range(index, len(plan)):
+                    step = plan[index]
+                    while True:
+                        count = await step.run(db, job, PURGE_BATCH_SIZE)
+                        progress[step.name] = progress.get(step.name, 0) + count
+                        deleted += count
+                        more = step.repeat and count >= PURGE_BATCH_SIZE
+                        # Lô + tiến độ commit cùng nhau: crash giữa lô thì cả hai cùng rollback
+                        if not await self._heartbeat(
+                            db, job, step=index if more else index + 1,
+                            deleted_rows=deleted, progress=json.dumps(progress),
+                        ):
+                            await db.rollback()
+                            await _flush_after_commit(db, committed=False)
+                            print(f"[Purge] Job {job_id} was taken over by another worker")
+                            return
+                        await db.commit()
+                        await _flush_after_commit(db)
+                        if not more:
+                            break
+                        await asyncio.sleep(PURGE_BATCH_PAUSE)
+                await self._heartbeat(db, job, status="done", finished_at=datetime.now(), error=None)
+                await db.commit()
+                print(f"[Purge] Job {job_id} done: {deleted} rows")
+            except asyncio.CancelledError:
+                # Tắt worker: job giữ "running", worker khác nhận lại khi heartbeat quá hạn
+                await db.rollback()
+                await _flush_after_commit(db, committed=False)
+                raise
+            except Exception as e:
+                await db.rollback()
+                await _flush_after_commit(db, committed=False)
+                failed = attempts >= PURGE_MAX_ATTEMPTS
+                # heartbeat_at = now: job "pending" chỉ được nhận lại sau PURGE_RETRY_SECONDS
+                await db.execute(
+                    update(PurgeJob).where(PurgeJob.id == job_id, PurgeJob.locked_by == self.worker_id)
+                    .values(status="failed" if failed else "pending", error=str(e)[:2000], locked_by=None, heartbeat_at=datetime.now())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                print(f"[Purge] Job {job_id} error at step {index} (attempt {attempts}): {e}")
+
+
+purge_worker = PurgeWorker()
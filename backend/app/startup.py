@@ -0,0 +1,171 @@
+"""
+Khởi động / readiness của worker.
+
+Worker không tạo bảng lúc import nữa: schema do Alembic quản lý (`python scripts/migrate.py`
+chạy 1 lần khi deploy). Khi khởi động, worker chỉ kiểm tra DB đã ở revision head,
+seed dữ liệu mặc định (idempotent) và (nếu AI_MODEL_EAGER=1) nạp model AI ở nền. Trong lúc đó
+/stms/ready trả 503 để load balancer chưa chuyển traffic tới.
+
+DB_AUTO_CREATE=1: dùng Base.metadata.create_all thay cho kiểm tra Alembic (dev/test).
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from .database import AsyncSessionLocal, Base, async_engine, engine
+from .models.models import Role
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "0") == "1"
+# Thời gian chờ giữa các lần thử lại khi DB chưa sẵn sàng / chưa migrate
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "2"))
+# AI_MODEL_EAGER=1: nạp model (joblib/scikit-learn) ngay lúc khởi động.
+# Mặc định nạp ở request kiểm duyệt đầu tiên để worker khởi động nhanh và nhẹ hơn.
+AI_MODEL_EAGER = os.getenv("AI_MODEL_EAGER", "0") == "1"
+
+DEFAULT_ROLES = [
+    {"role_name": "admin", "role_description": "Administrator"},
+    {"role_name": "student", "role_description": "Student"},
+]
+
+
+class Readiness:
+    """Trạng thái các bước khởi động; /stms/ready chỉ 200 khi mọi bước xong"""
+
+    def __init__(self):
+        self.database = False
+        self.model = False
+        self.detail = {"database": "starting", "model": "starting"}
+        self._tasks = []
+
+    @property
+    def ready(self) -> bool:
+        return self.database and self.model
+
+
+readiness = Readiness()
+
+
+def _alembic_heads() -> set:
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+async def check_schema() -> Optional[str]:
+    """None nếu schema đúng head; ngược lại trả về lý do"""
+    if DB_AUTO_CREATE:
+        await asyncio.to_thread(Base.metadata.create_all, bind=engine)
+        return None
+    heads = await asyncio.to_thread(_alembic_heads)
+    async with async_engine.connect() as conn:
+        try:
+            rows = await conn.execute(text("SELECT version_num FROM alembic_version"))
+            current = {row[0] for row in rows}
+        except Exception:
+            # Postgres hủy transaction sau lỗi, rollback để còn kiểm tra tiếp
+            await conn.rollback()
+            current = set()
+        legacy = not current and await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("users"))
+    if legacy:
+        # Bảng do create_all tạo từ trước khi dùng Alembic: upgrade sẽ cố tạo lại bảng
+        return "schema has no alembic_version (run `python scripts/migrate.py` or `alembic stamp be27eb945d93 && alembic upgrade head`)"
+    if current != heads:
+        return f"migrations pending: database at {sorted(current) or 'empty'}, head is {sorted(heads)} (run `python scripts/migrate.py`)"
+    return None
+
+
+async def seed_defaults():
+    """Seed role mặc định; nhiều worker chạy cùng lúc cũng an toàn (role_name unique)"""
+    async with AsyncSessionLocal() as db:
+        existing = set((await db.execute(select(Role.role_name))).scalars().all())
+        missing = [role for role in DEFAULT_ROLES if role["role_name"] not in existing]
+        if not missing:
+            return
+        try:
+            db.add_all([Role(**role) for role in missing])
+            await db.commit()
+            print("Default roles seeded.")
+        except IntegrityError:
+            # Worker khác vừa seed xong
+            await db.rollback()
+
+
+async def _prepare_database():
+    while True:
+        try:
+            problem = await check_schema()
+            if problem is None:
+                await seed_defaults()
+                readiness.database = True
+                readiness.detail["database"] = "ok"
+                print("[Startup] Database schema is up to date")
+                return
+            if readiness.detail["database"] != problem:
+                print(f"[Startup] {problem}")
+            readiness.detail["database"] = problem
+        except Exception as e:
+            if not readiness.detail["database"].startswith("waiting"):
+                print(f"[Startup] Waiting for database to be ready... {e}")
+            readiness.detail["database"] = f"waiting for database: {e}"
+        await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+
+async def _load_model():
+    from .ai import ai_filter
+
+    if not AI_MODEL_EAGER:
+        readiness.model = True
+        readiness.detail["model"] = "lazy"
+        return
+    await asyncio.to_thread(ai_filter.load_model)
+    readiness.model = True
+    # Không có file model vẫn chạy được (chỉ lọc bằng từ khóa)
+    readiness.detail["model"] = "loaded" if ai_filter.model_loaded() else "keyword-only"
+
+
+def start():
+    """Chạy các bước khởi động ở nền: worker nhận kết nối ngay, ready khi xong"""
+    readiness._tasks = [
+        asyncio.create_task(_prepare_database()),
+        asyncio.create_task(_load_model()),
+    ]
+
+
+def stop():
+    for task in readiness._tasks:
+        task.cancel()
+    readiness._tasks = []
+
+
+async def check_ready() -> dict:
+    """Kiểm tra nhanh tại thời điểm gọi: DB và Redis còn phản hồi không"""
+    from .utils.cache import redis_client
+
+    status = {"startup": dict(readiness.detail)}
+    checks = {}
+    try:
+        async with async_engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=2)
+        checks["database"] = True
+    except Exception as e:
+        checks["database"] = False
+        status["database_error"] = str(e)
+    try:
+        await asyncio.wait_for(redis_client.ping(), timeout=2)
+        checks["redis"] = True
+    except Exception as e:
+        checks["redis"] = False
+        status["redis_error"] = str(e)
+    checks["schema"] = readiness.database
+    checks["model"] = readiness.model
+    status["checks"] = checks
+    status["ready"] = all(checks.values())
+    return status
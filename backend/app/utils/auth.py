@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from typing import List, Optional, Union, Any
 from jose import jwt
 import os
 import json
@@ -13,22 +13,19 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 43200
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models.models import User
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from ..database import get_db, get_async_db
+from ..models.models import User, UserRole
+from .cache import _redis_call, redis_client
+from .config import config_service
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/stms/auth/login")
 
 def is_maintenance_mode():
-    config_file = "server_config.json"
-    if os.path.exists(config_file):
-        try:
-            with open(config_file, "r") as f:
-                config = json.load(f)
-                return config.get("maintenance_mode", False)
-        except Exception:
-            return False
-    return False
+    return bool(config_service.get("maintenance_mode", False))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -47,54 +44,166 @@ def decode_access_token(token: str):
     except:
         return None
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Cache user đã xác thực theo subject của token (username): hot path không cần query DB.
+# TTL ngắn để giới hạn dữ liệu cũ nếu lỡ 1 lần invalidate (vd: Redis lỗi đúng lúc đó).
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))
+
+
+class CurrentUser(BaseModel):
+    """User đã xác thực (chỉ các trường cần cho phân quyền/hiển thị), lưu được trong cache"""
+    id: int
+    username: str
+    email: str
+    full_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    is_active: bool = True
+    roles: List[str] = []
+    role_version: int = 0
+
+    @property
+    def is_admin(self) -> bool:
+        return "admin" in self.roles
+
+    @classmethod
+    def from_orm_user(cls, user: User) -> "CurrentUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            avatar_url=user.avatar_url,
+            is_active=user.is_active is not False,
+            roles=[r.role.role_name for r in user.roles if r.role],
+            role_version=user.role_version or 0,
+        )
+
+
+def _auth_cache_key(username: str) -> str:
+    return f"auth:user:{username}"
+
+
+def bump_role_version(user: User):
+    """
+    Gọi trong transaction gán/gỡ role (trước commit), sau commit gọi invalidate_user_cache
+    và invalidate_user_cards (card có cờ admin):
+    token cũ (claim "rv" cũ) không còn được tin claim roles. Version nằm ở users.role_version
+    nên Redis mất dữ liệu cũng không làm token cũ được tin lại.
+    Đây là nơi duy nhất tăng version (DB không có trigger): mọi code sửa user_roles
+    của user đã có token phải gọi hàm này.
+    """
+    user.role_version = User.role_version + 1
+
+
+async def _resolve_user(payload: dict, load) -> Optional[CurrentUser]:
+    """
+    CurrentUser cho token đã giải mã: 1 lệnh GET user cache, miss -> `load()` (ORM User kèm roles)
+    rồi lưu lại. Claim roles chỉ được dùng khi "rv" khớp role_version đọc từ cache/DB.
+    """
+    username = payload.get("sub")
+    token_id, token_roles, token_rv = payload.get("id"), payload.get("roles"), payload.get("rv")
+
+    ok, cached = await _redis_call(lambda: redis_client.get(_auth_cache_key(username)))
+    user = None
+    if ok and cached:
+        try:
+            user = CurrentUser.model_validate_json(cached)
+        except ValueError:
+            pass
+    if user is None:
+        orm_user = await load()
+        if orm_user is None:
+            return None
+        user = CurrentUser.from_orm_user(orm_user)
+        await _redis_call(lambda: redis_client.setex(_auth_cache_key(username), AUTH_CACHE_TTL, user.model_dump_json()))
+
+    if token_id is not None and token_id != user.id:
+        # Username đã được cấp lại cho tài khoản khác -> token cũ không hợp lệ
+        return None
+    if isinstance(token_roles, list) and isinstance(token_rv, int) and token_rv == user.role_version:
+        user.roles = list(token_roles)
+    return user
+
+
+async def invalidate_user_cache(username: str):
+    """Gọi sau khi đổi profile/role/mật khẩu hoặc xóa tài khoản"""
+    await _redis_call(lambda: redis_client.delete(_auth_cache_key(username)))
+
+
+def _token_payload(token: str) -> Optional[dict]:
+    payload = decode_access_token(token)
+    if payload is None or payload.get("sub") is None:
+        return None
+    return payload
+
+
+def _check_maintenance(user: CurrentUser):
+    if is_maintenance_mode() and not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hệ thống đang trong chế độ bảo trì. Vui lòng quay lại sau."
+        )
+
+
+async def _load_user_async(db: AsyncSession, username: str):
+    """Load user kèm roles (eager) để không phải lazy-load trong AsyncSession"""
+    result = await db.execute(
+        select(User)
+        .options(selectinload(User.roles).selectinload(UserRole.role))
+        .where(User.username == username)
+    )
+    return result.scalars().first()
+
+async def get_current_async_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> CurrentUser:
+    """
+    Xác thực qua cache: cache hit không chạm DB (AsyncSession chỉ mở kết nối khi miss).
+    Quyền lấy từ claim roles đã ký trong token (nếu role version còn khớp).
+    Trả về CurrentUser, không phải ORM User.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    payload = decode_access_token(token)
+    payload = _token_payload(token)
     if payload is None:
         raise credentials_exception
-    username: str = payload.get("sub")
-    if username is None:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
+    user = await _resolve_user(payload, lambda: _load_user_async(db, payload["sub"]))
     if user is None:
         raise credentials_exception
+    _check_maintenance(user)
+    return user
 
-    if is_maintenance_mode():
-        is_admin = any(r.role.role_name == "admin" for r in user.roles)
-        if not is_admin:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Hệ thống đang trong chế độ bảo trì. Vui lòng quay lại sau."
-            )
-
+def get_current_user(current: CurrentUser = Depends(get_current_async_user), db: Session = Depends(get_db)):
+    """
+    ORM User (session đồng bộ) cho các route cần sửa user hoặc đọc quan hệ (profile, ...).
+    Hàm thường (không async) để FastAPI chạy trong threadpool: db.get không chặn event loop.
+    """
+    user = db.get(User, current.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: CurrentUser = Depends(get_current_async_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def get_current_user_ws(token: str, db: Session):
+async def get_current_user_ws(token: str, db: AsyncSession):
     """
     Cơ chế xác thực WebSocket. 
     WebSockets không hỗ trợ dễ dàng Authorization headers nguyên bản trong browser,
     nên ta truyền token trong URL hoặc query parameters.
     """
-    payload = decode_access_token(token)
+    payload = _token_payload(token)
     if payload is None:
         return None
-    username: str = payload.get("sub")
-    if username is None:
-        return None
-    user = db.query(User).filter(User.username == username).first()
+    user = await _resolve_user(payload, lambda: _load_user_async(db, payload["sub"]))
     
-    if user and is_maintenance_mode():
-        is_admin = any(r.role.role_name == "admin" for r in user.roles)
-        if not is_admin:
-            return None
+    if user and is_maintenance_mode() and not user.is_admin:
+        return None
             
     return user
@@ -1,22 +1,624 @@
 import os
 import json
-import redis
+import time
+import asyncio
+import redis.asyncio as aioredis
 import functools
+import struct
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
 from fastapi import Request, Response
 from pydantic import BaseModel
+from ..database import AsyncSessionLocal
+from .serializer import json_response, serialize
 
-# Khởi tạo kết nối Redis
+# Khởi tạo kết nối Redis (async, 1 connection pool dùng chung cho cả worker)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-redis_client = redis.from_url(REDIS_URL)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Timeout ngắn: Redis chậm thì bỏ qua cache thay vì treo request
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+redis_client = aioredis.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+)
 
-def get_cache_key(request: Request, user_id: int) -> str:
+
+
+class CircuitBreaker:
+    """
+    Ngắt mạch cho Redis: sau `failure_threshold` lỗi liên tiếp thì bỏ qua cache
+    trong `cooldown` giây, sau đó cho 1 request thử lại (half_open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.stats = {"failures": 0, "opened": 0, "skipped": 0}
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            return True
+        self.stats["skipped"] += 1
+        return False
+
+    def record_success(self) -> bool:
+        """Trả về True nếu mạch vừa đóng lại sau khi mở"""
+        recovered = self.state != "closed"
+        self.state = "closed"
+        self.failures = 0
+        return recovered
+
+    def record_failure(self) -> bool:
+        """Trả về True nếu mạch vừa chuyển sang open"""
+        self.failures += 1
+        self.stats["failures"] += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            return True
+        return False
+
+    def snapshot(self) -> dict:
+        retry_in = 0.0
+        if self.state == "open":
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(retry_in, 1),
+            **self.stats,
+        }
+
+
+cache_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("CACHE_BREAKER_THRESHOLD", "5")),
+    cooldown=float(os.getenv("CACHE_BREAKER_COOLDOWN", "30")),
+)
+# Có invalidate bị bỏ lỡ khi mạch mở -> tăng epoch khi Redis hoạt động lại
+_missed_invalidation = False
+
+
+async def _redis_call(op):
+    """
+    Chạy 1 thao tác Redis qua circuit breaker.
+    Trả về (True, kết quả) hoặc (False, None) nếu bị bỏ qua/lỗi.
+    """
+    global _missed_invalidation
+    if not cache_breaker.allow():
+        return False, None
+    try:
+        result = await op()
+    except Exception as e:
+        # Mọi lỗi cache (kết nối, timeout, ...) đều không được làm hỏng request
+        print(f"[Redis Cache Error]: {e}")
+        if cache_breaker.record_failure():
+            print(f"[Redis Cache] Circuit open, skipping cache for {cache_breaker.cooldown}s")
+            # Không nhận được pub/sub trong lúc mạch mở -> bỏ dữ liệu cục bộ
+            local_cache.clear()
+        return False, None
+    if cache_breaker.record_success():
+        print("[Redis Cache] Circuit closed")
+        if _missed_invalidation:
+            _missed_invalidation = False
+            await _redis_call(_bump_epoch)
+    return True, result
+
+# Kênh pub/sub báo cho mọi worker xóa cache cục bộ
+INVALIDATE_CHANNEL = "cache:invalidate"
+
+# Mỗi namespace (vd: /stms/tasks) của mỗi user có 1 bộ đếm version, cộng thêm 1 epoch toàn cục.
+# Version nằm trong cache key -> invalidate chỉ cần INCR (O(1)), key cũ tự hết hạn theo TTL.
+EPOCH_KEY = "cache:epoch"
+
+
+def get_namespace(path: str) -> str:
+    """Namespace = 2 đoạn đầu của path, vd: /stms/tasks/groups -> /stms/tasks"""
+    parts = [p for p in path.split("/") if p]
+    return "/" + "/".join(parts[:2])
+
+
+def get_version_key(namespace: str, user_id: int) -> str:
+    return f"cache:ver:{namespace}:user:{user_id}"
+
+
+async def get_cache_version(namespace: str, user_id: int) -> str:
+    """Lấy version hiện tại (epoch.version) của namespace cho user"""
+    epoch, version = await redis_client.mget(EPOCH_KEY, get_version_key(namespace, user_id))
+    if epoch is None:
+        epoch = await _seed_epoch()
+    return f"{int(epoch)}.{int(version or 0)}"
+
+
+async def _seed_epoch() -> int:
+    """
+    Redis mới/khởi động lại: epoch bắt đầu từ timestamp thay vì 0, để version
+    (và ETag client đang giữ) không lặp lại giá trị của lần chạy trước.
+    """
+    await redis_client.set(EPOCH_KEY, int(time.time()), nx=True)
+    return int(await redis_client.get(EPOCH_KEY) or 0)
+
+
+def _versioned_key(path: str, user_id: int, version: str) -> str:
+    return f"cache:{path}:user:{user_id}:v{version}"
+
+
+async def build_cache_key(path: str, user_id: int) -> str:
+    """Tạo cache key gắn version cho path và user"""
+    version = await get_cache_version(get_namespace(path), user_id)
+    return _versioned_key(path, user_id, version)
+
+
+async def get_cache_key(request: Request, user_id: int) -> str:
     """Tạo cache key duy nhất dựa trên URL path và user ID."""
-    return f"cache:{request.url.path}:user:{user_id}"
+    return await build_cache_key(request.url.path, user_id)
+
+
+# Tầng cache cục bộ (mỗi worker): LRU + TTL, giữ JSON bytes sẵn sàng trả về client
+
+# Cấu hình mặc định theo namespace; ghi đè bằng env LOCAL_CACHE_NAMESPACES (JSON),
+# vd: {"/stms/tasks": {"max_entries": 5000, "ttl": 30}}
+LOCAL_CACHE_DEFAULTS = {"max_entries": 1000, "ttl": 30}
+LOCAL_CACHE_NAMESPACES: Dict[str, dict] = {
+    "/stms/tasks": {"max_entries": 2000, "ttl": 30},
+    "/stms/schedules": {"max_entries": 2000, "ttl": 30},
+}
+LOCAL_CACHE_NAMESPACES.update(json.loads(os.getenv("LOCAL_CACHE_NAMESPACES", "{}")))
+
+
+class LocalCacheNamespace:
+    """LRU/TTL cho 1 namespace, key = (user_id, path); mỗi entry nhớ version lúc được lưu"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[int, str], Tuple[float, Optional[str], Any]]" = OrderedDict()
+        self.user_paths: Dict[int, Set[str]] = {}
+        self.generations: Dict[int, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "outdated": 0, "invalidations": 0}
+
+    def get(self, user_id: int, path: str, version: Optional[str] = None):
+        """version: version hiện tại (từ ETag); entry lưu ở version khác coi như miss"""
+        key = (user_id, path)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        if version is not None and entry[1] != version:
+            # Lỡ tin pub/sub (hoặc tin đến trễ): không trả body cũ kèm ETag mới
+            self._remove(key)
+            self.stats["outdated"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[2]
+
+    def set(self, user_id: int, path: str, value: Any, generation: int, version: Optional[str] = None):
+        # Có invalidate xảy ra trong lúc lấy dữ liệu -> không lưu dữ liệu cũ
+        if self.generations.get(user_id, 0) != generation:
+            return
+        key = (user_id, path)
+        self.entries[key] = (time.monotonic() + self.ttl, version, value)
+        self.entries.move_to_end(key)
+        self.user_paths.setdefault(user_id, set()).add(path)
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate_user(self, user_id: int):
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        for path in self.user_paths.pop(user_id, set()):
+            self.entries.pop((user_id, path), None)
+        self.stats["invalidations"] += 1
+
+    def clear(self):
+        for user_id in list(self.user_paths):
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        self.entries.clear()
+        self.user_paths.clear()
+        self.stats["invalidations"] += 1
+
+    def _remove(self, key: Tuple[int, str]):
+        self.entries.pop(key, None)
+        paths = self.user_paths.get(key[0])
+        if paths is not None:
+            paths.discard(key[1])
+            if not paths:
+                del self.user_paths[key[0]]
+
+
+class LocalCache:
+    """Các namespace cục bộ của worker (chỉ truy cập từ event loop)"""
+
+    def __init__(self):
+        self.namespaces: Dict[str, LocalCacheNamespace] = {}
+
+    def _namespace(self, namespace: str) -> Optional[LocalCacheNamespace]:
+        ns = self.namespaces.get(namespace)
+        if ns is None:
+            config = {**LOCAL_CACHE_DEFAULTS, **LOCAL_CACHE_NAMESPACES.get(namespace, {})}
+            if config["max_entries"] <= 0:
+                return None
+            ns = self.namespaces[namespace] = LocalCacheNamespace(config["max_entries"], config["ttl"])
+        return ns
+
+    def get(self, path: str, user_id: int, version: Optional[str] = None):
+        ns = self._namespace(get_namespace(path))
+        return ns.get(user_id, path, version) if ns else None
+
+    def generation(self, path: str, user_id: int) -> int:
+        ns = self._namespace(get_namespace(path))
+        return ns.generations.get(user_id, 0) if ns else 0
+
+    def set(self, path: str, user_id: int, value: Any, generation: int, version: Optional[str] = None):
+        ns = self._namespace(get_namespace(path))
+        if ns:
+            ns.set(user_id, path, value, generation, version)
+
+    def invalidate(self, namespace: str, user_id: int):
+        ns = self.namespaces.get(namespace)
+        if ns:
+            ns.invalidate_user(user_id)
+
+    def clear(self):
+        for ns in self.namespaces.values():
+            ns.clear()
+
+    def get_stats(self) -> Dict[str, dict]:
+        return {
+            name: {**ns.stats, "size": len(ns.entries), "max_entries": ns.max_entries, "ttl": ns.ttl}
+            for name, ns in self.namespaces.items()
+        }
+
+
+local_cache = LocalCache()
+
+
+class CacheLookup:
+    """Kết quả tra cache: data=None nếu miss; key=None nếu Redis lỗi (bỏ qua ghi cache)"""
+
+    def __init__(self, path: str, user_id: int, version: Optional[str] = None):
+        self.path = path
+        self.user_id = user_id
+        # Version (epoch.version) mà key/body ứng với; ETag trả về phải là version này
+        self.version = version
+        self.key: Optional[str] = None
+        self.generation = local_cache.generation(path, user_id)
+        self.data = None
+        self.source = None
+        # Dữ liệu đã quá expire_seconds nhưng còn trong cửa sổ stale
+        self.stale = False
+
+
+# Giá trị trong Redis: 1 byte định dạng + 8 byte fresh_until + body JSON (nén zlib nếu lớn)
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "4096"))
+_ENTRY_HEADER = struct.Struct(">cd")
+
+
+def _encode_entry(body: bytes, fresh_until: float) -> bytes:
+    fmt = b"j"
+    if CACHE_COMPRESS_MIN_BYTES > 0 and len(body) >= CACHE_COMPRESS_MIN_BYTES:
+        body = zlib.compress(body, 1)
+        fmt = b"z"
+    return _ENTRY_HEADER.pack(fmt, fresh_until) + body
+
+
+def _decode_entry(raw: bytes) -> Tuple[Optional[bytes], float]:
+    """Trả về (body JSON, fresh_until); body=None nếu định dạng không hợp lệ (coi như miss)"""
+    if len(raw) < _ENTRY_HEADER.size:
+        return None, 0.0
+    fmt, fresh_until = _ENTRY_HEADER.unpack_from(raw)
+    body = raw[_ENTRY_HEADER.size:]
+    if fmt == b"z":
+        return zlib.decompress(body), fresh_until
+    if fmt == b"j":
+        return body, fresh_until
+    return None, 0.0
+
+
+async def cache_lookup(path: str, user_id: int, version: Optional[str] = None) -> CacheLookup:
+    """
+    Tra cache cục bộ trước, sau đó Redis. Mạch mở -> luôn miss.
+    version: version đã đọc để tính ETag; có thì entry cục bộ phải cùng version và
+    key Redis dựng thẳng từ version này (không cần đọc lại version).
+    """
+    lookup = CacheLookup(path, user_id, version)
+    if cache_breaker.state == "closed":
+        data = local_cache.get(path, user_id, version)
+        if data is not None:
+            lookup.data, lookup.source = data, "local"
+            return lookup
+
+    async def _get():
+        current = version or await get_cache_version(get_namespace(path), user_id)
+        key = _versioned_key(path, user_id, current)
+        return current, key, await redis_client.get(key)
 
-def cache_response(expire_seconds: int = 180):
+    ok, result = await _redis_call(_get)
+    if ok:
+        lookup.version, lookup.key, cached_data = result
+        if cached_data:
+            lookup.data, fresh_until = _decode_entry(cached_data)
+            if lookup.data is None:
+                return lookup
+            lookup.source = "redis"
+            lookup.stale = time.time() > fresh_until
+            if not lookup.stale:
+                local_cache.set(path, user_id, lookup.data, lookup.generation, lookup.version)
+    return lookup
+
+
+async def cache_store(lookup: CacheLookup, body: bytes, expire_seconds: int = 180, stale_seconds: int = 0):
+    """
+    Lưu JSON bytes (từ utils.serializer) vào Redis và cache cục bộ.
+    Key sống thêm stale_seconds sau khi hết hạn để phục vụ stale-while-revalidate.
+    """
+    if lookup.key is None:
+        return
+    payload = _encode_entry(body, time.time() + expire_seconds)
+    ok, _ = await _redis_call(lambda: redis_client.setex(lookup.key, expire_seconds + stale_seconds, payload))
+    if ok:
+        local_cache.set(lookup.path, lookup.user_id, body, lookup.generation, lookup.version)
+
+
+# Single-flight: chỉ 1 request nạp lại cache cho mỗi key
+# - trong worker: các request cùng key chờ chung 1 Future
+# - giữa các worker: khóa Redis SET NX, worker khác chờ giá trị xuất hiện
+FILL_LOCK_MS = int(os.getenv("CACHE_FILL_LOCK_MS", "10000"))
+FILL_WAIT_SECONDS = float(os.getenv("CACHE_FILL_WAIT_SECONDS", "2.0"))
+FILL_POLL_SECONDS = 0.05
+# Cửa sổ stale-while-revalidate mặc định cho các list endpoint (0 = tắt)
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", "60"))
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+_inflight: Dict[str, asyncio.Future] = {}
+_refreshing: Dict[str, asyncio.Task] = {}
+
+
+async def _acquire_fill_lock(cache_key: str) -> Tuple[bool, Optional[str]]:
+    """Trả về (redis_ok, token); token=None nếu worker khác đang giữ khóa"""
+    token = uuid.uuid4().hex
+    ok, acquired = await _redis_call(
+        lambda: redis_client.set(f"lock:{cache_key}", token, nx=True, px=FILL_LOCK_MS)
+    )
+    return ok, (token if acquired else None)
+
+
+async def _release_fill_lock(cache_key: str, token: str):
+    await _redis_call(lambda: redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{cache_key}", token))
+
+
+async def _wait_for_fill(lookup: CacheLookup):
+    """Chờ worker đang giữ khóa ghi giá trị vào Redis"""
+    deadline = time.monotonic() + FILL_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(FILL_POLL_SECONDS)
+        ok, raw = await _redis_call(lambda: redis_client.get(lookup.key))
+        if not ok:
+            return None
+        if raw:
+            body = _decode_entry(raw)[0]
+            if body is not None:
+                return body
+    return None
+
+
+async def _fill(lookup: CacheLookup, db, loader, expire_seconds: int, stale_seconds: int):
+    ok, token = await _acquire_fill_lock(lookup.key)
+    if ok and token is None:
+        data = await _wait_for_fill(lookup)
+        if data is not None:
+            lookup.source = "redis"
+            return data
+    try:
+        data = await loader(db)
+        await cache_store(lookup, data, expire_seconds, stale_seconds)
+        lookup.source = "db"
+        return data
+    finally:
+        if token:
+            await _release_fill_lock(lookup.key, token)
+
+
+async def _refresh(lookup: CacheLookup, loader, expire_seconds: int, stale_seconds: int):
+    """Làm mới giá trị stale ở background với session DB riêng"""
+    ok, token = await _acquire_fill_lock(lookup.key)
+    if not token:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            data = await loader(db)
+        await cache_store(lookup, data, expire_seconds, stale_seconds)
+    except Exception as e:
+        print(f"[Cache Refresh Error]: {e}")
+    finally:
+        await _release_fill_lock(lookup.key, token)
+
+
+def _schedule_refresh(lookup: CacheLookup, loader, expire_seconds: int, stale_seconds: int):
+    if lookup.key in _refreshing:
+        return
+    task = asyncio.create_task(_refresh(lookup, loader, expire_seconds, stale_seconds))
+    _refreshing[lookup.key] = task
+    task.add_done_callback(lambda _: _refreshing.pop(lookup.key, None))
+
+
+async def cached_fetch(path: str, user_id: int, db, loader, expire_seconds: int = 180, stale_seconds: int = 0,
+                       version: Optional[str] = None):
+    """
+    Lấy dữ liệu qua cache với single-flight và stale-while-revalidate (nếu stale_seconds > 0).
+    `loader(db)` trả về JSON bytes (utils.serializer); khi làm mới nền nó nhận 1 AsyncSession mới.
+    version: version của ETag sẽ gửi kèm (xem get_etag_version), để body không cũ hơn ETag.
+    Trả về (data, source) với source: local / redis / stale / db / shared.
+    """
+    lookup = await cache_lookup(path, user_id, version)
+    if lookup.data is not None:
+        if lookup.stale:
+            _schedule_refresh(lookup, loader, expire_seconds, stale_seconds)
+            return lookup.data, "stale"
+        return lookup.data, lookup.source
+    if lookup.key is None:
+        # Redis không dùng được -> đọc thẳng DB
+        return await loader(db), "db"
+
+    pending = _inflight.get(lookup.key)
+    if pending is not None:
+        return await asyncio.shield(pending), "shared"
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[lookup.key] = future
+    try:
+        data = await _fill(lookup, db, loader, expire_seconds, stale_seconds)
+        future.set_result(data)
+        return data, lookup.source
+    except Exception as e:
+        future.set_exception(e)
+        # Tránh cảnh báo "exception was never retrieved" khi không có ai chờ
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(lookup.key, None)
+
+
+def _handle_invalidation(message):
+    try:
+        payload = json.loads(message["data"])
+        if payload.get("all"):
+            local_cache.clear()
+        else:
+            local_cache.invalidate(payload["ns"], int(payload["user"]))
+    except Exception as e:
+        print(f"[Local Cache] Invalid invalidation message: {e}")
+
+
+_invalidation_task: Optional[asyncio.Task] = None
+
+
+async def _listen_invalidations():
+    # Kết nối riêng không có socket_timeout vì pub/sub chờ tin nhắn vô thời hạn
+    client = aioredis.from_url(REDIS_URL)
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _handle_invalidation(message)
+        except asyncio.CancelledError:
+            await client.close()
+            raise
+        except Exception as e:
+            # Mất kết nối có thể làm lỡ tin invalidate -> bỏ dữ liệu cục bộ
+            print(f"[Local Cache] Pub/sub error: {e}")
+            local_cache.clear()
+            await asyncio.sleep(1)
+
+
+def start_invalidation_listener():
+    """Lắng nghe pub/sub để xóa cache cục bộ khi worker khác invalidate"""
+    global _invalidation_task
+    if _invalidation_task is None:
+        _invalidation_task = asyncio.create_task(_listen_invalidations())
+
+
+def stop_invalidation_listener():
+    global _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        _invalidation_task = None
+
+
+# Conditional GET: ETag = version dữ liệu (epoch.version) của namespace cho user.
+# Client gửi lại If-None-Match -> trả 304 chỉ với 1 lệnh MGET, không chạm DB hay cache body.
+def _etag_value(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+async def get_etag_version(path: str, user_id: int) -> Tuple[Optional[str], Optional[str]]:
+    """(version, ETag weak) cho dữ liệu của user ở namespace chứa path; (None, None) nếu Redis không dùng được"""
+    ok, version = await _redis_call(lambda: get_cache_version(get_namespace(path), user_id))
+    return (version, f'W/"{version}"') if ok else (None, None)
+
+
+async def get_etag(path: str, user_id: int) -> Optional[str]:
+    """ETag (weak) cho dữ liệu của user ở namespace chứa path; None nếu Redis không dùng được"""
+    return (await get_etag_version(path, user_id))[1]
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """So sánh yếu If-None-Match với ETag hiện tại"""
+    header = request.headers.get("if-none-match")
+    if not etag or not header:
+        return False
+    if header.strip() == "*":
+        return True
+    current = _etag_value(etag)
+    return any(_etag_value(tag) == current for tag in header.split(","))
+
+
+def _etag_headers(etag: Optional[str]) -> Optional[dict]:
+    # no-cache: trình duyệt vẫn giữ bản sao nhưng luôn hỏi lại server bằng If-None-Match
+    if not etag:
+        return None
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_etag_headers(etag))
+
+
+async def conditional_response(request: Request, path: str, user_id: int, load) -> Response:
+    """
+    Trả 304 nếu If-None-Match khớp version hiện tại, ngược lại gọi `load()` (trả JSON bytes)
+    và gắn ETag. ETag được đọc TRƯỚC khi lấy dữ liệu: nếu có ghi xen giữa, ETag chỉ cũ hơn
+    body (lần poll sau nhận 200), không bao giờ mới hơn.
+    `load` đọc qua cache thì dùng cached_conditional_response (cache phải khớp version của ETag).
+    """
+    etag = await get_etag(path, user_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return json_response(await load(), headers=_etag_headers(etag))
+
+
+async def cached_conditional_response(request: Request, path: str, user_id: int, db, loader,
+                                      expire_seconds: int = 180, stale_seconds: int = 0) -> Response:
+    """conditional_response + cached_fetch cho các list endpoint có cache body"""
+    version, etag = await get_etag_version(path, user_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    body, _ = await cached_fetch(path, user_id, db, loader, expire_seconds, stale_seconds, version=version)
+    return json_response(body, headers=_etag_headers(etag))
+
+
+def cache_response(model, expire_seconds: int = 180, stale_seconds: int = 0):
     """
     Decorator để cache response của FastAPI GET endpoint vào Redis.
     Nó yêu cầu `current_user` và `request` trong kwargs.
+    `model` là response model (vd: List[TaskResponse]); kết quả được serialize 1 lần
+    và trả thẳng JSON bytes khi hit.
+    stale_seconds > 0 cần kwarg `db: AsyncSession` (làm mới nền dùng session riêng).
     """
     def decorator(func):
         @functools.wraps(func)
@@ -27,54 +629,62 @@ def cache_response(expire_seconds: int = 180):
             if not request or not current_user:
                 return await func(*args, **kwargs)
 
-            cache_key = get_cache_key(request, current_user.id)
-            
-            try:
-                cached_data = redis_client.get(cache_key)
-                if cached_data:
-                    # Trả về JSON string đã cache
-                    return json.loads(cached_data)
-            except redis.RedisError as e:
-                print(f"[Redis Cache Error]: {e}")
-
-           
-            result = await func(*args, **kwargs)
-            
-            try:
-                if isinstance(result, list):
-                    json_data = []
-                    for item in result:
-                        if hasattr(item, 'dict'):
-                            json_data.append(item.dict())
-                        elif hasattr(item, '__dict__'):
-                            d = item.__dict__.copy()
-                            d.pop('_sa_instance_state', None)
-                            
-                            for k, v in d.items():
-                                if hasattr(v, 'isoformat'):
-                                    d[k] = v.isoformat()
-                            json_data.append(d)
-                        else:
-                            json_data.append(item)
-                    
-                    # Lưu vào Redis
-                    redis_client.setex(cache_key, expire_seconds, json.dumps(json_data))
-            except Exception as e:
-                print(f"[Redis Cache Serialize Error]: {e}")
-
-            return result
+            db = kwargs.get('db')
+
+            async def loader(session):
+                call_kwargs = kwargs if session is db else {**kwargs, 'db': session}
+                return serialize(model, await func(*args, **call_kwargs))
+
+            return await cached_conditional_response(
+                request, request.url.path, current_user.id, db, loader, expire_seconds, stale_seconds
+            )
         return wrapper
     return decorator
 
-def invalidate_cache(path_prefix: str, user_id: int):
+async def invalidate_cache(path_prefix: str, user_id: int):
     """
-    Xóa cache cho một path prefix cụ thể và user.
-    Ví dụ: invalidate_cache("/stms/tasks", user.id)
+    Vô hiệu cache của namespace chứa path prefix cho user (tăng version, O(1)).
+    Ví dụ: await invalidate_cache("/stms/tasks", user.id)
     """
-    try:
-        pattern = f"cache:{path_prefix}*:user:{user_id}"
-        keys = redis_client.keys(pattern)
-        if keys:
-            redis_client.delete(*keys)
-    except redis.RedisError as e:
-        print(f"[Redis Invalidate Error]: {e}")
+    await invalidate_cache_many(path_prefix, [user_id])
+
+
+async def invalidate_cache_many(path_prefix: str, user_ids):
+    """Như invalidate_cache cho nhiều user, gộp vào 1 pipeline (vd: thông báo gửi cả nhóm)"""
+    global _missed_invalidation
+    namespace = get_namespace(path_prefix)
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        local_cache.invalidate(namespace, user_id)
+
+    async def _invalidate():
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(get_version_key(namespace, user_id))
+            pipe.publish(INVALIDATE_CHANNEL, json.dumps({"ns": namespace, "user": user_id}))
+        await pipe.execute()
+
+    ok, _ = await _redis_call(_invalidate)
+    if not ok:
+        _missed_invalidation = True
+
+
+async def _bump_epoch() -> int:
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(EPOCH_KEY, int(time.time()), nx=True)
+    pipe.incr(EPOCH_KEY)
+    pipe.publish(INVALIDATE_CHANNEL, json.dumps({"all": True}))
+    _, epoch, _ = await pipe.execute()
+    return epoch
+
+
+async def invalidate_all_cache() -> Optional[int]:
+    """Vô hiệu toàn bộ cache (tăng epoch toàn cục). Trả về epoch mới, None nếu Redis lỗi."""
+    global _missed_invalidation
+    local_cache.clear()
+    ok, epoch = await _redis_call(_bump_epoch)
+    if not ok:
+        _missed_invalidation = True
+    return epoch
@@ -0,0 +1,136 @@
+"""
+Cấu hình server (server_config.json) giữ sẵn trong bộ nhớ.
+
+- Đọc: chỉ là tra dict; tối đa mỗi CONFIG_CHECK_INTERVAL giây mới stat file 1 lần
+  và đọc lại khi mtime thay đổi (sửa tay file cũng có hiệu lực).
+- Ghi (admin): ghi file rồi publish lên Redis để mọi worker áp dụng ngay.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Optional
+
+import redis.asyncio as aioredis
+
+from .cache import REDIS_URL, _redis_call, redis_client
+
+CONFIG_FILE = os.getenv("SERVER_CONFIG_FILE", "server_config.json")
+CONFIG_CHANNEL = "config:changed"
+CONFIG_CHECK_INTERVAL = float(os.getenv("CONFIG_CHECK_INTERVAL", "1.0"))
+
+DEFAULT_CONFIG = {
+    "smtp_host": "smtp.eduflow.io",
+    "smtp_port": "587",
+    "db_pool_size": "20",
+    "cache_ttl": "3600",
+    "max_upload_size": "50",
+    "maintenance_mode": False,
+    "auto_scan": True,
+}
+
+
+class ConfigService:
+    def __init__(self, path: str = CONFIG_FILE, check_interval: float = CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._config = dict(DEFAULT_CONFIG)
+        self._mtime: Optional[int] = None
+        self._next_check = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        mtime = self._file_mtime()
+        if mtime != self._mtime:
+            self._load(mtime)
+
+    def _load(self, mtime: Optional[int]):
+        config = dict(DEFAULT_CONFIG)
+        if mtime is not None:
+            try:
+                with open(self.path, "r") as f:
+                    config.update(json.load(f))
+            except Exception as e:
+                # File đang ghi dở / hỏng -> giữ cấu hình cũ, thử lại ở lần kiểm tra sau
+                print(f"[Config] Failed to read {self.path}: {e}")
+                return
+        self._config = config
+        self._mtime = mtime
+        self.reloads += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self._maybe_reload()
+        return self._config.get(key, default)
+
+    def all(self) -> dict:
+        self._maybe_reload()
+        return dict(self._config)
+
+    def _apply(self, config: dict):
+        self._config = {**DEFAULT_CONFIG, **config}
+        self.reloads += 1
+
+    def _write_file(self, config: dict) -> Optional[int]:
+        """Ghi file (atomic), trả về mtime mới"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, self.path)
+        return self._file_mtime()
+
+    async def save(self, config: dict):
+        """Ghi file, cập nhật bộ nhớ và báo cho các worker khác"""
+        # I/O file chạy trong thread, không chặn event loop
+        mtime = await asyncio.to_thread(self._write_file, config)
+        self._apply(config)
+        self._mtime = mtime
+        ok, _ = await _redis_call(lambda: redis_client.publish(CONFIG_CHANNEL, json.dumps(config)))
+        if not ok:
+            print("[Config] Redis unavailable, other workers will pick up the file change on their next check")
+
+    async def _listen(self):
+        # Kết nối riêng không có socket_timeout vì pub/sub chờ tin nhắn vô thời hạn
+        client = aioredis.from_url(REDIS_URL)
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(CONFIG_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        try:
+                            self._apply(json.loads(message["data"]))
+                        except Exception as e:
+                            print(f"[Config] Invalid config message: {e}")
+            except asyncio.CancelledError:
+                await client.close()
+                raise
+            except Exception as e:
+                print(f"[Config] Pub/sub error: {e}")
+                # Giữ cấu hình đang áp dụng (có thể đến từ pub/sub, node không dùng chung file),
+                # chỉ kết nối lại; file vẫn được đọc lại khi mtime đổi như bình thường
+                await asyncio.sleep(1)
+
+    def start(self):
+        """Lắng nghe thay đổi cấu hình từ worker khác"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+config_service = ConfigService()
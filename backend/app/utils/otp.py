@@ -0,0 +1,115 @@
+"""
+OTP lưu trong Redis thay vì cột users.otp_code.
+
+- Mỗi mã sống OTP_TTL_SECONDS (5 phút), sai quá OTP_MAX_ATTEMPTS lần thì mã bị hủy.
+- Giới hạn số lần gửi theo email và theo IP để burst đăng ký / quên mật khẩu
+  không chạm tới bảng users hay worker gửi mail.
+"""
+
+import os
+import secrets
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from .cache import _redis_call, redis_client
+
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "300"))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+# Giới hạn gửi: tối đa N lần trong cửa sổ OTP_SEND_WINDOW giây
+OTP_SEND_WINDOW = int(os.getenv("OTP_SEND_WINDOW", "600"))
+OTP_SEND_LIMIT_PER_EMAIL = int(os.getenv("OTP_SEND_LIMIT_PER_EMAIL", "3"))
+OTP_SEND_LIMIT_PER_IP = int(os.getenv("OTP_SEND_LIMIT_PER_IP", "20"))
+
+# Kết quả verify
+OTP_OK = 1
+OTP_INVALID = 0
+OTP_EXPIRED = -1
+OTP_TOO_MANY_ATTEMPTS = -2
+
+# Atomic: tăng số lần thử, so mã, xóa khi đúng hoặc khi vượt giới hạn
+_VERIFY_SCRIPT = """
+local code = redis.call('HGET', KEYS[1], 'code')
+if not code then
+    return -1
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return -2
+end
+return 0
+"""
+
+
+def _otp_key(purpose: str, identity: str) -> str:
+    return f"otp:{purpose}:{identity.lower()}"
+
+
+def _unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Không thể gửi mã xác thực lúc này, vui lòng thử lại sau.",
+    )
+
+
+async def _hit(key: str, limit: int) -> Optional[int]:
+    """Tăng bộ đếm cửa sổ cố định; trả về số giây cần chờ nếu vượt limit, None nếu còn được gửi"""
+    async def _incr():
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.set(key, 0, ex=OTP_SEND_WINDOW, nx=True)
+        pipe.incr(key)
+        pipe.ttl(key)
+        _, count, ttl = await pipe.execute()
+        return count, ttl
+
+    ok, result = await _redis_call(_incr)
+    if not ok:
+        raise _unavailable()
+    count, ttl = result
+    return max(int(ttl), 1) if count > limit else None
+
+
+async def check_send_rate(email: str, ip: Optional[str]):
+    """Gọi TRƯỚC khi query DB / gửi mail. Vượt giới hạn -> 429"""
+    retry_after = await _hit(f"otp:send:email:{email.lower()}", OTP_SEND_LIMIT_PER_EMAIL)
+    if retry_after is None and ip:
+        retry_after = await _hit(f"otp:send:ip:{ip}", OTP_SEND_LIMIT_PER_IP)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Bạn đã yêu cầu mã quá nhiều lần, vui lòng thử lại sau.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+async def issue_otp(purpose: str, identity: str) -> str:
+    """Tạo mã 6 số mới (ghi đè mã cũ) cho purpose ("verify" / "reset") và identity"""
+    code = f"{secrets.randbelow(10 ** 6):06d}"
+    key = _otp_key(purpose, identity)
+
+    async def _store():
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={"code": code, "attempts": 0})
+        pipe.expire(key, OTP_TTL_SECONDS)
+        await pipe.execute()
+
+    ok, _ = await _redis_call(_store)
+    if not ok:
+        raise _unavailable()
+    return code
+
+
+async def verify_otp(purpose: str, identity: str, code: str) -> int:
+    """Trả về OTP_OK / OTP_INVALID / OTP_EXPIRED / OTP_TOO_MANY_ATTEMPTS; mã đúng bị xóa ngay"""
+    ok, result = await _redis_call(
+        lambda: redis_client.eval(_VERIFY_SCRIPT, 1, _otp_key(purpose, identity), code, OTP_MAX_ATTEMPTS)
+    )
+    if not ok:
+        raise _unavailable()
+    return int(result)
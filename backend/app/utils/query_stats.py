@@ -0,0 +1,200 @@
+"""
+Đếm số câu SQL và tổng thời gian DB cho mỗi request (phát hiện N+1).
+
+- Sự kiện before/after_cursor_execute trên engine sync và async ghi vào QueryStats
+  của request hiện tại (contextvar; thread pool của endpoint sync cũng thấy vì
+  anyio copy context sang thread).
+- QueryStatsMiddleware (ASGI thuần) tạo QueryStats cho mỗi request HTTP, gộp số liệu
+  theo endpoint (query_metrics, xem /stms/admin/query-stats) và log endpoint vượt
+  QUERY_BUDGET kèm câu lệnh bị lặp nhiều nhất.
+- QUERY_STATS_HEADERS=1 (debug): thêm header X-DB-Query-Count / X-DB-Query-Time-Ms.
+- Test: `with assert_max_queries(3): client.get(...)`.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from ..database import async_engine, engine
+
+# Số câu SQL tối đa cho 1 request trước khi bị log cảnh báo
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "15"))
+# Cùng 1 câu lệnh (khác tham số) chạy >= N lần trong 1 request -> nghi N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+QUERY_STATS_HEADERS = os.getenv("QUERY_STATS_HEADERS", "0") == "1"
+
+
+class QueryStats:
+    """Số liệu SQL của 1 request (hoặc 1 khối assert_max_queries)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed_ms: float):
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.statements[statement] += 1
+
+    def most_repeated(self) -> Optional[tuple]:
+        """(câu lệnh, số lần) lặp nhiều nhất nếu vượt QUERY_REPEAT_THRESHOLD"""
+        if not self.statements:
+            return None
+        statement, times = self.statements.most_common(1)[0]
+        return (statement, times) if times >= QUERY_REPEAT_THRESHOLD else None
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+# Các khối assert_max_queries đang mở: nhận mọi câu lệnh, không phụ thuộc context
+# (TestClient chạy app ở thread khác nên contextvar của test không đi theo)
+_collectors: List[QueryStats] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    for collector in _collectors:
+        collector.record(statement, elapsed_ms)
+
+
+def _handle_error(exception_context):
+    # Câu lệnh lỗi không tới after_cursor_execute: bỏ mốc thời gian để stack không lệch
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(_engine, "handle_error", _handle_error)
+
+
+class QueryMetrics:
+    """Số liệu gộp theo endpoint của worker (chỉ cập nhật từ event loop)"""
+
+    def __init__(self):
+        self.endpoints: Dict[str, dict] = {}
+
+    def observe(self, endpoint: str, stats: QueryStats, over_budget: bool, repeated: bool):
+        entry = self.endpoints.get(endpoint)
+        if entry is None:
+            entry = self.endpoints[endpoint] = {
+                "requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "over_budget": 0, "n_plus_one": 0,
+            }
+        entry["requests"] += 1
+        entry["queries"] += stats.count
+        entry["max_queries"] = max(entry["max_queries"], stats.count)
+        entry["db_ms"] += stats.total_ms
+        entry["over_budget"] += int(over_budget)
+        entry["n_plus_one"] += int(repeated)
+
+    def snapshot(self) -> dict:
+        endpoints = []
+        for endpoint, entry in self.endpoints.items():
+            requests = entry["requests"] or 1
+            endpoints.append({
+                "endpoint": endpoint,
+                **entry,
+                "db_ms": round(entry["db_ms"], 1),
+                "avg_queries": round(entry["queries"] / requests, 2),
+                "avg_db_ms": round(entry["db_ms"] / requests, 2),
+            })
+        endpoints.sort(key=lambda item: item["avg_queries"], reverse=True)
+        return {"budget": QUERY_BUDGET, "repeat_threshold": QUERY_REPEAT_THRESHOLD, "endpoints": endpoints}
+
+    def reset(self):
+        self.endpoints.clear()
+
+
+query_metrics = QueryMetrics()
+
+
+def _shorten(statement: str, limit: int = 200) -> str:
+    """Gọn câu lệnh để log: bỏ danh sách cột, giữ FROM/WHERE"""
+    statement = re.sub(r"^SELECT .+? FROM ", "SELECT ... FROM ", " ".join(statement.split()))
+    return statement[:limit]
+
+
+def _endpoint_name(scope) -> str:
+    # Dùng path template của route ("/tasks/{task_id}") để số endpoint không tăng vô hạn
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "<unmatched>"
+    return f"{scope.get('method', 'GET')} {path}"
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware: gắn QueryStats cho mỗi request HTTP"""
+
+    def __init__(self, app, headers: bool = QUERY_STATS_HEADERS, budget: int = QUERY_BUDGET):
+        self.app = app
+        self.headers = headers
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if self.headers and message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-db-query-count", str(stats.count).encode()),
+                    (b"x-db-query-time-ms", f"{stats.total_ms:.1f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            if stats.count:
+                self._observe(scope, stats)
+
+    def _observe(self, scope, stats: QueryStats):
+        endpoint = _endpoint_name(scope)
+        over_budget = stats.count > self.budget
+        repeated = stats.most_repeated()
+        query_metrics.observe(endpoint, stats, over_budget, repeated is not None)
+        if over_budget:
+            detail = ""
+            if repeated:
+                detail = f"; repeated {repeated[1]}x: {_shorten(repeated[0])}"
+            print(f"[Query Budget] {endpoint}: {stats.count} queries, {stats.total_ms:.1f} ms (budget {self.budget}){detail}")
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Cho test: AssertionError nếu khối lệnh chạy quá `limit` câu SQL"""
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+    if stats.count > limit:
+        lines = "\n".join(f"  {times}x {_shorten(statement)}" for statement, times in stats.statements.most_common())
+        raise AssertionError(f"expected at most {limit} queries, got {stats.count}:\n{lines}")
@@ -0,0 +1,59 @@
+"""
+Số liệu khởi động của worker: thời gian import app và RSS.
+
+main.py gọi mark_import_start() trước mọi import nặng và mark_imported() sau khi
+đăng ký xong router; lifespan in ra một dòng tóm tắt, admin system-health trả về
+worker_stats() để theo dõi regression (module nặng lỡ bị import sớm trở lại).
+Báo cáo chi tiết theo từng module: scripts/startup_report.py.
+"""
+
+import os
+import time
+from typing import Optional
+
+_import_started: Optional[float] = None
+_import_seconds: Optional[float] = None
+_started_at = time.time()
+
+
+def mark_import_start():
+    global _import_started
+    _import_started = time.perf_counter()
+
+
+def mark_imported():
+    global _import_seconds
+    if _import_started is not None:
+        _import_seconds = time.perf_counter() - _import_started
+
+
+def rss_mb() -> float:
+    """RSS hiện tại của process (MB); /proc trên Linux, fallback sang getrusage (giá trị đỉnh)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    import sys
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS trả về byte, Linux trả về KB
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def worker_stats() -> dict:
+    return {
+        "pid": os.getpid(),
+        "import_seconds": round(_import_seconds, 3) if _import_seconds is not None else None,
+        "rss_mb": rss_mb(),
+        "uptime_seconds": round(time.time() - _started_at, 1),
+    }
+
+
+def startup_summary() -> str:
+    stats = worker_stats()
+    imported = f"{stats['import_seconds']:.2f}s" if stats["import_seconds"] is not None else "n/a"
+    return f"[Startup] worker pid={stats['pid']} imported app in {imported}, RSS {stats['rss_mb']} MB"
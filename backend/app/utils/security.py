@@ -1,3 +1,10 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -7,3 +14,78 @@ def verify_password(plain_password, hashed_password):
 
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+
+# bcrypt tốn ~100-300ms CPU mỗi lần: chạy trong thread pool riêng (bcrypt nhả GIL)
+# để event loop vẫn phục vụ WebSocket/API khác trong lúc có nhiều người đăng nhập.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Số việc tối đa đang chờ + đang chạy; vượt quá -> 503 thay vì để hàng đợi dài vô hạn
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self.pending = 0
+        self.running = 0
+        # running/thời gian được cập nhật từ các thread của pool
+        self._lock = threading.Lock()
+        self.stats = {"completed": 0, "rejected": 0, "max_pending": 0, "wait_ms_total": 0.0, "run_ms_total": 0.0}
+
+    def _timed(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.stats["wait_ms_total"] += (started - submitted) * 1000
+                self.stats["run_ms_total"] += (time.perf_counter() - started) * 1000
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Hệ thống đang bận, vui lòng thử lại sau giây lát.",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        self.stats["max_pending"] = max(self.stats["max_pending"], self.pending)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._timed, time.perf_counter(), fn, *args)
+        finally:
+            self.pending -= 1
+            self.stats["completed"] += 1
+
+    def snapshot(self) -> dict:
+        completed = self.stats["completed"] or 1
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "running": self.running,
+            "queued": max(0, self.pending - self.running),
+            "completed": self.stats["completed"],
+            "rejected": self.stats["rejected"],
+            "max_pending": self.stats["max_pending"],
+            "avg_wait_ms": round(self.stats["wait_ms_total"] / completed, 2),
+            "avg_run_ms": round(self.stats["run_ms_total"] / completed, 2),
+        }
+
+
+password_hasher = PasswordHasher()
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """Như verify_password nhưng không chặn event loop"""
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password) -> str:
+    """Như get_password_hash nhưng không chặn event loop"""
+    return await password_hasher.run(get_password_hash, password)
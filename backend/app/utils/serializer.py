@@ -0,0 +1,38 @@
+"""
+Serializer dùng chung cho cache: validate theo Pydantic response model rồi encode bằng orjson.
+Kết quả là JSON bytes giống hệt response FastAPI tạo ra, có thể trả thẳng cho client.
+"""
+
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any
+
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def serialize(model, data: Any) -> bytes:
+    """
+    ORM object / dict -> JSON bytes theo response model.
+    Ví dụ: serialize(List[TaskResponse], tasks)
+    """
+    adapter = _adapter(model)
+    validated = adapter.validate_python(data, from_attributes=True)
+    return orjson.dumps(adapter.dump_python(validated), default=_default)
+
+
+def json_response(body: bytes, headers: dict = None) -> Response:
+    """Trả JSON bytes đã serialize, bỏ qua bước validate response_model của FastAPI"""
+    return Response(content=body, media_type="application/json", headers=headers)
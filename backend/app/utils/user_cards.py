@@ -0,0 +1,158 @@
+"""
+Thẻ hiển thị user (tên, avatar, lớp, trường, cờ admin) cho các danh sách
+tin nhắn / bạn bè / tài liệu / thành viên.
+
+UserCardLoader gom user id của cả response rồi nạp 1 lần:
+  1. 1 pipeline Redis đọc các hash `user:card:{id}` (cache nóng, TTL USER_CARD_TTL)
+  2. id còn thiếu -> 1 query (users LEFT JOIN user_profiles) rồi ghi lại cache
+Dùng được với cả AsyncSession và Session sync. Đổi profile/avatar/role phải gọi
+invalidate_user_cards().
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.models import User, UserProfile, UserRole
+from .cache import _redis_call, redis_client
+
+USER_CARD_TTL = int(os.getenv("USER_CARD_TTL", "3600"))
+
+_CARD_FIELDS = ("username", "full_name", "avatar_url", "grade_level", "school_name")
+
+
+class UserCard(BaseModel):
+    id: int
+    username: str
+    full_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    grade_level: Optional[str] = None
+    school_name: Optional[str] = None
+    is_admin: bool = False
+
+    @property
+    def display_name(self) -> str:
+        return self.full_name or self.username
+
+
+def _card_key(user_id: int) -> str:
+    return f"user:card:{user_id}"
+
+
+def _to_hash(card: UserCard) -> dict:
+    # Trường None không ghi vào hash (HGETALL thiếu trường -> None)
+    mapping = {field: getattr(card, field) for field in _CARD_FIELDS if getattr(card, field) is not None}
+    mapping["is_admin"] = int(card.is_admin)
+    return mapping
+
+
+def _from_hash(user_id: int, values: dict) -> Optional[UserCard]:
+    if not values:
+        return None
+    data = {key.decode(): value.decode() for key, value in values.items()}
+    if "username" not in data:
+        return None
+    return UserCard(
+        id=user_id,
+        **{field: data.get(field) for field in _CARD_FIELDS},
+        is_admin=data.get("is_admin") == "1",
+    )
+
+
+async def _read_cached(user_ids: List[int]) -> Dict[int, UserCard]:
+    async def _read():
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(_card_key(user_id))
+        return await pipe.execute()
+
+    ok, rows = await _redis_call(_read)
+    if not ok:
+        return {}
+    cards = {}
+    for user_id, values in zip(user_ids, rows):
+        card = _from_hash(user_id, values)
+        if card is not None:
+            cards[user_id] = card
+    return cards
+
+
+async def _write_cached(cards: Iterable[UserCard]):
+    cards = list(cards)
+    if not cards:
+        return
+
+    async def _write():
+        pipe = redis_client.pipeline(transaction=False)
+        for card in cards:
+            key = _card_key(card.id)
+            pipe.delete(key)
+            pipe.hset(key, mapping=_to_hash(card))
+            pipe.expire(key, USER_CARD_TTL)
+        await pipe.execute()
+
+    await _redis_call(_write)
+
+
+def _cards_query(user_ids: List[int]):
+    return (
+        select(
+            User.id, User.username, User.full_name, User.avatar_url,
+            UserProfile.grade_level, UserProfile.school_name,
+            User.roles.any(UserRole.role.has(role_name="admin")).label("is_admin"),
+        )
+        .outerjoin(UserProfile, UserProfile.user_id == User.id)
+        .where(User.id.in_(user_ids))
+    )
+
+
+async def load_user_cards(db, user_ids: Iterable[int]) -> Dict[int, UserCard]:
+    """{user_id: UserCard}; id không tồn tại thì không có trong kết quả"""
+    ids = list(dict.fromkeys(uid for uid in user_ids if uid is not None))
+    if not ids:
+        return {}
+    cards = await _read_cached(ids)
+    missing = [uid for uid in ids if uid not in cards]
+    if missing:
+        stmt = _cards_query(missing)
+        rows = (await db.execute(stmt)).all() if isinstance(db, AsyncSession) else db.execute(stmt).all()
+        loaded = [UserCard(**row._mapping) for row in rows]
+        await _write_cached(loaded)
+        cards.update((card.id, card) for card in loaded)
+    return cards
+
+
+async def invalidate_user_cards(*user_ids: int):
+    """Gọi sau khi đổi tên/avatar/profile/role hoặc xóa tài khoản"""
+    if user_ids:
+        await _redis_call(lambda: redis_client.delete(*[_card_key(uid) for uid in user_ids]))
+
+
+class UserCardLoader:
+    """
+    Resolver theo request: add() các id cần, await load() một lần, rồi get(id).
+    Gọi load() thêm lần nữa chỉ nạp các id mới.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._pending: List[int] = []
+        self._cards: Dict[int, UserCard] = {}
+
+    def add(self, *user_ids: int) -> "UserCardLoader":
+        self._pending.extend(user_ids)
+        return self
+
+    async def load(self, user_ids: Iterable[int] = ()) -> Dict[int, UserCard]:
+        self._pending.extend(user_ids)
+        wanted = [uid for uid in self._pending if uid not in self._cards]
+        self._pending = []
+        if wanted:
+            self._cards.update(await load_user_cards(self.db, wanted))
+        return self._cards
+
+    def get(self, user_id: int) -> Optional[UserCard]:
+        return self._cards.get(user_id)
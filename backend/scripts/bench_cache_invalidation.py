@@ -0,0 +1,81 @@
+"""
+Benchmark độ trễ invalidate cache theo số key trong Redis.
+
+So sánh cách cũ (KEYS pattern + DEL) với bộ đếm version theo namespace
+(INCR) khi Redis chứa 10k / 100k / 1M key cache.
+
+CẢNH BÁO: script FLUSHDB database được chỉ định (mặc định db 15) trước và sau khi chạy.
+
+Chạy: cd backend && python scripts/bench_cache_invalidation.py [--url redis://localhost:6379/15]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = [10_000, 100_000, 1_000_000]
+KEYS_PER_USER = 4
+SAMPLES = 20
+
+
+async def legacy_invalidate(client, path_prefix: str, user_id: int):
+    keys = await client.keys(f"cache:{path_prefix}*:user:{user_id}*")
+    if keys:
+        await client.delete(*keys)
+
+
+async def fill(client, total: int, start: int):
+    paths = ["/stms/tasks", "/stms/tasks/groups", "/stms/schedules", "/stms/subjects"]
+    pipe = client.pipeline(transaction=False)
+    for i in range(start, total):
+        user_id = i // KEYS_PER_USER
+        pipe.setex(f"cache:{paths[i % KEYS_PER_USER]}:user:{user_id}:v0.0", 3600, "[]")
+        if i % 10_000 == 0:
+            await pipe.execute()
+    await pipe.execute()
+
+
+async def timed(fn, users: int) -> list:
+    result = []
+    for n in range(SAMPLES):
+        user_id = (n * 7919) % users
+        start = time.perf_counter()
+        await fn(user_id)
+        result.append((time.perf_counter() - start) * 1000)
+    return sorted(result)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="redis://localhost:6379/15")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES))
+    args = parser.parse_args()
+
+    os.environ["REDIS_URL"] = args.url
+    from app.utils import cache
+
+    client = cache.redis_client
+    await client.flushdb()
+    filled = 0
+    print(f"{'keys':>9}  {'legacy p50':>11} {'legacy max':>11}  {'version p50':>12} {'version max':>12}")
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            await fill(client, size, filled)
+            filled = size
+            users = size // KEYS_PER_USER
+            legacy = await timed(lambda uid: legacy_invalidate(client, "/stms/tasks", uid), users)
+            versioned = await timed(lambda uid: cache.invalidate_cache("/stms/tasks", uid), users)
+            print(
+                f"{size:>9}  {legacy[len(legacy) // 2]:>9.2f}ms {legacy[-1]:>9.2f}ms  "
+                f"{versioned[len(versioned) // 2]:>10.3f}ms {versioned[-1]:>10.3f}ms"
+            )
+    finally:
+        await client.flushdb()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
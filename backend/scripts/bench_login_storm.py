@@ -0,0 +1,102 @@
+"""
+Benchmark "login storm": độ trễ của endpoint khác trên cùng worker khi nhiều
+người đăng nhập cùng lúc.
+
+So sánh verify bcrypt chạy thẳng trong handler async (cách cũ) với
+PasswordHasher (thread pool riêng). Chạy in-process qua ASGI, không cần DB:
+một vòng probe gọi GET /ping liên tục trong lúc STORM request login chạy song song.
+
+Chạy: cd backend && python scripts/bench_login_storm.py [--logins 50] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from app.utils.security import get_password_hash, password_hasher, verify_password, verify_password_async  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+def build_app(password_hash: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login-inline")
+    async def login_inline():
+        return {"ok": verify_password("secret-password", password_hash)}
+
+    @app.post("/login")
+    async def login():
+        return {"ok": await verify_password_async("secret-password", password_hash)}
+
+    @app.get("/ping")
+    async def ping():
+        return {"pong": True}
+
+    return app
+
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def storm(client: httpx.AsyncClient, path: str, logins: int, concurrency: int) -> tuple:
+    latencies = []
+    done = asyncio.Event()
+
+    async def probe():
+        # Đo từ thời điểm probe LẼ RA được gửi: event loop bị chặn thì các probe trễ đều được tính
+        due = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            await client.get("/ping")
+            latencies.append((time.perf_counter() - due) * 1000)
+            due += PROBE_INTERVAL
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_login():
+        async with semaphore:
+            response = await client.post(path)
+            assert response.status_code == 200 and response.json()["ok"]
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    return elapsed, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    app = build_app(get_password_hash("secret-password"))
+    transport = httpx.ASGITransport(app=app)
+    print(f"logins={args.logins} concurrency={args.concurrency} hash_workers={password_hasher.workers} cpus={os.cpu_count()}")
+    print(f"  {'mode':<10} {'logins/s':>9}  {'ping p50':>9} {'ping p99':>9} {'ping max':>9}  probes")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, path in [("inline", "/login-inline"), ("executor", "/login")]:
+            elapsed, latencies = await storm(client, path, args.logins, args.concurrency)
+            print(
+                f"  {label:<10} {args.logins / elapsed:>9.1f}  {pct(latencies, 0.5):>7.2f}ms "
+                f"{pct(latencies, 0.99):>7.2f}ms {max(latencies):>7.2f}ms  {len(latencies)}"
+            )
+    print(f"  hasher: {password_hasher.snapshot()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
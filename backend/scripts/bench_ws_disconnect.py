@@ -0,0 +1,93 @@
+"""
+Micro-benchmark chi phí disconnect của ConnectionManager.
+
+Dựng 10k room và 50k user (mỗi user ở ROOMS_PER_USER room), rồi đo thời gian
+ngắt kết nối một loạt user: cách cũ (quét toàn bộ room_members) so với
+chỉ mục ngược user_rooms.
+
+Chạy: cd backend && python scripts/bench_ws_disconnect.py [--rooms 10000] [--users 50000]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.websocket import ConnectionManager  # noqa: E402
+
+ROOMS_PER_USER = 3
+
+
+class FakeWebSocket:
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+
+async def legacy_disconnect(manager: ConnectionManager, websocket, user_id: int):
+    """Cách cũ: duyệt mọi room trên worker cho mỗi lần disconnect"""
+    for conn in list(manager.active_connections.get(user_id, [])):
+        if conn.websocket is websocket:
+            await conn.close()
+            manager.active_connections[user_id].remove(conn)
+            manager.connection_count -= 1
+            if not manager.active_connections[user_id]:
+                del manager.active_connections[user_id]
+    for room_id in list(manager.room_members.keys()):
+        if user_id in manager.room_members[room_id]:
+            await manager.leave_room(room_id, user_id)
+
+
+async def build(rooms: int, users: int) -> tuple:
+    rng = random.Random(42)
+    manager = ConnectionManager()
+    sockets = {}
+    for uid in range(users):
+        ws = FakeWebSocket()
+        sockets[uid] = ws
+        await manager.connect(ws, uid)
+        for room in rng.sample(range(rooms), ROOMS_PER_USER):
+            await manager.join_room(f"room_{room}", uid)
+    return manager, sockets
+
+
+async def measure(label: str, rooms: int, users: int, sample: int, disconnect):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager, sockets = await build(rooms, users)
+        victims = random.Random(7).sample(range(users), sample)
+        start = time.perf_counter()
+        for uid in victims:
+            await disconnect(manager, sockets[uid], uid)
+        elapsed = time.perf_counter() - start
+        for conns in manager.active_connections.values():
+            for conn in conns:
+                await conn.close()
+    print(f"  {label:<8} {sample} disconnects in {elapsed * 1000:9.1f}ms  ({elapsed / sample * 1e6:8.1f}us each)")
+    assert not any(uid in members for uid in victims for members in manager.room_members.values())
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--sample", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"rooms={args.rooms} users={args.users} rooms_per_user={ROOMS_PER_USER}")
+    await measure("legacy", args.rooms, args.users, args.sample, legacy_disconnect)
+    await measure("indexed", args.rooms, args.users, args.sample, ConnectionManager.disconnect)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
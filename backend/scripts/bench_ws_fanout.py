@@ -0,0 +1,115 @@
+"""
+Benchmark độ trễ fan-out của ConnectionManager (broadcast_to_room).
+
+So sánh cách gửi cũ (await tuần tự từng user/tab) với hàng đợi riêng cho
+từng socket. Mỗi phòng có vài client "chậm" (mỗi lần gửi bị treo SLOW_DELAY
+giây), độ trễ được đo trên các client bình thường.
+
+Chạy: cd backend && python scripts/bench_ws_fanout.py [--messages 20] [--slow 1]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.websocket import ConnectionManager  # noqa: E402
+
+ROOM_SIZES = [50, 200, 1000]
+SLOW_DELAY = 0.25
+
+
+class FakeWebSocket:
+    def __init__(self, slow: bool, latencies: list):
+        self.slow = slow
+        self.latencies = latencies
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, message: str):
+        if self.slow:
+            await asyncio.sleep(SLOW_DELAY)
+            return
+        # Socket bình thường: chỉ nhường event loop (buffer kernel còn chỗ)
+        await asyncio.sleep(0)
+        sent_at = json.loads(message)["sent_at"]
+        self.latencies.append(time.perf_counter() - sent_at)
+
+
+async def legacy_broadcast(sockets: dict, data: dict):
+    """Cách gửi cũ: serialize mỗi user 1 lần, await tuần tự từng socket"""
+    for user_id, ws in sockets.items():
+        message = json.dumps(data, default=str)
+        await ws.send_text(message)
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(label: str, latencies: list):
+    ms = [v * 1000 for v in latencies]
+    print(
+        f"  {label:<7} p50={percentile(ms, 50):8.2f}ms  p95={percentile(ms, 95):8.2f}ms  "
+        f"p99={percentile(ms, 99):8.2f}ms  max={max(ms):8.2f}ms  (n={len(ms)})"
+    )
+
+
+async def run_legacy(size: int, messages: int, slow: int) -> list:
+    latencies = []
+    sockets = {uid: FakeWebSocket(uid < slow, latencies) for uid in range(size)}
+    for _ in range(messages):
+        await legacy_broadcast(sockets, {"type": "bench", "sent_at": time.perf_counter()})
+    return latencies
+
+
+async def run_queued(size: int, messages: int, slow: int) -> tuple:
+    latencies = []
+    manager = ConnectionManager()
+    for uid in range(size):
+        await manager.connect(FakeWebSocket(uid < slow, latencies), uid)
+        await manager.join_room("bench", uid)
+    expected = (size - slow) * messages
+    for _ in range(messages):
+        await manager.broadcast_to_room("bench", {"type": "bench", "sent_at": time.perf_counter()})
+        await asyncio.sleep(0.01)
+    while len(latencies) < expected:
+        await asyncio.sleep(0.01)
+    for conns in list(manager.active_connections.values()):
+        for conn in list(conns):
+            await manager._remove_connection(conn)
+    return latencies, manager.dropped_connections
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--slow", type=int, default=1, help="Số client chậm trong mỗi phòng")
+    args = parser.parse_args()
+
+    print(f"messages={args.messages} slow_clients={args.slow} slow_delay={SLOW_DELAY}s")
+    for size in ROOM_SIZES:
+        print(f"room size {size}:")
+        report("legacy", await run_legacy(size, args.messages, args.slow))
+        # Tắt log [WS] của manager trong lúc đo
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, dropped = await run_queued(size, args.messages, args.slow)
+        report("queued", latencies)
+        if dropped:
+            print(f"  dropped slow connections: {dropped}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,184 @@
+"""
+EXPLAIN các truy vấn nóng trên dữ liệu seed, fail nếu planner chọn Seq Scan.
+
+Tạo schema tạm (mặc định `explain_hot_queries`) trong DB của DATABASE_URL, tạo bảng
+bằng metadata của model (kèm các index trong __table_args__), seed dữ liệu bằng
+generate_series, ANALYZE rồi chạy EXPLAIN (FORMAT JSON) cho từng truy vấn giống hệt
+endpoint. Dữ liệu thật không bị đụng tới; schema tạm bị xóa khi xong (trừ khi --keep).
+
+Chỉ hỗ trợ PostgreSQL.
+
+Chạy: cd backend && python scripts/explain_hot_queries.py [--users 2000] [--keep]
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import and_, func, or_, select, text  # noqa: E402
+
+from app.database import Base, engine  # noqa: E402
+from app.models.models import (  # noqa: E402
+    DirectMessage, Notification, PomodoroSession, Schedule, StudyRoomMessage, SubjectChannelMessage, Task,
+)
+
+SCHEMA = "explain_hot_queries"
+
+# Seed bằng SQL thuần để vài trăm nghìn dòng chỉ mất vài giây; :users = số user
+SEED_SQL = [
+    """INSERT INTO users (id, username, email, password_hash, full_name, is_active, is_verified)
+       SELECT g, 'user' || g, 'user' || g || '@example.com', 'x', 'User ' || g, true, true
+       FROM generate_series(1, :users) g""",
+    """INSERT INTO tasks (user_id, created_by, title, status, priority, next_review_date, created_at)
+       SELECT 1 + g % :users, 1 + g % :users, 'Task ' || g,
+              (ARRAY['pending', 'in_progress', 'completed'])[1 + g % 3], 'medium',
+              CASE WHEN g % 5 = 0 THEN now() + (g % 30) * interval '1 day' END,
+              now() - (g % 365) * interval '1 day'
+       FROM generate_series(1, :users * 40) g""",
+    """INSERT INTO tasks (user_id, created_by, title, status, parent_task_id)
+       SELECT user_id, user_id, 'Subtask of ' || id, 'pending', id FROM tasks WHERE id % 10 = 0""",
+    """INSERT INTO schedules (user_id, created_by, title, start_time, end_time, status)
+       SELECT 1 + g % :users, 1 + g % :users, 'Schedule ' || g,
+              now() + (g % 120 - 60) * interval '1 day',
+              now() + (g % 120 - 60) * interval '1 day' + interval '1 hour', 'scheduled'
+       FROM generate_series(1, :users * 20) g""",
+    # Lịch AI gắn với task (schedules.task_id)
+    """UPDATE schedules SET task_id = id WHERE id % 4 = 0 AND id <= (SELECT max(id) FROM tasks)""",
+    """INSERT INTO notifications (user_id, notification_type, title, message, is_read, created_at)
+       SELECT 1 + g % :users, 'system', 'Notification ' || g, 'body', g % 4 <> 0,
+              now() - (g % 720) * interval '1 hour'
+       FROM generate_series(1, :users * 30) g""",
+    # Mỗi user nhắn với 5 người kế tiếp
+    """INSERT INTO direct_messages (sender_id, receiver_id, message, is_read, created_at)
+       SELECT 1 + g % :users, 1 + (g % :users + 1 + (g / :users) % 5) % :users, 'dm ' || g, g % 3 <> 0,
+              now() - (g % 1000) * interval '1 minute'
+       FROM generate_series(1, :users * 50) g""",
+    """INSERT INTO subject_channels (id, subject_name, creator_id, is_private, is_active, member_count)
+       SELECT g, 'Channel ' || g, 1 + g % :users, false, true, 0
+       FROM generate_series(1, greatest(:users / 20, 1)) g""",
+    """INSERT INTO subject_channel_messages (channel_id, user_id, message, created_at)
+       SELECT 1 + g % greatest(:users / 20, 1), 1 + g % :users, 'msg ' || g, now() - g * interval '1 second'
+       FROM generate_series(1, :users * 20) g""",
+    """INSERT INTO study_rooms (id, room_code, name, host_id, is_public, is_active)
+       SELECT g, 'R' || g, 'Room ' || g, 1 + g % :users, true, true
+       FROM generate_series(1, greatest(:users / 10, 1)) g""",
+    """INSERT INTO study_room_messages (room_id, user_id, message, created_at)
+       SELECT 1 + g % greatest(:users / 10, 1), 1 + g % :users, 'msg ' || g, now() - g * interval '1 second'
+       FROM generate_series(1, :users * 20) g""",
+    """INSERT INTO pomodoro_sessions (user_id, session_date, completed_pomodoros, total_focus_time)
+       SELECT 1 + g % :users, now() - (g % 90) * interval '1 day', 1 + g % 4, 25 * (1 + g % 4)
+       FROM generate_series(1, :users * 30) g""",
+]
+
+
+def hot_queries(users: int) -> list:
+    """(tên, statement) - giữ giống truy vấn trong các router"""
+    uid = users // 2
+    friend_id = uid + 1
+    now = datetime.now()
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("GET /stms/tasks", select(Task).where(Task.user_id == uid)),
+        ("tasks by status", select(Task).where(Task.user_id == uid, Task.status == "pending")),
+        ("tasks keyset page", select(Task).where(Task.user_id == uid, Task.id > uid * 10).order_by(Task.id).limit(51)),
+        ("tasks due for review", select(Task).where(Task.user_id == uid, Task.next_review_date <= now)),
+        ("subtasks of task", select(Task).where(Task.parent_task_id == 10)),
+        ("GET /stms/schedules", select(Schedule).where(Schedule.user_id == uid)),
+        ("schedules of task", select(Schedule.id).where(Schedule.user_id == uid, Schedule.task_id == uid * 40)),
+        ("upcoming schedules", select(Schedule).where(Schedule.user_id == uid, Schedule.start_time >= now).order_by(Schedule.start_time)),
+        ("GET /stms/notifications", select(Notification).where(Notification.user_id == uid).order_by(Notification.created_at.desc())),
+        ("unread notifications", select(Notification.id).where(Notification.user_id == uid, Notification.is_read == False)),  # noqa: E712
+        ("DM history", select(DirectMessage).where(
+            or_(
+                and_(DirectMessage.sender_id == uid, DirectMessage.receiver_id == friend_id),
+                and_(DirectMessage.sender_id == friend_id, DirectMessage.receiver_id == uid),
+            )
+        ).order_by(DirectMessage.created_at.desc()).limit(50)),
+        ("DM unread count", select(func.count(DirectMessage.id)).where(
+            DirectMessage.sender_id == friend_id, DirectMessage.receiver_id == uid, DirectMessage.is_read == False  # noqa: E712
+        )),
+        ("channel messages", select(SubjectChannelMessage).where(SubjectChannelMessage.channel_id == 1)
+            .order_by(SubjectChannelMessage.created_at.desc()).limit(50)),
+        ("room messages", select(StudyRoomMessage).where(StudyRoomMessage.room_id == 1)
+            .order_by(StudyRoomMessage.created_at.desc()).limit(50)),
+        ("pomodoro weekly stats", select(func.sum(PomodoroSession.completed_pomodoros))
+            .where(PomodoroSession.user_id == uid, PomodoroSession.session_date >= week_start)),
+        ("pomodoro total focus", select(func.sum(PomodoroSession.total_focus_time)).where(PomodoroSession.user_id == uid)),
+    ]
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(conn, stmt) -> dict:
+    compiled = stmt.compile(dialect=conn.dialect)
+    row = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    return row[0]["Plan"]
+
+
+def describe(plan: dict) -> str:
+    parts = []
+    for node in plan_nodes(plan):
+        label = node["Node Type"]
+        if node.get("Index Name"):
+            label += f" {node['Index Name']}"
+        elif node.get("Relation Name"):
+            label += f" on {node['Relation Name']}"
+        parts.append(label)
+    return " > ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000, help="số user seed (mỗi user ~40 task, 30 thông báo, 50 DM...)")
+    parser.add_argument("--schema", default=SCHEMA)
+    parser.add_argument("--keep", action="store_true", help="giữ lại schema tạm sau khi chạy")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        raise SystemExit(f"explain_hot_queries chỉ hỗ trợ PostgreSQL (đang dùng {engine.dialect.name})")
+
+    failures = []
+    with engine.connect() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA "{args.schema}"'))
+        conn.execute(text(f'SET search_path TO "{args.schema}"'))
+        conn.commit()
+        try:
+            Base.metadata.create_all(conn)
+            print(f"Seeding {args.users} users into schema {args.schema}...")
+            for statement in SEED_SQL:
+                conn.execute(text(statement), {"users": args.users})
+            conn.commit()
+            conn.execute(text("ANALYZE"))
+            conn.commit()
+
+            for name, stmt in hot_queries(args.users):
+                plan = explain(conn, stmt)
+                seq_scans = [node.get("Relation Name") for node in plan_nodes(plan) if node["Node Type"] == "Seq Scan"]
+                status = "SEQ SCAN" if seq_scans else "ok"
+                print(f"  {status:<8} {name:<26} cost={plan['Total Cost']:<10} {describe(plan)}")
+                if seq_scans:
+                    failures.append((name, seq_scans))
+        finally:
+            conn.rollback()
+            if not args.keep:
+                conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+                conn.commit()
+
+    if failures:
+        print(f"\n{len(failures)} hot queries fall back to a sequential scan:")
+        for name, tables in failures:
+            print(f"  - {name}: {', '.join(sorted(set(tables)))}")
+        sys.exit(1)
+    print("\nAll hot queries use an index.")
+
+
+if __name__ == "__main__":
+    main()
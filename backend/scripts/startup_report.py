@@ -0,0 +1,120 @@
+"""
+Báo cáo khởi động worker: thời gian import theo module và RSS sau khi import app.main.
+
+Chạy `python -X importtime -c "import app.main"` trong process con (cache module sạch),
+gộp thời gian cumulative theo package và in ra các module chậm nhất, kèm RSS.
+Dùng để theo dõi regression, ví dụ một module nặng (joblib/scikit-learn, httpx, psutil,
+PyPDF2...) lỡ bị import ở top-level trở lại.
+
+Chạy: cd backend && python scripts/startup_report.py [--top 15] [--budget-ms 1500] [--json]
+  --budget-ms: exit code 1 nếu tổng thời gian import vượt ngưỡng (dùng trong CI)
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Các module chỉ được nạp khi dùng tới; xuất hiện ở đây nghĩa là đã bị import sớm
+LAZY_MODULES = ["joblib", "sklearn", "numpy", "scipy", "httpx", "psutil", "PyPDF2", "docx", "openpyxl"]
+
+_CHILD = (
+    "import json, sys\n"
+    "import app.main\n"
+    "from app.utils.runtime import rss_mb, worker_stats\n"
+    "print(json.dumps({'rss_mb': rss_mb(), 'import_seconds': worker_stats()['import_seconds'],"
+    " 'modules': sorted(sys.modules)}))\n"
+)
+
+
+def run_child() -> tuple:
+    env = dict(os.environ)
+    env.setdefault("PYTHONDONTWRITEBYTECODE", "1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"import app.main failed (exit {proc.returncode})")
+    summary = json.loads(proc.stdout.strip().splitlines()[-1])
+    return parse_importtime(proc.stderr), summary
+
+
+def parse_importtime(output: str) -> list:
+    """Dòng dạng 'import time:  self [us] | cumulative | imported package' -> [(name, self_us, cum_us, depth)]"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return rows
+
+
+def by_package(rows: list) -> dict:
+    """Cumulative theo package gốc, chỉ tính lần import ở mức nông nhất để không cộng trùng"""
+    totals = {}
+    for name, _, cumulative_us, depth in rows:
+        package = name.split(".")[0]
+        if package == "app":
+            continue
+        current = totals.get(package)
+        if current is None or depth < current[1]:
+            totals[package] = (cumulative_us, depth)
+        elif depth == current[1]:
+            totals[package] = (current[0] + cumulative_us, depth)
+    return {package: value[0] for package, value in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = parser.parse_args()
+
+    rows, summary = run_child()
+    total_ms = sum(self_us for _, self_us, _, _ in rows) / 1000
+    app_modules = sorted(
+        ((name, cumulative_us / 1000) for name, _, cumulative_us, _ in rows if name == "app" or name.startswith("app.")),
+        key=lambda item: -item[1],
+    )[: args.top]
+    packages = sorted(((name, us / 1000) for name, us in by_package(rows).items()), key=lambda item: -item[1])[: args.top]
+    loaded_lazy = [name for name in LAZY_MODULES if name in summary["modules"]]
+
+    report = {
+        "total_import_ms": round(total_ms, 1),
+        "app_import_seconds": summary["import_seconds"],
+        "rss_mb": summary["rss_mb"],
+        "modules_loaded": len(summary["modules"]),
+        "eager_heavy_modules": loaded_lazy,
+        "top_app_modules_ms": {name: round(ms, 1) for name, ms in app_modules},
+        "top_packages_ms": {name: round(ms, 1) for name, ms in packages},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import app.main: {total_ms:.0f} ms total, {len(summary['modules'])} modules, RSS {summary['rss_mb']} MB")
+        print(f"\n  {'app module':<40} {'cumulative':>11}")
+        for name, ms in app_modules:
+            print(f"  {name:<40} {ms:>9.1f}ms")
+        print(f"\n  {'package':<40} {'cumulative':>11}")
+        for name, ms in packages:
+            print(f"  {name:<40} {ms:>9.1f}ms")
+        if loaded_lazy:
+            print(f"\nWARNING: heavy modules imported at startup: {', '.join(loaded_lazy)}")
+
+    if loaded_lazy or (args.budget_ms is not None and total_ms > args.budget_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Fixture chung: SQLite (aiosqlite cho AsyncSession) + fakeredis thay cho PostgreSQL/Redis.
+
+Biến môi trường và patch phải có trước khi import app (engine, redis client tạo lúc import).
+Chạy: cd backend && pip install -r requirements-dev.txt && python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+
+_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="eduflow-tests-"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_PATH}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_PATH}"
+os.environ["DB_AUTO_CREATE"] = "1"
+os.environ["PURGE_WORKER"] = "0"
+os.environ["PURGE_BATCH_PAUSE"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis
+import pytest
+import redis
+import redis.asyncio
+import sqlalchemy.ext.asyncio as sa_asyncio
+
+# SQLite không nhận tham số pool của PostgreSQL
+_create_async_engine = sa_asyncio.create_async_engine
+
+
+def _sqlite_async_engine(url, **kwargs):
+    for key in ("pool_size", "max_overflow", "pool_recycle"):
+        kwargs.pop(key, None)
+    return _create_async_engine(url, **kwargs)
+
+
+sa_asyncio.create_async_engine = _sqlite_async_engine
+
+fake_server = fakeredis.FakeServer()
+redis.from_url = lambda *args, **kwargs: fakeredis.FakeRedis(server=fake_server)
+redis.Redis.from_url = staticmethod(lambda *args, **kwargs: fakeredis.FakeRedis(server=fake_server))
+redis.asyncio.from_url = lambda *args, **kwargs: fakeredis.FakeAsyncRedis(
+    server=fake_server, decode_responses=kwargs.get("decode_responses", False)
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.models import Role, User  # noqa: E402
+from app.startup import DEFAULT_ROLES  # noqa: E402
+from app.utils.auth import create_access_token  # noqa: E402
+from app.utils.cache import local_cache  # noqa: E402
+
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(autouse=True)
+def _clean_state():
+    """Mỗi test bắt đầu với DB trống (chỉ có role mặc định) và Redis trống"""
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    fakeredis.FakeRedis(server=fake_server).flushall()
+    local_cache.clear()
+    with SessionLocal() as db:
+        db.add_all([Role(**role) for role in DEFAULT_ROLES])
+        db.commit()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    # 1 app (lifespan) cho cả phiên như 1 worker thật: task nền giữ hàng đợi gắn với event loop
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(db):
+    def _make(username: str, **fields) -> User:
+        user = User(username=username, email=f"{username}@example.com", password_hash="x", is_verified=True, **fields)
+        db.add(user)
+        db.commit()
+        return user
+    return _make
+
+
+@pytest.fixture
+def auth_headers():
+    def _headers(user: User) -> dict:
+        return {"Authorization": "Bearer " + create_access_token({"sub": user.username})}
+    return _headers
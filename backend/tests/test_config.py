@@ -0,0 +1,54 @@
+"""Cấu hình server (user-013): lỗi pub/sub không làm mất cấu hình đã nhận"""
+
+import asyncio
+import contextlib
+import json
+
+from app.utils import config as config_module
+from app.utils.config import ConfigService
+
+
+class _BrokenRedis:
+    """Mọi lần subscribe đều lỗi kết nối"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def pubsub(self, **kwargs):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+    async def close(self):
+        pass
+
+
+def test_listener_error_keeps_config_from_pubsub(client, tmp_path, monkeypatch):
+    path = tmp_path / "server_config.json"
+    path.write_text(json.dumps({"maintenance_mode": False}))
+    service = ConfigService(str(path), check_interval=0)
+    assert service.get("maintenance_mode") is False
+
+    # Admin trên node khác bật bảo trì: tin pub/sub đến, file cục bộ không đổi
+    service._apply({"maintenance_mode": True})
+    broken = _BrokenRedis()
+    monkeypatch.setattr(config_module.aioredis, "from_url", lambda *args, **kwargs: broken)
+
+    async def listen_until_reconnect():
+        task = asyncio.create_task(service._listen())
+        while broken.calls < 2:
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    client.portal.call(listen_until_reconnect)
+
+    assert service.get("maintenance_mode") is True
+
+
+def test_save_writes_file_and_applies(client, tmp_path):
+    path = tmp_path / "server_config.json"
+    service = ConfigService(str(path), check_interval=0)
+    client.portal.call(service.save, {"maintenance_mode": True})
+    assert json.loads(path.read_text()) == {"maintenance_mode": True}
+    assert service.get("maintenance_mode") is True
+    assert service.get("smtp_port") == "587"
@@ -0,0 +1,32 @@
+"""Thông báo chuông channel (user-005): mỗi người gửi trong cửa sổ đều được fan-out"""
+
+from app.models.models import Notification, SubjectChannel, SubjectChannelMember
+from app.notifier import ChannelNotifier
+
+
+def test_every_sender_in_a_window_is_notified(client, db, make_user):
+    alice, bob, carol = make_user("alice"), make_user("bob"), make_user("carol")
+    channel = SubjectChannel(subject_name="Math")
+    db.add(channel)
+    db.commit()
+    db.add_all([SubjectChannelMember(channel_id=channel.id, user_id=u.id) for u in (alice, bob, carol)])
+    db.commit()
+
+    notifier = ChannelNotifier(window_seconds=0)
+    notifier.submit(channel.id, alice.id, "alice", "hi")
+    notifier.submit(channel.id, alice.id, "alice", "anyone?")
+    notifier.submit(channel.id, bob.id, "bob", "hello")
+    first = notifier.queue.get_nowait()
+    events = notifier._collect(first)
+    assert [(e["sender_id"], e["content"]) for e in events] == [(alice.id, "hi"), (bob.id, "hello")]
+
+    async def notify():
+        for event in events:
+            await notifier._notify_channel(event)
+    client.portal.call(notify)
+
+    rows = db.query(Notification).all()
+    # Carol đã nhận tin của Alice nên tin của Bob bị dedupe; Alice nhận tin của Bob
+    assert sorted((n.user_id, n.sender_id) for n in rows) == sorted([
+        (bob.id, alice.id), (carol.id, alice.id), (alice.id, bob.id),
+    ])
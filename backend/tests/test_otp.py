@@ -0,0 +1,79 @@
+"""OTP trong Redis (user-016): giới hạn số lần nhập sai và số lần gửi"""
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.models import User
+from app.utils import otp
+from app.utils.otp import OTP_INVALID, OTP_OK, OTP_TOO_MANY_ATTEMPTS, issue_otp, verify_otp
+
+REGISTER = {"username": "newbie", "email": "newbie@example.com", "password": "Secret123!", "full_name": "New", "role": "student"}
+
+
+def _issued_code(client, username: str) -> str:
+    """Mã đang lưu trong Redis (thay cho email)"""
+    async def _read():
+        return await otp.redis_client.hget(otp._otp_key("verify", username), "code")
+    return client.portal.call(_read).decode()
+
+
+def test_wrong_attempts_burn_the_code(client, db):
+    assert client.post("/stms/auth/register", json=REGISTER).status_code == 200
+    code = _issued_code(client, "newbie")
+    wrong = "000000" if code != "000000" else "111111"
+
+    for _ in range(otp.OTP_MAX_ATTEMPTS - 1):
+        response = client.post("/stms/auth/verify-otp", json={"username": "newbie", "otp_code": wrong})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid OTP code"
+    # Lần sai cuối cùng hủy mã: kể cả mã đúng cũng không còn dùng được
+    response = client.post("/stms/auth/verify-otp", json={"username": "newbie", "otp_code": wrong})
+    assert response.status_code == 400
+    assert "quá nhiều lần" in response.json()["detail"]
+    assert client.post("/stms/auth/verify-otp", json={"username": "newbie", "otp_code": code}).status_code == 400
+
+    db.expire_all()
+    assert db.query(User).filter_by(username="newbie").one().is_verified is False
+
+
+def test_correct_code_verifies_once(client, db):
+    assert client.post("/stms/auth/register", json=REGISTER).status_code == 200
+    code = _issued_code(client, "newbie")
+    assert client.post("/stms/auth/verify-otp", json={"username": "newbie", "otp_code": code}).status_code == 200
+    # Mã đúng bị xóa ngay sau khi dùng
+    assert client.post("/stms/auth/verify-otp", json={"username": "newbie", "otp_code": code}).status_code == 400
+    db.expire_all()
+    assert db.query(User).filter_by(username="newbie").one().is_verified is True
+
+
+def test_verify_otp_counts_attempts(client):
+    async def scenario():
+        code = await issue_otp("reset", "someone@example.com")
+        wrong = "000000" if code != "000000" else "111111"
+        results = [await verify_otp("reset", "someone@example.com", wrong) for _ in range(otp.OTP_MAX_ATTEMPTS)]
+        return results, await verify_otp("reset", "someone@example.com", code)
+
+    results, final = client.portal.call(scenario)
+    assert results == [OTP_INVALID] * (otp.OTP_MAX_ATTEMPTS - 1) + [OTP_TOO_MANY_ATTEMPTS]
+    assert final != OTP_OK
+
+
+def test_send_rate_limit_per_email(client):
+    for _ in range(otp.OTP_SEND_LIMIT_PER_EMAIL):
+        client.portal.call(otp.check_send_rate, "limit@example.com", None)
+    with pytest.raises(HTTPException) as exc:
+        client.portal.call(otp.check_send_rate, "limit@example.com", None)
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) > 0
+
+
+def test_register_without_redis_leaves_no_account(client, db, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise otp._unavailable()
+
+    monkeypatch.setattr("app.api.auth.issue_otp", unavailable)
+    assert client.post("/stms/auth/register", json=REGISTER).status_code == 503
+    assert db.query(User).filter_by(username="newbie").count() == 0
+
+    monkeypatch.undo()
+    assert client.post("/stms/auth/register", json=REGISTER).status_code == 200
@@ -0,0 +1,157 @@
+"""Purge job (user-022): resume từ `step` đang dở sau khi worker chết hoặc lô bị lỗi"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import purge
+from app.models.models import Notification, PomodoroSession, PurgeJob, Resource, Schedule, User
+
+STEP_NAMES = [step.name for step in purge.USER_PLAN]
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(purge, "PURGE_BATCH_SIZE", 2)
+    monkeypatch.setattr(purge, "PURGE_BATCH_PAUSE", 0)
+    monkeypatch.setattr(purge, "PURGE_RETRY_SECONDS", 0)
+
+
+def _run_pending_jobs(client, worker: purge.PurgeWorker):
+    async def drain():
+        while (job_id := await worker._claim()) is not None:
+            await worker.run_job(job_id)
+    client.portal.call(drain)
+
+
+def _deleted_user(db, make_user):
+    user = make_user("leaving", is_active=False)
+    now = datetime.now()
+    db.add_all([
+        Schedule(user_id=user.id, created_by=user.id, title=f"block {i}", start_time=now, end_time=now)
+        for i in range(5)
+    ])
+    # Bước trước "tasks": worker cũ đã chạy qua, dữ liệu còn lại chứng tỏ không bị chạy lại
+    db.add(PomodoroSession(user_id=user.id, session_date=now))
+    db.commit()
+    return user.id
+
+
+def test_stale_running_job_resumes_from_its_step(client, db, make_user, small_batches):
+    user_id = _deleted_user(db, make_user)
+    step = STEP_NAMES.index("schedules")
+    # Worker cũ chết giữa chừng: job vẫn "running" nhưng heartbeat đã quá hạn
+    job = PurgeJob(
+        kind="user", target_id=user_id, status="running", step=step, attempts=1,
+        deleted_rows=7, progress=json.dumps({"tasks": 7}), locked_by="dead-worker",
+        heartbeat_at=datetime.now() - timedelta(seconds=purge.PURGE_STALE_SECONDS + 60),
+    )
+    db.add(job)
+    db.commit()
+
+    _run_pending_jobs(client, purge.PurgeWorker())
+
+    db.expire_all()
+    job = db.get(PurgeJob, job.id)
+    assert job.status == "done"
+    assert job.step == len(STEP_NAMES)
+    assert job.attempts == 2
+    progress = json.loads(job.progress)
+    assert progress["tasks"] == 7
+    assert progress["schedules"] == 5
+    assert job.deleted_rows == 7 + 5 + 1  # + dòng users
+    assert db.query(Schedule).count() == 0
+    assert db.get(User, user_id) is None
+    assert db.query(PomodoroSession).count() == 1
+
+
+def test_failed_batch_keeps_step_and_retries(client, db, make_user, small_batches, monkeypatch):
+    user_id = _deleted_user(db, make_user)
+    sender = make_user("sender")
+    db.add_all([
+        Notification(user_id=sender.id, sender_id=user_id, notification_type="direct_message", title="t", message="m")
+        for _ in range(3)
+    ])
+    db.commit()
+    step = STEP_NAMES.index("schedules")
+    schedules_step = purge.USER_PLAN[step]
+    real_run = schedules_step.run
+    calls = {"count": 0}
+
+    async def flaky_run(session, job, batch):
+        # Lô đầu xóa xong rồi lỗi ở lô thứ 2 (trước commit) -> lô 2 rollback
+        calls["count"] += 1
+        if calls["count"] == 2:
+            raise RuntimeError("connection lost")
+        return await real_run(session, job, batch)
+
+    monkeypatch.setattr(schedules_step, "run", flaky_run)
+    job = purge.enqueue_purge(db, "user", user_id, requested_by=user_id)
+    db.commit()
+    worker = purge.PurgeWorker()
+
+    async def run_once():
+        await worker.run_job(await worker._claim())
+    client.portal.call(run_once)
+
+    db.expire_all()
+    job = db.get(PurgeJob, job.id)
+    assert job.status == "pending"
+    assert job.step == step
+    assert "connection lost" in job.error
+    assert db.query(Schedule).count() == 3
+    # Các bước trước đã commit: người gửi thông báo đã được gỡ
+    assert db.query(Notification).filter(Notification.sender_id == user_id).count() == 0
+
+    _run_pending_jobs(client, worker)
+
+    db.expire_all()
+    job = db.get(PurgeJob, job.id)
+    assert job.status == "done"
+    assert json.loads(job.progress)["schedules"] == 5
+    assert db.query(Schedule).count() == 0
+    assert db.get(User, user_id) is None
+
+
+def test_resource_files_are_removed_only_after_the_batch_commits(client, db, make_user, small_batches, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    user_id = _deleted_user(db, make_user)
+    (tmp_path / "uploads" / "resources").mkdir(parents=True)
+    files = []
+    for i in range(3):
+        path = tmp_path / "uploads" / "resources" / f"{i}.pdf"
+        path.write_bytes(b"pdf")
+        files.append(path)
+        db.add(Resource(user_id=user_id, title=f"doc {i}", file_name=f"{i}.pdf", file_url=f"/uploads/resources/{i}.pdf"))
+    db.commit()
+    step = purge.USER_PLAN[STEP_NAMES.index("resources")]
+    real_run = step.run
+    calls = {"count": 0}
+
+    async def failing_run(session, job, batch):
+        # Lô đầu xóa dòng rồi lỗi trước commit -> rollback, file phải còn nguyên
+        calls["count"] += 1
+        count = await real_run(session, job, batch)
+        if calls["count"] == 1:
+            raise RuntimeError("commit failed")
+        return count
+
+    monkeypatch.setattr(step, "run", failing_run)
+    job = purge.enqueue_purge(db, "user", user_id, requested_by=user_id)
+    db.commit()
+    worker = purge.PurgeWorker()
+
+    async def run_once():
+        await worker.run_job(await worker._claim())
+    client.portal.call(run_once)
+
+    assert db.query(Resource).count() == 3
+    assert all(path.exists() for path in files)
+
+    _run_pending_jobs(client, worker)
+
+    db.expire_all()
+    assert db.get(PurgeJob, job.id).status == "done"
+    assert db.query(Resource).count() == 0
+    assert not any(path.exists() for path in files)
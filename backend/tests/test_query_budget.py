@@ -0,0 +1,45 @@
+"""Số câu SQL của các list endpoint dùng UserCardLoader (user-021) đo bằng assert_max_queries"""
+
+import pytest
+
+from app.models.models import SubjectChannel, SubjectChannelMessage, UserProfile
+from app.utils.query_stats import assert_max_queries
+
+
+def test_channel_messages_page_uses_two_queries(client, db, make_user):
+    users = [make_user(f"member{i}") for i in range(10)]
+    db.add_all([UserProfile(user_id=user.id, grade_level="12") for user in users])
+    channel = SubjectChannel(subject_name="Math", creator_id=users[0].id)
+    db.add(channel)
+    db.commit()
+    db.add_all([
+        SubjectChannelMessage(channel_id=channel.id, user_id=users[i % len(users)].id, message=f"msg {i}")
+        for i in range(50)
+    ])
+    db.commit()
+    url = f"/api/community/channels/{channel.id}/messages?limit=50"
+
+    # Lần đầu: 1 query tin nhắn + 1 query card cho mọi người gửi (không N+1)
+    with assert_max_queries(2):
+        response = client.get(url)
+    assert response.status_code == 200
+    messages = response.json()
+    assert len(messages) == 50
+    assert {m["username"] for m in messages} == {user.username for user in users}
+
+    # Card đã nằm trong Redis: chỉ còn query tin nhắn
+    with assert_max_queries(1):
+        assert client.get(url).status_code == 200
+
+
+def test_assert_max_queries_fails_over_budget(client, db, make_user):
+    user = make_user("solo")
+    channel = SubjectChannel(subject_name="Bio", creator_id=user.id)
+    db.add(channel)
+    db.commit()
+    db.add(SubjectChannelMessage(channel_id=channel.id, user_id=user.id, message="hi"))
+    db.commit()
+    # Trang chưa có card trong cache cần 2 câu (tin nhắn + card) -> vượt ngân sách 1
+    with pytest.raises(AssertionError):
+        with assert_max_queries(1):
+            client.get(f"/api/community/channels/{channel.id}/messages")
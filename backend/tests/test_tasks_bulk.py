@@ -0,0 +1,172 @@
+"""POST /stms/tasks/bulk (user-024): ref/parent_ref, atomic và non-atomic"""
+
+from app.models.models import Subject, Task
+
+URL = "/stms/tasks/bulk"
+
+
+def _task(db, user, title, **fields) -> Task:
+    task = Task(user_id=user.id, created_by=user.id, title=title, **fields)
+    db.add(task)
+    db.commit()
+    return task
+
+
+def test_creates_resolve_ref_and_parent_ref(client, db, make_user, auth_headers):
+    user = make_user("alice")
+    subject = Subject(user_id=user.id, subject_name="Math")
+    db.add(subject)
+    db.commit()
+    ops = [
+        {"op": "create", "ref": "essay", "task": {"title": "Essay", "subject_id": subject.id}},
+        {"op": "create", "ref": "outline", "parent_ref": "essay", "task": {"title": "Outline"}},
+        {"op": "create", "parent_ref": "outline", "task": {"title": "Collect sources"}},
+        {"op": "create", "parent_ref": "essay", "task": {"title": "Draft"}},
+    ]
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops})
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["ok"] for r in results] == [True] * 4
+    essay_id, outline_id, sources_id, draft_id = (r["id"] for r in results)
+    assert results[0]["ref"] == "essay"
+
+    db.expire_all()
+    assert db.get(Task, essay_id).parent_task_id is None
+    assert db.get(Task, essay_id).subject_id == subject.id
+    assert db.get(Task, outline_id).parent_task_id == essay_id
+    assert db.get(Task, sources_id).parent_task_id == outline_id
+    assert db.get(Task, draft_id).parent_task_id == essay_id
+    assert {t.user_id for t in db.query(Task).all()} == {user.id}
+
+
+def test_atomic_batch_applies_nothing_on_error(client, db, make_user, auth_headers):
+    user = make_user("alice")
+    other = make_user("bob")
+    mine = _task(db, user, "Mine")
+    theirs = _task(db, other, "Theirs")
+    ops = [
+        {"op": "create", "task": {"title": "New"}},
+        {"op": "update", "id": mine.id, "changes": {"status": "completed"}},
+        {"op": "delete", "id": theirs.id},
+        {"op": "create", "parent_ref": "missing", "task": {"title": "Orphan"}},
+    ]
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops})
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["message"] == "No operation applied"
+    assert [r["ok"] for r in detail["results"]] == [True, True, False, False]
+    assert detail["results"][2]["error"] == "Task not found"
+    assert detail["results"][3]["error"] == "Unknown parent_ref: missing"
+
+    db.expire_all()
+    assert db.query(Task).count() == 2
+    assert db.get(Task, mine.id).status == "pending"
+    assert db.get(Task, theirs.id) is not None
+
+
+def test_non_atomic_batch_skips_invalid_operations(client, db, make_user, auth_headers):
+    user = make_user("alice")
+    other = make_user("bob")
+    first = _task(db, user, "First")
+    second = _task(db, user, "Second")
+    reviewed = _task(db, user, "Flashcards", is_reviewable=True)
+    theirs = _task(db, other, "Theirs")
+    second_id = second.id
+    ops = [
+        {"op": "create", "ref": "p", "task": {"title": "Parent"}},
+        {"op": "create", "parent_ref": "p", "task": {"title": "Child"}},
+        {"op": "update", "id": first.id, "changes": {"title": None}},
+        {"op": "update", "id": first.id, "changes": {"parent_task_id": first.id}},
+        {"op": "update", "id": first.id, "changes": {"status": "completed"}},
+        {"op": "review", "id": reviewed.id, "quality": 9},
+        {"op": "delete", "id": theirs.id},
+        {"op": "delete", "id": second_id},
+    ]
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops, "atomic": False})
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["ok"] for r in results] == [True, True, False, False, True, False, False, True]
+    assert results[2]["error"] == "Field cannot be null: title"
+    assert results[3]["error"] == "Task cannot be its own parent"
+    assert results[5]["error"] == "Quality must be between 0 and 5"
+    assert results[6]["error"] == "Task not found"
+
+    db.expire_all()
+    parent = db.get(Task, results[0]["id"])
+    assert db.get(Task, results[1]["id"]).parent_task_id == parent.id
+    done = db.get(Task, first.id)
+    assert (done.title, done.status, done.completion_percentage) == ("First", "completed", 100)
+    assert done.parent_task_id is None
+    assert db.get(Task, second_id) is None
+    assert db.get(Task, theirs.id) is not None
+
+
+def test_non_atomic_child_of_skipped_create_is_reported(client, db, make_user, auth_headers):
+    user = make_user("alice")
+    ops = [
+        {"op": "create", "ref": "p", "task": {"title": "Parent", "subject_id": 999}},
+        {"op": "create", "parent_ref": "p", "task": {"title": "Child"}},
+    ]
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops, "atomic": False})
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0]["error"] == "Invalid subject ID"
+    assert results[1]["ok"] is False
+    assert results[1]["error"] == "Parent p was not created"
+    assert db.query(Task).count() == 0
+
+
+def test_items_under_a_parent_deleted_in_the_batch_are_rejected(client, db, make_user, auth_headers):
+    user = make_user("alice")
+    doomed = _task(db, user, "Doomed")
+    child = _task(db, user, "Child", parent_task_id=doomed.id)
+    moved = _task(db, user, "Moved", parent_task_id=doomed.id)
+    loose = _task(db, user, "Loose")
+    doomed_id, child_id, moved_id, loose_id = doomed.id, child.id, moved.id, loose.id
+    ops = [
+        {"op": "create", "task": {"title": "New", "parent_task_id": doomed_id}},
+        {"op": "update", "id": loose_id, "changes": {"parent_task_id": doomed_id}},
+        {"op": "update", "id": child_id, "changes": {"status": "completed"}},
+        {"op": "update", "id": moved_id, "changes": {"parent_task_id": None}},
+        {"op": "delete", "id": doomed_id},
+    ]
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops})
+    assert response.status_code == 400
+    results = response.json()["detail"]["results"]
+    assert [r["ok"] for r in results] == [False, False, False, True, True]
+    assert {r["error"] for r in results[:3]} == {"Parent task is deleted in the same batch"}
+
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops, "atomic": False})
+    assert [r["ok"] for r in response.json()] == [False, False, False, True, True]
+    db.expire_all()
+    assert db.get(Task, doomed_id) is None
+    assert db.get(Task, child_id) is None
+    assert db.get(Task, moved_id).parent_task_id is None
+    assert db.get(Task, loose_id).parent_task_id is None
+    assert db.query(Task).count() == 2
+
+
+def test_parent_cycles_are_rejected(client, db, make_user, auth_headers):
+    user = make_user("alice")
+    a = _task(db, user, "A")
+    b = _task(db, user, "B")
+    c = _task(db, user, "C")
+    d = _task(db, user, "D", parent_task_id=c.id)
+    e = _task(db, user, "E", parent_task_id=d.id)
+    ops = [
+        {"op": "update", "id": a.id, "changes": {"parent_task_id": b.id}},
+        {"op": "update", "id": b.id, "changes": {"parent_task_id": a.id}},
+        # C <- D <- E đã có trong DB: C dưới E thành vòng dù D không được gửi lên
+        {"op": "update", "id": c.id, "changes": {"parent_task_id": e.id}},
+    ]
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops})
+    assert response.status_code == 400
+    results = response.json()["detail"]["results"]
+    assert [r["ok"] for r in results] == [True, False, False]
+    assert {r["error"] for r in results[1:]} == {"Parent chain would form a cycle"}
+
+    response = client.post(URL, headers=auth_headers(user), json={"operations": ops, "atomic": False})
+    assert [r["ok"] for r in response.json()] == [True, False, False]
+    db.expire_all()
+    assert (db.get(Task, a.id).parent_task_id, db.get(Task, b.id).parent_task_id) == (b.id, None)
+    assert db.get(Task, c.id).parent_task_id is None